@@ -0,0 +1,88 @@
+{%- macro staging_event_keys(alias='b') -%}
+    {#- Columns every staging model takes from a raw.events row, so their event_id match -#}
+    {{ alias }}.event_id    AS producer_event_id,
+        {{ alias }}.user_id,
+        {{ alias }}.source_file_name,
+        {{ alias }}.loaded_at,
+        {{ alias }}.content_id,
+        {{ alias }}."timestamp" AS created_date_time
+{%- endmacro -%}
+
+
+{%- macro staging_event_id() -%}
+    {#- The id the producer stamps since schema v2; events written before it get a hash of their fields.
+        pg_loader.py fills in that hash from the raw timestamp, so on Postgres producer_event_id is always set -#}
+    coalesce(nullif(producer_event_id, ''), {{ compute_hash(["user_id", "content_id", "created_date_time"]) }})
+{%- endmacro -%}
+
+
+{%- macro staging_new_rows(alias='b') -%}
+    {#- Incremental runs only read rows loaded after the newest loaded_at already in the model -#}
+    {%- if is_incremental() %}
+    WHERE {{ alias }}.loaded_at > (
+        SELECT coalesce(max(loaded_at), '-infinity'::timestamptz) - interval '{{ var("staging_lookback", "0 seconds") }}'
+        FROM {{ this }}
+    )
+    {%- endif -%}
+{%- endmacro -%}
+
+
+{%- macro parquet_events() -%}
+    {#- The consumer's Parquet files, read in place by DuckDB; the globs are relative to the directory dbt runs in.
+        compact_parquet.py publishes a merged file before it removes the files it replaces, so the files
+        a merged file's sidecar lists under sources are left out once the merged file is read too -#}
+    {%- set parquet_glob = var("parquet_glob", "../../parquet_data/data/**/*.parquet") -%}
+    {%- set sidecar_glob = var("sidecar_glob", parquet_glob | replace("*.parquet", "_*.parquet.json")) -%}
+    (
+        SELECT * FROM {{ parquet_files(parquet_glob) }}
+        {%- if parquet_sidecars_exist(sidecar_glob) %}
+        WHERE filename NOT IN (
+            SELECT regexp_replace(sidecar.filename, '[^/]*$', '') || unnest(sidecar.sources)
+            FROM read_json('{{ sidecar_glob }}', filename = true, columns = {sources: 'VARCHAR[]'}) AS sidecar
+            WHERE regexp_replace(sidecar.filename, '/_([^/]*)\.json$', '/\1') IN (
+                SELECT DISTINCT filename FROM {{ parquet_files(parquet_glob) }}
+            )
+        )
+        {%- endif %}
+    )
+{%- endmacro -%}
+
+
+{%- macro parquet_files(parquet_glob) -%}
+    read_parquet(
+        '{{ parquet_glob }}',
+        filename = true,
+        union_by_name = true,
+        hive_partitioning = false
+    )
+{%- endmacro -%}
+
+
+{%- macro parquet_sidecars_exist(sidecar_glob) -%}
+    {#- read_json fails on a glob without matches; trees written before the manifest have no sidecars -#}
+    {%- set found = [] -%}
+    {%- if execute -%}
+        {%- set found = run_query("SELECT file FROM glob('" ~ sidecar_glob ~ "') LIMIT 1").columns[0].values() -%}
+    {%- endif -%}
+    {{- return(found | length > 0) -}}
+{%- endmacro -%}
+
+
+{%- macro parquet_event_keys() -%}
+    {#- The staging_event_keys() of the DuckDB models, so both targets compute the same event_id -#}
+    {{ parquet_event_id_column() }} AS producer_event_id,
+        user_id,
+        parse_filename(filename) AS source_file_name,
+        "content.id"             AS content_id,
+        "timestamp"              AS created_date_time
+{%- endmacro -%}
+
+
+{%- macro parquet_event_id_column() -%}
+    {#- event_id only exists in files written with schema v2 or later; read_parquet fails on a missing column -#}
+    {%- set columns = [] -%}
+    {%- if execute -%}
+        {%- set columns = run_query("DESCRIBE SELECT * FROM " ~ parquet_events() ~ " LIMIT 0").columns[0].values() -%}
+    {%- endif -%}
+    {{ 'event_id' if 'event_id' in columns else 'CAST(NULL AS VARCHAR)' }}
+{%- endmacro -%}
@@ -0,0 +1,42 @@
+{{config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='source_file_name',
+    on_schema_change='append_new_columns',
+    file_format='parquet',
+    partition_by=['inserted_date_time'],
+    schema="staging",
+    post_hook=[
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_source_file_name_idx ON {{ this }} (source_file_name)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_loaded_at_idx ON {{ this }} (loaded_at)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_event_id_idx ON {{ this }} (event_id)"
+    ]
+)}}
+
+/*
+    One row per element of an event's recommendations array, keyed by event_id and element_position,
+    the 1-based position of the element in the array. Events without any have no rows.
+    Incremental like stg_event_details.
+*/
+
+WITH cte AS (
+
+    SELECT
+        {{ staging_event_keys('b') }},
+        user_recommendations.position AS element_position,
+
+        user_recommendations.value->>'clicked'    AS user_recommendations_clicked,
+        user_recommendations.value->>'position'   AS user_recommendations_position,
+        user_recommendations.value->>'algorithm'  AS user_recommendations_algorithm,
+        user_recommendations.value->>'content_id' AS user_recommendations_content_id
+
+    FROM {{ source('raw', 'events') }} AS b
+    CROSS JOIN LATERAL jsonb_array_elements(b.recommendations) WITH ORDINALITY AS user_recommendations(value, position)
+    {{- staging_new_rows('b') }}
+)
+
+SELECT
+    *,
+    {{ staging_event_id() }} AS event_id,
+    CURRENT_date AS inserted_date_time
+FROM cte
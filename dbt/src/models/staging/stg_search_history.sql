@@ -0,0 +1,42 @@
+{{config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='source_file_name',
+    on_schema_change='append_new_columns',
+    file_format='parquet',
+    partition_by=['inserted_date_time'],
+    schema="staging",
+    post_hook=[
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_source_file_name_idx ON {{ this }} (source_file_name)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_loaded_at_idx ON {{ this }} (loaded_at)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_event_id_idx ON {{ this }} (event_id)"
+    ]
+)}}
+
+/*
+    One row per element of an event's search_history array, keyed by event_id and element_position,
+    the 1-based position of the element in the array. Events without any have no rows.
+    Incremental like stg_event_details.
+*/
+
+WITH cte AS (
+
+    SELECT
+        {{ staging_event_keys('b') }},
+        user_search_history.position AS element_position,
+
+        user_search_history.value->>'query'         AS user_search_history_query,
+        user_search_history.value->>'search_id'     AS user_search_id,
+        user_search_history.value->>'timestamp'     AS user_search_history_timestamp,
+        user_search_history.value->>'results_count' AS user_search_history_results_count
+
+    FROM {{ source('raw', 'events') }} AS b
+    CROSS JOIN LATERAL jsonb_array_elements(b.search_history) WITH ORDINALITY AS user_search_history(value, position)
+    {{- staging_new_rows('b') }}
+)
+
+SELECT
+    *,
+    {{ staging_event_id() }} AS event_id,
+    CURRENT_date AS inserted_date_time
+FROM cte
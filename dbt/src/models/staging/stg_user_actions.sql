@@ -0,0 +1,46 @@
+{{config(
+    materialized='incremental',
+    incremental_strategy='delete+insert',
+    unique_key='source_file_name',
+    on_schema_change='append_new_columns',
+    file_format='parquet',
+    partition_by=['inserted_date_time'],
+    schema="staging",
+    post_hook=[
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_source_file_name_idx ON {{ this }} (source_file_name)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_loaded_at_idx ON {{ this }} (loaded_at)",
+        "CREATE INDEX IF NOT EXISTS {{ this.name }}_event_id_idx ON {{ this }} (event_id)"
+    ]
+)}}
+
+/*
+    One row per element of an event's user_action array, keyed by event_id and element_position,
+    the 1-based position of the element in the array. Events without any have no rows.
+    Incremental like stg_event_details.
+*/
+
+WITH cte AS (
+
+    SELECT
+        {{ staging_event_keys('b') }},
+        user_action.position AS element_position,
+
+        user_action.value->>'duration'    AS user_action_duration,
+        user_action.value->>'completed'   AS user_action_completed,
+        user_action.value->>'new_speed'   AS user_action_new_speed,
+        user_action.value->>'old_speed'   AS user_action_old_speed,
+        user_action.value->>'action_type' AS user_action_type,
+        user_action.value->>'timestamp'   AS user_action_timestamp,
+        user_action.value->>'new_quality' AS user_action_new_quality,
+        user_action.value->>'old_quality' AS user_action_old_quality
+
+    FROM {{ source('raw', 'events') }} AS b
+    CROSS JOIN LATERAL jsonb_array_elements(b.user_action) WITH ORDINALITY AS user_action(value, position)
+    {{- staging_new_rows('b') }}
+)
+
+SELECT
+    *,
+    {{ staging_event_id() }} AS event_id,
+    CURRENT_date AS inserted_date_time
+FROM cte
@@ -0,0 +1,70 @@
+{{config(
+    materialized='view',
+    alias='stg_event_details',
+    schema="staging"
+)}}
+
+/*
+    DuckDB counterpart of stg_event_details, reading the Parquet files directly. As a view
+    over read_parquet, a query only reads the columns it uses and skips row groups whose
+    min/max statistics rule out its filters on columns read as stored, e.g. event_type or
+    user_id. created_at is computed by try_strptime, so a filter on it reads every row group;
+    the raw timestamps are not zero padded either, so their string statistics cannot stand in.
+    Narrow by time through the files instead, with the parquet_glob var on a partitioned
+    consumer's event_date=... directories.
+*/
+
+WITH cte AS (
+
+    SELECT
+        {{ parquet_event_keys() }},
+        /* ---------------------- CONTENT ---------------------- */
+        "content.type"                    AS content_type,
+        "content.title"                   AS content_title,
+        "content.genre"                   AS content_genre,
+        CAST("content.season" AS INTEGER)       AS content_season,
+        CAST("content.episode" AS INTEGER)      AS content_episode,
+        CAST("content.duration" AS INTEGER)     AS content_duration,
+        "content.language"                AS content_language,
+        "content.provider"                AS content_provider,
+        CAST("content.release_year" AS INTEGER) AS content_release_year,
+
+        /* ---------------------- EVENT ------------------------ */
+        try_strptime("timestamp", '%Y-%m-%dT%H:%M:%S')           AS created_at,
+        event_type,
+        CAST("event_details.paused" AS BOOLEAN)                 AS event_details_paused,
+        "event_details.bandwidth"                               AS event_details_bandwidth,
+        CAST("event_details.completed" AS BOOLEAN)              AS event_details_completed,
+        "event_details.network_type"                            AS event_details_network_type,
+        CAST("event_details.play_duration" AS INTEGER)          AS event_details_play_duration,
+        CAST("event_details.playback_speed" AS DOUBLE)          AS event_details_playback_speed,
+        CAST("event_details.play_percentage" AS DOUBLE)         AS event_details_play_percentage,
+        "event_details.playback_quality"                        AS event_details_playback_quality,
+        CAST("event_details.buffering_incidents" AS INTEGER)    AS event_details_buffering_incidents,
+
+        /* ---------------------- DEVICE ----------------------- */
+        "device.os"            AS device_operating_system,
+        "device.type"          AS device_type,
+        "device.model"         AS device_model,
+        "device.os_version"    AS device_os_version,
+        "device.app_version"   AS device_app_version,
+
+        /* ---------------------- LOCATION --------------------- */
+        "location.city"        AS location_city,
+        "location.region"      AS location_region,
+        "location.country"     AS location_country,
+        "location.timezone"    AS location_timezone,
+
+        /* ---------------------- USER SUBSCRIPTION ------------ */
+        "user_subscription.plan"                                   AS user_subscription_plan,
+        CAST(try_strptime("user_subscription.start_date", '%Y-%m-%d') AS DATE) AS user_subscription_start_date,
+        "user_subscription.billing_cycle"                          AS user_subscription_billing_cycle,
+        "user_subscription.connected_services"                     AS user_subscription_connected_services
+
+    FROM {{ parquet_events() }}
+)
+
+SELECT
+    *,
+    {{ staging_event_id() }} AS event_id
+FROM cte
@@ -0,0 +1,31 @@
+{{config(
+    materialized='view',
+    alias='stg_recommendations',
+    schema="staging"
+)}}
+
+/*
+    DuckDB counterpart of stg_recommendations: one row per element of an event's recommendations list,
+    keyed by event_id and element_position (1-based), read straight from the Parquet files.
+*/
+
+WITH elements AS (
+
+    SELECT
+        {{ parquet_event_keys() }},
+        -- two unnests in one SELECT are zipped, pairing each element with its position
+        unnest(range(1, len(recommendations) + 1)) AS element_position,
+        unnest(recommendations)                    AS element
+    FROM {{ parquet_events() }}
+)
+
+SELECT
+    * EXCLUDE (element),
+    {{ staging_event_id() }} AS event_id,
+
+    CAST(element.clicked AS BOOLEAN)  AS user_recommendations_clicked,
+    CAST(element.position AS INTEGER) AS user_recommendations_position,
+    element.algorithm                 AS user_recommendations_algorithm,
+    element.content_id                AS user_recommendations_content_id
+
+FROM elements
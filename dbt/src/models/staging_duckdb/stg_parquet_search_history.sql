@@ -0,0 +1,31 @@
+{{config(
+    materialized='view',
+    alias='stg_search_history',
+    schema="staging"
+)}}
+
+/*
+    DuckDB counterpart of stg_search_history: one row per element of an event's search_history list,
+    keyed by event_id and element_position (1-based), read straight from the Parquet files.
+*/
+
+WITH elements AS (
+
+    SELECT
+        {{ parquet_event_keys() }},
+        -- two unnests in one SELECT are zipped, pairing each element with its position
+        unnest(range(1, len(search_history) + 1)) AS element_position,
+        unnest(search_history)                    AS element
+    FROM {{ parquet_events() }}
+)
+
+SELECT
+    * EXCLUDE (element),
+    {{ staging_event_id() }} AS event_id,
+
+    element.query                          AS user_search_history_query,
+    element.search_id                      AS user_search_id,
+    element."timestamp"                    AS user_search_history_timestamp,
+    CAST(element.results_count AS INTEGER) AS user_search_history_results_count
+
+FROM elements
@@ -0,0 +1,35 @@
+{{config(
+    materialized='view',
+    alias='stg_user_actions',
+    schema="staging"
+)}}
+
+/*
+    DuckDB counterpart of stg_user_actions: one row per element of an event's user_action list,
+    keyed by event_id and element_position (1-based), read straight from the Parquet files.
+*/
+
+WITH elements AS (
+
+    SELECT
+        {{ parquet_event_keys() }},
+        -- two unnests in one SELECT are zipped, pairing each element with its position
+        unnest(range(1, len(user_action) + 1)) AS element_position,
+        unnest(user_action)                    AS element
+    FROM {{ parquet_events() }}
+)
+
+SELECT
+    * EXCLUDE (element),
+    {{ staging_event_id() }} AS event_id,
+
+    CAST(element.duration AS INTEGER)  AS user_action_duration,
+    CAST(element.completed AS BOOLEAN) AS user_action_completed,
+    CAST(element.new_speed AS DOUBLE)  AS user_action_new_speed,
+    CAST(element.old_speed AS DOUBLE)  AS user_action_old_speed,
+    element.action_type                AS user_action_type,
+    element."timestamp"                AS user_action_timestamp,
+    element.new_quality                AS user_action_new_quality,
+    element.old_quality                AS user_action_old_quality
+
+FROM elements
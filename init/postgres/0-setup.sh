@@ -4,24 +4,17 @@ set -e
 # source .env if you really want to double-ensure it’s loaded
 # set -a; [ -f /docker-entrypoint-initdb.d/.env ] && source /docker-entrypoint-initdb.d/.env; set +a
 
-PARQUET_FILE="/opt/parquet/*.parquet"
-JSON_FILE="/tmp/data.json"
-TARGET_TABLE="all_data"
+# pg_loader.py walks the directory, event_date=YYYY-MM-DD/event_type=.../ directories of a
+# partitioned consumer included. Set PARQUET_DIR to load only some partitions, e.g.
+# "/opt/parquet/event_date=2024-03-07"
+PARQUET_DIR="${PARQUET_DIR:-/opt/parquet}"
+TARGET_SCHEMA="raw"
+TARGET_TABLE="events"
 
-echo "→ Converting Parquet to JSON via DuckDB..."
-duckdb -c "COPY (SELECT *, filename as file_name FROM read_parquet('${PARQUET_FILE}', filename=true)) TO '${JSON_FILE}' (FORMAT JSON);"
+echo "→ Loading Parquet files into ${TARGET_SCHEMA}.${TARGET_TABLE} with pg_loader.py..."
+# init scripts run against a server that only listens on its unix socket
+PG_DSN="host=/var/run/postgresql dbname=${POSTGRES_DB} user=${POSTGRES_USER}" \
+  /opt/venv/bin/python /opt/pipeline/src/consumer/pg_loader.py "${PARQUET_DIR}" \
+  --schema "${TARGET_SCHEMA}" --table "${TARGET_TABLE}"
 
-echo "→ Preparing Postgres schema..."
-psql -v ON_ERROR_STOP=1 \
-  --username "$POSTGRES_USER" \
-  --dbname "$POSTGRES_DB" \
-  --password <<-EOSQL
-
-  CREATE TABLE IF NOT EXISTS ${TARGET_TABLE} (
-    data JSONB
-  );
-  COPY ${TARGET_TABLE}(data) FROM '${JSON_FILE}';
-
-EOSQL
-
-echo "→ Loaded all rows into table '${TARGET_TABLE}' as one JSONB value."
+echo "→ Loaded the Parquet files into '${TARGET_SCHEMA}.${TARGET_TABLE}', one typed column per field."
@@ -0,0 +1,106 @@
+import argparse
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('consumer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+import pandas as pd
+import pyarrow
+from fastavro import parse_schema, schemaless_writer
+
+import CustomerEvents as c
+from arrow_decoder import ArrowBatchDecoder
+from avro_decoder import AvroDecoder
+
+
+SCHEMA_PATH = Path(__file__).parent.parent.joinpath('producer', 'Schema', 'v1.avsc')
+SCHEMA_ID = 1
+
+
+class LocalSchemaRegistry:
+    """
+    Serves the local schema file for every id, so the benchmark runs offline.
+    """
+
+    class RegisteredSchema:
+        def __init__(self, schema_str):
+            self.schema_str = schema_str
+
+    def __init__(self, schema_str):
+        self.schema = LocalSchemaRegistry.RegisteredSchema(schema_str)
+
+    def get_schema(self, schema_id):
+        return self.schema
+
+
+def encode_events(events, schema):
+    payloads = []
+    for event in events:
+        buffer = io.BytesIO()
+        buffer.write(AvroDecoder.HEADER.pack(AvroDecoder.MAGIC_BYTE, SCHEMA_ID))
+        schemaless_writer(buffer, schema, event)
+        payloads.append(buffer.getvalue())
+    return payloads
+
+
+def pandas_path(decoder, payloads):
+    records = [decoder.decode(payload) for payload in payloads]
+    return pyarrow.Table.from_pandas(pd.json_normalize(records))
+
+
+def arrow_path(arrow_decoder, payloads):
+    return pyarrow.Table.from_batches(arrow_decoder.decode_batch(payloads)).flatten()
+
+
+def dict_arrow_path(decoder, arrow_schema, payloads):
+    records = [decoder.decode(payload) for payload in payloads]
+    return pyarrow.Table.from_batches([pyarrow.RecordBatch.from_pylist(records, schema=arrow_schema)]).flatten()
+
+
+def best_of(repeats, func, *args):
+    timings = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the dict + pandas decode path with the direct Avro to Arrow path.")
+    parser.add_argument("--events", type=int, default=20000)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    schema_str = SCHEMA_PATH.read_text()
+    events = c.generate_consumer_event_data_batch(args.events, np.random.default_rng(args.seed))
+    payloads = encode_events(events, parse_schema(json.loads(schema_str)))
+
+    decoder = AvroDecoder(LocalSchemaRegistry(schema_str))
+    arrow_decoder = ArrowBatchDecoder(decoder)
+
+    pandas_seconds, pandas_table = best_of(args.repeats, pandas_path, decoder, payloads)
+    # fastavro's dicts converted in one from_pylist call, to show what reading into column builders saves
+    dict_seconds, dict_table = best_of(args.repeats, dict_arrow_path, decoder, arrow_decoder.arrow_schema(SCHEMA_ID), payloads)
+    arrow_seconds, arrow_table = best_of(args.repeats, arrow_path, arrow_decoder, payloads)
+
+    print(f"{'path':<36}{'events/sec':>14}{'columns':>10}{'arrow bytes':>14}")
+    for name, seconds, table in [
+        ("dict + json_normalize + from_pandas", pandas_seconds, pandas_table),
+        ("dict + RecordBatch.from_pylist", dict_seconds, dict_table),
+        ("ArrowBatchDecoder", arrow_seconds, arrow_table),
+    ]:
+        print(f"{name:<36}{args.events / seconds:>14,.0f}{table.num_columns:>10}{table.nbytes:>14,}")
+    print(f"speedup over the pandas path: {pandas_seconds / arrow_seconds:,.1f}x")
+    if not arrow_table.equals(dict_table):
+        raise SystemExit("ArrowBatchDecoder and fastavro decoded different tables")
+
+if __name__ == "__main__":
+    main()
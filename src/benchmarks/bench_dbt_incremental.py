@@ -0,0 +1,96 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('consumer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+import psycopg
+import pyarrow
+
+import CustomerEvents as c
+from arrow_decoder import load_local_arrow_schema
+from pg_loader import PostgresLoader
+
+
+DBT_PROJECT = Path(__file__).parent.parent.parent.joinpath('dbt', 'src')
+# the dev_pg target of dbt/src/profiles.yml
+DEFAULT_DSN = "host=localhost port=5432 dbname=testDB user=user password=test"
+FILE_PREFIX = "bench-"
+STAGING_MODELS = ["stg_event_details", "stg_user_actions", "stg_search_history", "stg_recommendations"]
+
+
+def seed(loader, pool, first_file: int, files: int, file_rows: int):
+    """
+    Append files of synthetic events to raw.events, one transaction per file, so every
+    file gets its own loaded_at like a separate pg_loader run would. Rows are cycled from the pool.
+    """
+    loader.create_tables()
+    position = 0
+    for number in range(first_file, first_file + files):
+        rows = pool.take(np.arange(position, position + file_rows) % pool.num_rows)
+        with loader.conn.transaction():
+            loader.copy_batches(rows.to_batches(), f"{FILE_PREFIX}{number}.parquet")
+        position += file_rows
+
+
+def run_dbt(target: str, full_refresh: bool) -> float:
+    command = ["dbt", "run", "--select", *STAGING_MODELS, "--target", target]
+    if full_refresh:
+        command.append("--full-refresh")
+    start = time.perf_counter()
+    subprocess.run(command, cwd=DBT_PROJECT, check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def cleanup(conn):
+    conn.execute("DELETE FROM raw.events WHERE source_file_name LIKE %s", (f"{FILE_PREFIX}%",))
+    for model in STAGING_MODELS:
+        conn.execute(f"DELETE FROM staging.{model} WHERE source_file_name LIKE %s", (f"{FILE_PREFIX}%",))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare a full refresh of the staging models with an incremental run over a large raw.events table.")
+    parser.add_argument("--dsn", default=os.environ.get("PG_DSN", DEFAULT_DSN), help="database of the dbt target")
+    parser.add_argument("--target", default="dev_pg", help="dbt target")
+    parser.add_argument("--files", type=int, default=40, help="files loaded before the first run")
+    parser.add_argument("--new-files", type=int, default=2, help="files loaded between the runs")
+    parser.add_argument("--file-rows", type=int, default=5000, help="events per file")
+    parser.add_argument("--pool", type=int, default=20000, help="distinct events generated and cycled through")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help="leave the synthetic rows in raw.events and staging")
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    pool = pyarrow.Table.from_pylist(c.generate_consumer_event_data_batch(args.pool, rng), schema=load_local_arrow_schema()).flatten()
+
+    results = []
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        loader = PostgresLoader(conn)
+        try:
+            seed(loader, pool, 0, args.files, args.file_rows)
+            total = args.files * args.file_rows
+            results.append(("full refresh", total, run_dbt(args.target, full_refresh=True)))
+
+            seed(loader, pool, args.files, args.new_files, args.file_rows)
+            results.append((f"incremental, {args.new_files} new files", args.new_files * args.file_rows, run_dbt(args.target, full_refresh=False)))
+
+            total += args.new_files * args.file_rows
+            results.append(("full refresh", total, run_dbt(args.target, full_refresh=True)))
+        finally:
+            if not args.keep:
+                cleanup(conn)
+
+    print(f"{'run':<40}{'events read':>14}{'seconds':>10}")
+    for name, events, seconds in results:
+        print(f"{name:<40}{events:>14,}{seconds:>10.2f}")
+    print(f"speedup of the incremental run: {results[2][2] / results[1][2]:,.1f}x")
+
+
+if __name__ == "__main__":
+    main()
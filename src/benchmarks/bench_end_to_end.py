@@ -0,0 +1,238 @@
+import argparse
+import json
+import multiprocessing
+import os
+import signal
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('consumer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+import pyarrow.parquet as pq
+from confluent_kafka import Producer
+
+import CustomerEvents as c
+from consumer import KafkaConsumer
+from kafka_producer import KafkaProducer
+from rate_limiter import TokenBucket
+from schema_registry_stub import start_schema_registry_stub
+
+
+TOPIC = KafkaConsumer.KAFAK_TOPIC
+
+
+def start_mock_cluster(brokers: int) -> tuple:
+    """
+    Start librdkafka's built in mock cluster. It lives as long as the returned client,
+    and other processes reach it over TCP like a real cluster.
+
+    Returns:
+        tuple: The client owning the cluster and the cluster's bootstrap.servers.
+    """
+    owner = Producer({"test.mock.num.brokers": brokers})
+    metadata = owner.list_topics(timeout=10)
+    bootstrap = ",".join(f"{broker.host}:{broker.port}" for broker in metadata.brokers.values())
+    return owner, bootstrap
+
+
+def create_topic(owner) -> int:
+    """
+    The mock cluster has no controller to send CreateTopics to, so the topic is auto
+    created by asking for its metadata, with the mock's default partition count.
+
+    Returns:
+        int: Partitions of the topic.
+    """
+    topic = owner.list_topics(TOPIC, timeout=10).topics[TOPIC]
+    if topic.error is not None:
+        raise RuntimeError(f"Could not create {TOPIC} on the mock cluster: {topic.error}")
+    return len(topic.partitions)
+
+
+class HarnessConsumer(KafkaConsumer):
+    # tells the harness when the group has settled, so producing does not start
+    # while the consumer is still joining
+    def __init__(self, assigned, **kwargs):
+        self.assigned = assigned
+        super().__init__(**kwargs)
+
+    def on_assign(self, consumer, partitions):
+        super().on_assign(consumer, partitions)
+        self.assigned.set()
+
+
+def run_consumer(bootstrap, registry_url, output_dir, consumer_options, assigned):
+    """
+    Consume into output_dir until SIGINT, which makes start_consuming() flush, commit and close.
+    """
+    consumer = HarnessConsumer(
+        assigned,
+        config={"group.id": "bench-end-to-end", "bootstrap.servers": bootstrap},
+        schema_registry_url=registry_url,
+        output_dir=output_dir,
+        **consumer_options,
+    )
+    consumer.start_consuming()
+
+
+def run_producer(bootstrap, registry_url, events, batch_size, rate, results):
+    """
+    Generate and produce events through a pipelined KafkaProducer, and report when
+    production started and how long it took until every event was delivered.
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    producer = KafkaProducer(config={"bootstrap.servers": bootstrap}, pipelined=True, schema_registry_url=registry_url)
+    bucket = TokenBucket(rate)
+    if rate > 0:
+        batch_size = max(1, min(batch_size, int(bucket.capacity)))
+    started = time.time()
+    produced = 0
+    while produced < events:
+        count = min(batch_size, events - produced)
+        bucket.acquire(count)
+        produced = producer.produce_many(c.generate_consumer_event_data_batch(count), first_id=produced)
+    stats = producer.close()
+    results.put({"started": started, "seconds": time.time() - started} | stats)
+
+
+def event_id_millis(event_ids) -> np.ndarray:
+    # the first 48 bits of a UUIDv7 are the unix milliseconds it was created at
+    return np.array([int(event_id[:8] + event_id[9:13], 16) for event_id in event_ids], dtype=np.int64)
+
+
+class OutputWatcher:
+    """
+    Finds the Parquet files the consumer publishes and, for every event in them, the
+    seconds from the creation of its event_id to the file being written.
+    """
+
+    def __init__(self, directory: Path):
+        self.directory = directory
+        self.seen = set()
+        self.rows = 0
+        self.published = []
+        self.latencies = []
+
+    def scan(self):
+        # temporary files are hidden .<name>.parquet.tmp files and sidecars end in .json
+        for path in sorted(self.directory.rglob("*.parquet")):
+            if path in self.seen:
+                continue
+            self.seen.add(path)
+            published = path.stat().st_mtime
+            # ParquetFile rather than read_table, which would add the hive directory names of --partitioned as columns
+            event_ids = pq.ParquetFile(path).read(columns=["event_id"]).column("event_id").to_pylist()
+            self.rows += len(event_ids)
+            self.published.append(published)
+            self.latencies.append(published - event_id_millis(event_ids) / 1000)
+
+    def wait_for(self, events: int, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while self.rows < events and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self.scan()
+        return self.rows >= events
+
+
+def summarize(args, producer_result: dict, watcher: OutputWatcher, registry) -> dict:
+    latencies = np.concatenate(watcher.latencies) if watcher.latencies else np.array([0.0])
+    last_published = max(watcher.published, default=producer_result["started"])
+    return {
+        "events": args.events,
+        "written": watcher.rows,
+        "files": len(watcher.published),
+        "produce_events_per_sec": round(producer_result["delivered"] / producer_result["seconds"], 1),
+        "end_to_end_events_per_sec": round(watcher.rows / (last_published - producer_result["started"]), 1),
+        "latency_p50_ms": round(float(np.percentile(latencies, 50)) * 1000, 1),
+        "latency_p95_ms": round(float(np.percentile(latencies, 95)) * 1000, 1),
+        "latency_p99_ms": round(float(np.percentile(latencies, 99)) * 1000, 1),
+        "latency_max_ms": round(float(latencies.max()) * 1000, 1),
+        "delivered": producer_result["delivered"],
+        "failed": producer_result["failed"],
+        "registry_requests": registry.requests,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Offline end to end run: producer -> librdkafka mock cluster -> consumer -> Parquet, with an in process schema registry stub."
+    )
+    parser.add_argument("--events", type=int, default=100000, help="events to produce")
+    parser.add_argument("--batch-size", type=int, default=1000, help="events generated per batch")
+    parser.add_argument("--rate", type=float, default=0, help="events/sec, 0 for unlimited")
+    parser.add_argument("--brokers", type=int, default=1, help="brokers of the mock cluster")
+    parser.add_argument("--flush-rows", type=int, default=10000, help="events per row group")
+    parser.add_argument("--flush-age", type=float, default=1.0, help="max seconds an event waits before being written")
+    parser.add_argument("--max-file-age", type=float, default=2.0, help="seconds a Parquet file stays open before it is published")
+    parser.add_argument("--columnar", action="store_true", help="decode Avro straight to Arrow")
+    parser.add_argument("--decode-workers", type=int, default=0, help="decode threads of the staged pipeline")
+    parser.add_argument("--partitioned", action="store_true")
+    parser.add_argument("--normalized", action="store_true")
+    parser.add_argument("--dedup", action="store_true")
+    parser.add_argument("--timeout", type=float, default=300.0, help="seconds to wait for every event to be written")
+    parser.add_argument("--output-dir", default=None, help="where the consumer writes, defaults to a temporary directory")
+    parser.add_argument("--output", default=None, help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    owner, bootstrap = start_mock_cluster(args.brokers)
+    partitions = create_topic(owner)
+    registry_server, registry_url = start_schema_registry_stub()
+    print(f"mock cluster at {bootstrap}, {TOPIC} with {partitions} partitions, schema registry stub at {registry_url}")
+
+    consumer_options = {
+        "flush_rows": args.flush_rows,
+        "flush_age": args.flush_age,
+        "max_file_age": args.max_file_age,
+        "columnar": args.columnar,
+        "decode_workers": args.decode_workers,
+        "partitioned": args.partitioned,
+        "normalized": args.normalized,
+        "dedup": args.dedup,
+    }
+    with tempfile.TemporaryDirectory() as temporary:
+        output_dir = Path(args.output_dir or temporary)
+        # the stub's ids mean nothing to later runs, keep them out of the producer's schema id cache
+        os.environ["SCHEMA_CACHE_PATH"] = str(Path(temporary) / "schema_cache.json")
+        # normalized runs count the events dataset; the child datasets repeat its event ids
+        watcher = OutputWatcher(output_dir / "events" if args.normalized else output_dir)
+        watcher.directory.mkdir(parents=True, exist_ok=True)
+
+        ctx = multiprocessing.get_context("spawn")
+        assigned = ctx.Event()
+        results = ctx.Queue()
+        consumer = ctx.Process(target=run_consumer, name="consumer", args=(bootstrap, registry_url, str(output_dir), consumer_options, assigned))
+        consumer.start()
+        if not assigned.wait(60):
+            consumer.terminate()
+            raise SystemExit("The consumer got no partitions within 60 s")
+
+        producer = ctx.Process(target=run_producer, name="producer", args=(bootstrap, registry_url, args.events, args.batch_size, args.rate, results))
+        producer.start()
+        producer_result = results.get()
+        producer.join()
+
+        complete = watcher.wait_for(producer_result["delivered"], args.timeout)
+        os.kill(consumer.pid, signal.SIGINT)
+        consumer.join()
+        watcher.scan()
+
+        summary = summarize(args, producer_result, watcher, registry_server.registry)
+    registry_server.shutdown()
+
+    print()
+    for name, value in summary.items():
+        print(f"{name:<28}{value:>14,}")
+    if args.output:
+        Path(args.output).write_text(json.dumps({"parameters": vars(args), "results": summary}, indent=2))
+        print(f"results written to {args.output}")
+    if not complete:
+        raise SystemExit(f"Only {watcher.rows} of {producer_result['delivered']} delivered events were written within {args.timeout} s")
+
+
+if __name__ == "__main__":
+    main()
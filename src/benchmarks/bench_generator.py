@@ -0,0 +1,53 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+
+import CustomerEvents as c
+
+
+def bench_single(events: int) -> float:
+    start = time.perf_counter()
+    for _ in range(events):
+        c.generate_consumer_event_data()
+    return events / (time.perf_counter() - start)
+
+
+def bench_batch(events: int, batch_size: int, seed: int) -> float:
+    rng = np.random.default_rng(seed)
+    # warm up the location catalog so it is not counted against the first batch
+    c.generate_consumer_event_data_batch(1, rng)
+
+    start = time.perf_counter()
+    remaining = events
+    while remaining > 0:
+        n = min(batch_size, remaining)
+        c.generate_consumer_event_data_batch(n, rng)
+        remaining -= n
+    return events / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare events/sec of the single-event and batched generators.")
+    parser.add_argument("--single-events", type=int, default=200, help="events generated through generate_consumer_event_data()")
+    parser.add_argument("--batch-events", type=int, default=50000, help="events generated through generate_consumer_event_data_batch()")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    single = bench_single(args.single_events)
+    batch = bench_batch(args.batch_events, args.batch_size, args.seed)
+
+    print(f"{'path':<40}{'events':>10}{'events/sec':>14}")
+    print(f"{'generate_consumer_event_data()':<40}{args.single_events:>10}{single:>14,.0f}")
+    print(f"{'generate_consumer_event_data_batch()':<40}{args.batch_events:>10}{batch:>14,.0f}")
+    print(f"speedup: {batch / single:,.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import argparse
+import logging
+import queue
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+
+from logging.handlers import QueueListener
+
+import custom_logging as cl
+
+
+class PerRecordFormatter(cl.CustomFormatter):
+    # the formatter before it kept its formatters: a new logging.Formatter per record
+    def format(self, record):
+        return logging.Formatter(self.FORMATS.get(record.levelno)).format(record)
+
+
+def make_logger(name: str, handler: logging.Handler) -> logging.Logger:
+    logger = logging.Logger(name, logging.DEBUG)
+    logger.addHandler(handler)
+    return logger
+
+
+def bench_sync(formatter, records: int, out) -> tuple:
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(formatter)
+    logger = make_logger("bench.sync", handler)
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info(f"Message delivered to customer_events [{i % 4}] at offset {i}")
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def bench_async(records: int, out) -> tuple:
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(cl.CustomFormatter())
+    log_queue = queue.SimpleQueue()
+    listener = QueueListener(log_queue, handler, respect_handler_level=True)
+    listener.start()
+    logger = make_logger("bench.async", cl._InProcessQueueHandler(log_queue))
+    start = time.perf_counter()
+    for i in range(records):
+        logger.info(f"Message delivered to customer_events [{i % 4}] at offset {i}")
+    caller = time.perf_counter() - start
+    # stop() returns once the listener has written every queued record
+    listener.stop()
+    return caller, time.perf_counter() - start
+
+
+def bench_aggregated(records: int, out) -> tuple:
+    handler = logging.StreamHandler(out)
+    handler.setFormatter(cl.CustomFormatter())
+    aggregated = cl.AggregatedLog(make_logger("bench.aggregated", handler), "{count} messages delivered in the last {seconds:.1f} s")
+    start = time.perf_counter()
+    for _ in range(records):
+        aggregated.add()
+    aggregated.flush()
+    elapsed = time.perf_counter() - start
+    return elapsed, elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the cost of per message log lines across the logging modes.")
+    parser.add_argument("--records", type=int, default=100000, help="log calls per mode")
+    args = parser.parse_args()
+
+    modes = [
+        ("per record formatter (before)", lambda out: bench_sync(PerRecordFormatter(), args.records, out)),
+        ("prebuilt formatters", lambda out: bench_sync(cl.CustomFormatter(), args.records, out)),
+        ("json", lambda out: bench_sync(cl.JsonFormatter(), args.records, out)),
+        ("queue + listener thread", lambda out: bench_async(args.records, out)),
+        ("aggregated", lambda out: bench_aggregated(args.records, out)),
+    ]
+
+    print(f"{'mode':<32}{'caller us/call':>16}{'total us/call':>16}")
+    for name, bench in modes:
+        # a real file, so the write cost is counted too
+        with tempfile.TemporaryFile("w") as out:
+            caller, total = bench(out)
+        print(f"{name:<32}{caller / args.records * 1e6:>16.2f}{total / args.records * 1e6:>16.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+import argparse
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+
+from kafka_schema_registry import CachedIdSerializer, KafkaSchemaRegistry
+from schema_registry_stub import start_schema_registry_stub
+
+
+def time_startup(url: str, subject: str, cache_path, use_cache: bool, registry) -> tuple:
+    """
+    Time what a producer does before it can serialize: create the registry client,
+    register or look up the local schema and build the serializer.
+
+    Returns:
+        tuple: Milliseconds taken, registry requests made before the serializer was
+            returned and made in the background to validate a cached id.
+    """
+    requests = registry.requests
+    start = time.perf_counter()
+    serializer = KafkaSchemaRegistry(url=url, subject_name=subject, cache_path=cache_path, use_cache=use_cache).register_schema()
+    elapsed = (time.perf_counter() - start) * 1000
+    startup_requests = registry.requests - requests
+    if isinstance(serializer, CachedIdSerializer):
+        serializer.validated.wait()
+    return elapsed, startup_requests, registry.requests - requests - startup_requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Time the schema registration a producer does at startup, with and without the schema id cache.")
+    parser.add_argument("--repeats", type=int, default=20, help="startups per mode")
+    parser.add_argument("--registry-rtt", type=float, default=0.0, help="milliseconds the stub waits before every response, to mimic a remote registry")
+    args = parser.parse_args()
+
+    server, url = start_schema_registry_stub()
+    registry = server.registry
+    if args.registry_rtt:
+        handle = registry.handle
+
+        def delayed(*call_args):
+            time.sleep(args.registry_rtt / 1000)
+            return handle(*call_args)
+
+        registry.handle = delayed
+
+    with tempfile.TemporaryDirectory() as directory:
+        cache_path = Path(directory) / "schema_cache.json"
+        modes = {
+            # a subject seen for the first time: look up, register, set compatibility
+            "cold, new subject": lambda i: time_startup(url, f"bench-{i}-value", cache_path, False, registry),
+            # the schema is registered already, the registry is asked anyway
+            "cold, registered": lambda i: time_startup(url, "bench-value", cache_path, False, registry),
+            # the schema id comes from the cache file
+            "warm cache": lambda i: time_startup(url, "bench-value", cache_path, True, registry),
+        }
+        # registers bench-value and fills the cache for the warm runs
+        time_startup(url, "bench-value", cache_path, True, registry)
+
+        print(f"{'mode':<22}{'p50 ms':>10}{'max ms':>10}{'requests':>10}{'background':>12}")
+        for name, startup in modes.items():
+            results = [startup(i) for i in range(args.repeats)]
+            timings = np.array([ms for ms, _, _ in results])
+            _, requests, background = results[-1]
+            print(f"{name:<22}{np.percentile(timings, 50):>10.2f}{timings.max():>10.2f}{requests:>10}{background:>12}")
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
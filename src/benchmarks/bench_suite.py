@@ -0,0 +1,258 @@
+import argparse
+import contextlib
+import io
+import json
+import math
+import multiprocessing
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('consumer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import fastavro
+import numpy as np
+import pandas as pd
+import pyarrow
+from faker import Faker
+from fastavro import parse_schema, schemaless_writer
+
+import CustomerEvents as c
+from avro_decoder import AvroDecoder
+from savejson import SaveJson
+
+
+SCHEMA_PATH = Path(__file__).parent.parent.joinpath('producer', 'Schema', 'v1.avsc')
+SCHEMA_ID = 1
+
+
+class LocalSchemaRegistry:
+    """
+    Serves the local schema file for every id, so the suite runs offline.
+    """
+
+    class RegisteredSchema:
+        def __init__(self, schema_str):
+            self.schema_str = schema_str
+
+    def __init__(self, schema_str):
+        self.schema = LocalSchemaRegistry.RegisteredSchema(schema_str)
+
+    def get_schema(self, schema_id):
+        return self.schema
+
+
+def encode(event, schema) -> bytes:
+    buffer = io.BytesIO()
+    buffer.write(AvroDecoder.HEADER.pack(AvroDecoder.MAGIC_BYTE, SCHEMA_ID))
+    schemaless_writer(buffer, schema, event)
+    return buffer.getvalue()
+
+
+def v1_records(events: int, seed: int) -> list:
+    # what the consumer gets from Avro: the generated events as v1 records
+    schema_str = SCHEMA_PATH.read_text()
+    schema = parse_schema(json.loads(schema_str))
+    decoder = AvroDecoder(LocalSchemaRegistry(schema_str))
+    generated = c.generate_consumer_event_data_batch(events, np.random.default_rng(seed))
+    return [decoder.decode(encode(event, schema)) for event in generated]
+
+
+def timings_of(func, items, warmup: int = 1) -> list:
+    """
+    Call func once per item and return the seconds of every call after the warmup calls.
+    """
+    for item in items[:warmup]:
+        func(item)
+    timings = []
+    for item in items:
+        start = time.perf_counter()
+        func(item)
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def batches_of(records: list, batch_size: int, iterations: int) -> list:
+    # cycles through records, so a pool smaller than iterations * batch_size is reused
+    return [[records[(i * batch_size + j) % len(records)] for j in range(batch_size)] for i in range(iterations)]
+
+
+def bench_generate_single(events: int, seed: int) -> dict:
+    random.seed(seed)
+    Faker.seed(seed)
+    return {"items_per_call": 1, "timings": timings_of(lambda _: c.generate_consumer_event_data(), list(range(events)), warmup=5)}
+
+
+def bench_generate_batch(events: int, batch_size: int, seed: int) -> dict:
+    rng = np.random.default_rng(seed)
+    iterations = max(5, math.ceil(events / batch_size))
+    return {"items_per_call": batch_size, "timings": timings_of(lambda _: c.generate_consumer_event_data_batch(batch_size, rng), list(range(iterations)))}
+
+
+def bench_avro_encode(events: int, seed: int) -> dict:
+    schema = parse_schema(json.loads(SCHEMA_PATH.read_text()))
+    records = v1_records(events, seed)
+    return {"items_per_call": 1, "timings": timings_of(lambda record: encode(record, schema), records, warmup=100)}
+
+
+def bench_avro_decode(events: int, seed: int) -> dict:
+    schema_str = SCHEMA_PATH.read_text()
+    schema = parse_schema(json.loads(schema_str))
+    payloads = [encode(record, schema) for record in v1_records(events, seed)]
+    decoder = AvroDecoder(LocalSchemaRegistry(schema_str))
+    return {"items_per_call": 1, "timings": timings_of(decoder.decode, payloads, warmup=100)}
+
+
+def bench_pandas_normalize(events: int, batch_size: int, seed: int) -> dict:
+    iterations = max(5, math.ceil(events / batch_size))
+    batches = batches_of(v1_records(min(events, batch_size * iterations), seed), batch_size, iterations)
+    return {"items_per_call": batch_size, "timings": timings_of(SaveJson.to_table, batches)}
+
+
+def bench_save_as_parquet(events: int, batch_size: int, seed: int) -> dict:
+    iterations = max(5, math.ceil(events / batch_size))
+    batches = batches_of(v1_records(min(events, batch_size * iterations), seed), batch_size, iterations)
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        paths = iter(Path(directory) / f"{i}.parquet" for i in range(iterations + 1))
+        timings = timings_of(lambda batch: SaveJson.save_as_parquet(batch, path=next(paths)), batches)
+    return {"items_per_call": batch_size, "timings": timings}
+
+
+def cases(args) -> dict:
+    """
+    Returns:
+        dict: Case name -> (function, keyword arguments).
+    """
+    selected = {
+        "generate.single": (bench_generate_single, {"events": args.single_events, "seed": args.seed}),
+        "generate.batch[1000]": (bench_generate_batch, {"events": args.events, "batch_size": 1000, "seed": args.seed}),
+        "avro.encode.v1": (bench_avro_encode, {"events": args.events, "seed": args.seed}),
+        "avro.decode.v1": (bench_avro_decode, {"events": args.events, "seed": args.seed}),
+    }
+    for batch_size in args.batch_sizes:
+        selected[f"pandas.normalize[{batch_size}]"] = (bench_pandas_normalize, {"events": args.events, "batch_size": batch_size, "seed": args.seed})
+    for batch_size in args.batch_sizes:
+        selected[f"savejson.save_as_parquet[{batch_size}]"] = (bench_save_as_parquet, {"events": args.events, "batch_size": batch_size, "seed": args.seed})
+    return selected
+
+
+def peak_rss_bytes() -> int:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def run_case(func, kwargs, conn):
+    result = func(**kwargs)
+    result["peak_rss_bytes"] = peak_rss_bytes()
+    conn.send(result)
+    conn.close()
+
+
+def summarize(name: str, result: dict) -> dict:
+    timings = np.array(result["timings"])
+    return {
+        "case": name,
+        "calls": len(timings),
+        "events_per_call": result["items_per_call"],
+        "events_per_sec": round(result["items_per_call"] * len(timings) / timings.sum(), 1),
+        "p50_ms": round(float(np.percentile(timings, 50)) * 1000, 4),
+        "p99_ms": round(float(np.percentile(timings, 99)) * 1000, 4),
+        "peak_rss_mb": round(result["peak_rss_bytes"] / 1024 / 1024, 1),
+    }
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=Path(__file__).parent, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": multiprocessing.cpu_count(),
+        "versions": {"numpy": np.__version__, "pandas": pd.__version__, "pyarrow": pyarrow.__version__, "fastavro": fastavro.__version__},
+    }
+
+
+def compare(results: list, baseline_path: Path, threshold: float) -> int:
+    """
+    Print the change of every case against an earlier results file.
+
+    Returns:
+        int: Number of cases whose events/sec dropped by more than threshold percent.
+    """
+    baseline = {case["case"]: case for case in json.loads(baseline_path.read_text())["results"]}
+    regressions = 0
+    print()
+    print(f"against {baseline_path}")
+    print(f"{'case':<36}{'events/sec':>12}{'p99':>10}{'peak rss':>10}")
+    for case in results:
+        before = baseline.get(case["case"])
+        if before is None:
+            print(f"{case['case']:<36}{'new':>12}")
+            continue
+        throughput = (case["events_per_sec"] / before["events_per_sec"] - 1) * 100
+        p99 = (case["p99_ms"] / before["p99_ms"] - 1) * 100
+        rss = (case["peak_rss_mb"] / before["peak_rss_mb"] - 1) * 100
+        flag = ""
+        if throughput < -threshold:
+            regressions += 1
+            flag = "  regression"
+        print(f"{case['case']:<36}{throughput:>+11.1f}%{p99:>+9.1f}%{rss:>+9.1f}%{flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks of event generation, Avro encode/decode, pandas normalization and Parquet writes.")
+    parser.add_argument("--events", type=int, default=50000, help="events per case")
+    parser.add_argument("--single-events", type=int, default=300, help="events of the slow generate_consumer_event_data() case")
+    parser.add_argument("--batch-sizes", type=lambda value: [int(size) for size in value.split(",")], default=[1000, 10000, 50000],
+                        help="comma separated batch sizes of the normalize and Parquet cases")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--cases", default=None, help="comma separated substrings, runs the cases whose name contains one")
+    parser.add_argument("--output", default=None, help="results file, defaults to bench-<commit>.json")
+    parser.add_argument("--compare", type=Path, default=None, help="results file of an earlier run to diff against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="events/sec drop in percent reported as a regression")
+    args = parser.parse_args()
+
+    selected = cases(args)
+    if args.cases:
+        patterns = args.cases.split(",")
+        selected = {name: case for name, case in selected.items() if any(pattern in name for pattern in patterns)}
+
+    # every case in a fresh process, so peak RSS is the case's own and no case warms up another
+    ctx = multiprocessing.get_context("spawn")
+    results = []
+    print(f"{'case':<36}{'events/sec':>14}{'p50 ms':>11}{'p99 ms':>11}{'peak rss MB':>13}")
+    for name, (func, kwargs) in selected.items():
+        receiver, sender = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=run_case, args=(func, kwargs, sender))
+        process.start()
+        sender.close()
+        result = receiver.recv()
+        process.join()
+        summary = summarize(name, result)
+        results.append(summary)
+        print(f"{name:<36}{summary['events_per_sec']:>14,.0f}{summary['p50_ms']:>11.3f}{summary['p99_ms']:>11.3f}{summary['peak_rss_mb']:>13.1f}")
+
+    env = environment()
+    output = Path(args.output or f"bench-{env['commit'] or 'local'}.json")
+    output.write_text(json.dumps({"environment": env, "parameters": vars(args) | {"compare": str(args.compare) if args.compare else None}, "results": results}, indent=2))
+    print(f"results written to {output}")
+
+    if args.compare is not None and compare(results, args.compare, args.threshold):
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+import argparse
+import os
+import sys
+import tempfile
+from datetime import datetime, timezone
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('producer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('consumer')))
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+import numpy as np
+import psycopg
+import pyarrow
+
+import CustomerEvents as c
+from arrow_decoder import load_local_arrow_schema
+from compact_parquet import compact
+from pg_loader import DEFAULT_DSN, PostgresLoader
+from savejson import RollingParquetWriter, SaveJson
+
+
+SCHEMA = "pg_loader_check"
+
+
+class CheckFailed(Exception):
+    pass
+
+
+def check(condition: bool, message: str):
+    if not condition:
+        raise CheckFailed(message)
+
+
+def expected_timestamp(value):
+    # Python's strptime reads the producer's unpadded fields and rejects impossible dates
+    try:
+        return datetime.strptime(value, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+class LoaderCheck:
+    """
+    Writes Parquet files like the consumer does, loads them with PostgresLoader into a
+    throwaway schema and checks the table after every run.
+    """
+
+    def __init__(self, conn, directory: Path, file_rows: int, seed: int):
+        self.conn = conn
+        self.directory = directory
+        self.file_rows = file_rows
+        self.rng = np.random.default_rng(seed)
+        self.arrow_schema = load_local_arrow_schema()
+        self.loader = PostgresLoader(conn, schema=SCHEMA)
+        # event_id -> expected timestamp of every event written so far
+        self.events = {}
+
+    def write_file(self, v1=False) -> Path:
+        """
+        Publish one Parquet file with a manifest sidecar; v1 files have no event_id column.
+        """
+        events = c.generate_consumer_event_data_batch(self.file_rows, self.rng)
+        table = pyarrow.Table.from_pylist(events, schema=self.arrow_schema).flatten()
+        if v1:
+            table = table.drop_columns(["event_id"])
+        event_ids = SaveJson.fill_event_ids(table).column("event_id").to_pylist()
+        for event_id, value in zip(event_ids, table.column("timestamp").to_pylist()):
+            self.events[event_id] = expected_timestamp(value)
+        writer = RollingParquetWriter(directory=self.directory)
+        writer.write(table)
+        return writer.close()
+
+    def load(self, name: str, files: int, rows: int, skipped: int):
+        report = self.loader.load(self.directory)
+        print(f"{name:<48}{report['files']:>7}{report['rows']:>9}{report['skipped']:>9}{report['failed']:>8}")
+        check(report["failed"] == 0, f"{name}: {report['failed']} files failed to load")
+        check(report["files"] == files, f"{name}: loaded {report['files']} files, expected {files}")
+        check(report["rows"] == rows, f"{name}: loaded {report['rows']} rows, expected {rows}")
+        check(report["skipped"] == skipped, f"{name}: skipped {report['skipped']} files, expected {skipped}")
+        self.check_table(name)
+
+    def check_table(self, name: str):
+        # every event written so far exactly once, with its timestamp parsed
+        rows = self.conn.execute(f'SELECT event_id, "timestamp" FROM {SCHEMA}.events').fetchall()
+        check(len(rows) == len(self.events), f"{name}: {len(rows)} rows in the table, expected {len(self.events)}")
+        loaded = dict(rows)
+        check(len(loaded) == len(rows), f"{name}: {len(rows) - len(loaded)} events are in the table twice")
+        check(loaded == self.events, f"{name}: the event ids or timestamps in the table differ from the files")
+
+    def run(self):
+        print(f"{'step':<48}{'files':>7}{'rows':>9}{'skipped':>9}{'failed':>8}")
+        for _ in range(2):
+            self.write_file()
+        self.write_file(v1=True)
+        self.load("first run", files=3, rows=3 * self.file_rows, skipped=0)
+        data_type = self.conn.execute(
+            "SELECT data_type FROM information_schema.columns WHERE table_schema = %s AND table_name = 'events' AND column_name = 'timestamp'",
+            (SCHEMA,),
+        ).fetchone()
+        check(data_type == ("timestamp with time zone",), f"timestamp is loaded as {data_type}, expected timestamptz")
+
+        self.load("second run, nothing new", files=0, rows=0, skipped=3)
+
+        self.write_file()
+        self.load("one new file", files=1, rows=self.file_rows, skipped=3)
+
+        compact(self.directory)
+        self.load("compacted file, every source loaded", files=1, rows=0, skipped=0)
+
+        self.write_file()
+        self.load("one new file after compaction", files=1, rows=self.file_rows, skipped=1)
+
+        # the compacted file merges the loaded files and one that never was
+        self.write_file()
+        compact(self.directory)
+        self.load("compacted file, one source not loaded", files=1, rows=6 * self.file_rows, skipped=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=f"Check pg_loader.py against a local Postgres in a throwaway {SCHEMA} schema: incremental runs, timestamptz and compacted files."
+    )
+    parser.add_argument("--dsn", default=os.environ.get("PG_DSN", DEFAULT_DSN), help="libpq connection string, defaults to $PG_DSN or the dev_pg dbt target")
+    parser.add_argument("--file-rows", type=int, default=500, help="events per file")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--keep", action="store_true", help=f"leave the {SCHEMA} schema behind")
+    args = parser.parse_args()
+
+    with psycopg.connect(args.dsn, autocommit=True) as conn, tempfile.TemporaryDirectory() as directory:
+        conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+        try:
+            LoaderCheck(conn, Path(directory), args.file_rows, args.seed).run()
+        except CheckFailed as e:
+            raise SystemExit(f"FAILED: {e}")
+        finally:
+            if not args.keep:
+                conn.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE")
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
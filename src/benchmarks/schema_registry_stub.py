@@ -0,0 +1,120 @@
+import json
+import re
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote
+
+
+class SchemaRegistryStub:
+    """
+    An in-memory stand-in for the parts of the Confluent schema registry REST API that
+    KafkaSchemaRegistry, AvroSerializer and the consumer's AvroDecoder call, so the
+    pipeline runs without a registry container. Every schema is compatible.
+    """
+
+    ROUTES = [
+        ("GET", re.compile(r"^/subjects/(?P<subject>[^/]+)/versions/latest$"), "latest_version"),
+        ("POST", re.compile(r"^/subjects/(?P<subject>[^/]+)/versions$"), "register"),
+        ("POST", re.compile(r"^/subjects/(?P<subject>[^/]+)$"), "lookup"),
+        ("GET", re.compile(r"^/schemas/ids/(?P<schema_id>\d+)$"), "schema_by_id"),
+        ("PUT", re.compile(r"^/config/(?P<subject>[^/]+)$"), "set_compatibility"),
+        ("POST", re.compile(r"^/compatibility/subjects/(?P<subject>[^/]+)/versions/[^/]+$"), "test_compatibility"),
+    ]
+
+    def __init__(self):
+        # schema id - 1 -> {"schema": ..., "schemaType": ...}; subject -> ids of its versions
+        self.schemas = []
+        self.subjects = {}
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def handle(self, method: str, path: str, body: dict) -> tuple:
+        """
+        Returns:
+            tuple: HTTP status and the JSON response.
+        """
+        with self._lock:
+            self.requests += 1
+            for route_method, pattern, name in self.ROUTES:
+                match = pattern.match(path)
+                if route_method == method and match:
+                    arguments = {key: unquote(value) for key, value in match.groupdict().items()}
+                    return getattr(self, name)(body=body, **arguments)
+        return 404, {"error_code": 404, "message": f"{method} {path} is not supported by the stub"}
+
+    def _version(self, subject: str, version: int) -> dict:
+        schema_id = self.subjects[subject][version - 1]
+        return {"subject": subject, "version": version, "id": schema_id} | self.schemas[schema_id - 1]
+
+    def latest_version(self, subject, body):
+        if not self.subjects.get(subject):
+            return 404, {"error_code": 40401, "message": f"Subject '{subject}' not found."}
+        return 200, self._version(subject, len(self.subjects[subject]))
+
+    def register(self, subject, body):
+        schema = {"schema": body["schema"], "schemaType": body.get("schemaType", "AVRO")}
+        if schema not in self.schemas:
+            self.schemas.append(schema)
+        schema_id = self.schemas.index(schema) + 1
+        versions = self.subjects.setdefault(subject, [])
+        if schema_id not in versions:
+            versions.append(schema_id)
+        return 200, {"id": schema_id}
+
+    def lookup(self, subject, body):
+        for version, schema_id in enumerate(self.subjects.get(subject, []), start=1):
+            if self.schemas[schema_id - 1]["schema"] == body["schema"]:
+                return 200, self._version(subject, version)
+        return 404, {"error_code": 40403, "message": "Schema not found"}
+
+    def schema_by_id(self, schema_id, body):
+        schema_id = int(schema_id)
+        if not 0 < schema_id <= len(self.schemas):
+            return 404, {"error_code": 40403, "message": "Schema not found"}
+        return 200, self.schemas[schema_id - 1]
+
+    def set_compatibility(self, subject, body):
+        return 200, {"compatibility": body["compatibility"]}
+
+    def test_compatibility(self, subject, body):
+        return 200, {"is_compatible": True}
+
+
+def start_schema_registry_stub(port: int = 0, address: str = "127.0.0.1") -> tuple:
+    """
+    Serve a SchemaRegistryStub from a daemon thread. Port 0 picks a free port.
+
+    Returns:
+        tuple: The ThreadingHTTPServer, call shutdown() on it to stop serving, and its url.
+    """
+    registry = SchemaRegistryStub()
+
+    class RegistryHandler(BaseHTTPRequestHandler):
+
+        def _respond(self, method):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else {}
+            status, response = registry.handle(method, self.path.split("?")[0], body)
+            payload = json.dumps(response).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/vnd.schemaregistry.v1+json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def do_GET(self):
+            self._respond("GET")
+
+        def do_POST(self):
+            self._respond("POST")
+
+        def do_PUT(self):
+            self._respond("PUT")
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), RegistryHandler)
+    server.registry = registry
+    threading.Thread(target=server.serve_forever, name="schema-registry-stub", daemon=True).start()
+    return server, f"http://{address}:{server.server_address[1]}"
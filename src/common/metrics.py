@@ -0,0 +1,286 @@
+import json
+import threading
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from custom_logging import CustomLogger
+
+
+logger = CustomLogger(__name__)
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 10, 50, 100, 500, 1000, 5000, 10000, 50000, 100000)
+
+
+class Value:
+    """
+    One labelled value of a counter or gauge. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self.value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def set(self, value):
+        # also used for counters kept by librdkafka, which only reports their running total
+        self.value = value
+
+    def samples(self):
+        yield "", {}, self.value
+
+
+class HistogramValue:
+    """
+    One labelled histogram: cumulative bucket counts, sum and count of the observed values.
+    """
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+
+    def samples(self):
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative = 0
+        for bound, count in zip(self.buckets, counts):
+            cumulative += count
+            yield "_bucket", {"le": repr(float(bound))}, cumulative
+        cumulative += counts[-1]
+        yield "_bucket", {"le": "+Inf"}, cumulative
+        yield "_sum", {}, total
+        yield "_count", {}, cumulative
+
+
+class Metric:
+    """
+    A metric family: one Value or HistogramValue per combination of label values.
+    """
+
+    def __init__(self, name, documentation, kind, labelnames=(), buckets=None):
+        self.name = name
+        self.documentation = documentation
+        self.kind = kind
+        self.labelnames = tuple(labelnames)
+        self.buckets = buckets
+        self.children = {}
+        self._lock = threading.Lock()
+
+    def labels(self, *values):
+        """
+        Return the value of one label combination, creating it on first use. Keep the
+        result instead of calling labels() per event on a hot path.
+        """
+        key = tuple(str(value) for value in values)
+        if len(key) != len(self.labelnames):
+            raise ValueError(f"{self.name} has labels {self.labelnames}, got {key}")
+        child = self.children.get(key)
+        if child is None:
+            with self._lock:
+                child = self.children.get(key)
+                if child is None:
+                    child = self.children[key] = HistogramValue(self.buckets) if self.kind == "histogram" else Value()
+        return child
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in list(self.children.items()):
+            labels = dict(zip(self.labelnames, key))
+            for suffix, extra, value in child.samples():
+                lines.append(f"{self.name}{suffix}{format_labels(labels | extra)} {format_value(value)}")
+        return lines
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in labels.items()) + "}"
+
+
+def format_value(value) -> str:
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class Registry:
+    """
+    The metrics of a process, rendered in the Prometheus text exposition format.
+
+    counter(), gauge() and histogram() return the existing family when the name is
+    already registered, so several producers or consumers in one process share them.
+    """
+
+    def __init__(self):
+        self.metrics = {}
+        self._lock = threading.Lock()
+
+    def _get(self, name, documentation, kind, labelnames, buckets=None) -> Metric:
+        with self._lock:
+            metric = self.metrics.get(name)
+            if metric is None:
+                metric = self.metrics[name] = Metric(name, documentation, kind, labelnames, buckets)
+            elif metric.kind != kind:
+                raise ValueError(f"{name} is already registered as a {metric.kind}")
+            return metric
+
+    def counter(self, name, documentation, labelnames=()) -> Metric:
+        return self._get(name, documentation, "counter", labelnames)
+
+    def gauge(self, name, documentation, labelnames=()) -> Metric:
+        return self._get(name, documentation, "gauge", labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS) -> Metric:
+        return self._get(name, documentation, "histogram", labelnames, tuple(buckets))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self.metrics.values()):
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+
+def start_http_server(port: int, registry: Registry = REGISTRY, address: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """
+    Serve registry at http://address:port/metrics from a daemon thread.
+
+    Returns:
+        ThreadingHTTPServer: Call shutdown() on it to stop serving.
+    """
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/", "/metrics"):
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            # one line per scrape would drown the application logs
+            pass
+
+    server = ThreadingHTTPServer((address, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info(f"Serving metrics on http://{address}:{server.server_address[1]}/metrics")
+    return server
+
+
+class KafkaClientStats:
+    """
+    Turns the JSON librdkafka passes to stats_cb, every statistics.interval.ms, into
+    gauges: queue depth, broker round trip times and, for consumers, the lag of every
+    assigned partition.
+    """
+
+    def __init__(self, registry: Registry = REGISTRY):
+        self.queue_messages = registry.gauge("kafka_client_queue_messages", "Messages waiting in librdkafka queues", ["client_id"])
+        self.tx_messages = registry.counter("kafka_client_tx_messages_total", "Messages sent to brokers", ["client_id"])
+        self.rx_messages = registry.counter("kafka_client_rx_messages_total", "Messages fetched from brokers", ["client_id"])
+        self.tx_bytes = registry.counter("kafka_client_tx_bytes_total", "Bytes sent to brokers", ["client_id"])
+        self.rx_bytes = registry.counter("kafka_client_rx_bytes_total", "Bytes received from brokers", ["client_id"])
+        self.broker_rtt = registry.gauge("kafka_broker_rtt_seconds", "Average broker round trip time over the last statistics interval", ["client_id", "broker"])
+        self.broker_outbuf = registry.gauge("kafka_broker_outbuf_requests", "Requests waiting to be sent to the broker", ["client_id", "broker"])
+        self.consumer_lag = registry.gauge(
+            "kafka_consumer_lag", "Messages between the partition's high watermark and the committed offset", ["client_id", "topic", "partition"]
+        )
+        self.consumer_lag_consumed = registry.gauge(
+            "kafka_consumer_lag_consumed", "Messages between the partition's high watermark and the last consumed offset", ["client_id", "topic", "partition"]
+        )
+
+    def __call__(self, stats_json: str):
+        """
+        The stats_cb of a librdkafka client. Runs on the thread that calls poll() or consume().
+        """
+        try:
+            self.record(json.loads(stats_json))
+        except (ValueError, KeyError, TypeError) as e:
+            logger.error(f"Could not read librdkafka statistics: {e}")
+
+    def record(self, stats: dict):
+        client_id = stats["client_id"]
+        self.queue_messages.labels(client_id).set(stats.get("msg_cnt", 0))
+        self.tx_messages.labels(client_id).set(stats.get("txmsgs", 0))
+        self.rx_messages.labels(client_id).set(stats.get("rxmsgs", 0))
+        self.tx_bytes.labels(client_id).set(stats.get("txmsg_bytes", 0))
+        self.rx_bytes.labels(client_id).set(stats.get("rxmsg_bytes", 0))
+        for broker in stats.get("brokers", {}).values():
+            if broker.get("nodeid", -1) < 0:
+                # bootstrap and coordinator entries duplicate a real broker
+                continue
+            self.broker_rtt.labels(client_id, broker["nodename"]).set(broker["rtt"]["avg"] / 1e6)
+            self.broker_outbuf.labels(client_id, broker["nodename"]).set(broker.get("outbuf_cnt", 0))
+        if stats.get("type") != "consumer":
+            return
+        for topic, topic_stats in stats.get("topics", {}).items():
+            for partition, partition_stats in topic_stats.get("partitions", {}).items():
+                # -1 is librdkafka's unassigned partition; lag is -1 until it is known
+                if partition == "-1" or partition_stats.get("consumer_lag", -1) < 0:
+                    continue
+                self.consumer_lag.labels(client_id, topic, partition).set(partition_stats["consumer_lag"])
+                lag_consumed = partition_stats.get("consumer_lag_stored", -1)
+                if lag_consumed >= 0:
+                    self.consumer_lag_consumed.labels(client_id, topic, partition).set(lag_consumed)
+
+
+class ProducerMetrics:
+    """
+    Metrics of a KafkaProducer. events/sec is rate(producer_messages_total[1m]).
+    """
+
+    def __init__(self, topic: str, registry: Registry = REGISTRY):
+        self.produced = registry.counter("producer_messages_total", "Messages passed to produce()", ["topic"]).labels(topic)
+        self.delivered = registry.counter("producer_delivered_total", "Messages acknowledged by the broker", ["topic"]).labels(topic)
+        self.failed = registry.counter("producer_failed_total", "Messages that failed delivery", ["topic"]).labels(topic)
+        self.delivery_latency = registry.histogram(
+            "producer_delivery_latency_seconds", "Seconds from produce() to the delivery report", ["topic"]
+        ).labels(topic)
+        self.batch_size = registry.histogram(
+            "producer_batch_size", "Events per produce_many() call", ["topic"], buckets=SIZE_BUCKETS
+        ).labels(topic)
+        self.client_stats = KafkaClientStats(registry)
+
+
+class ConsumerMetrics:
+    """
+    Metrics of a KafkaConsumer. events/sec is rate(consumer_messages_total[1m]).
+    """
+
+    def __init__(self, topic: str, registry: Registry = REGISTRY):
+        self.consumed = registry.counter("consumer_messages_total", "Messages consumed", ["topic"]).labels(topic)
+        self.batch_size = registry.histogram(
+            "consumer_batch_size", "Messages returned by one consume() call", ["topic"], buckets=SIZE_BUCKETS
+        ).labels(topic)
+        self.flush_rows = registry.histogram(
+            "consumer_flush_rows", "Events per row group flush", ["topic"], buckets=SIZE_BUCKETS
+        ).labels(topic)
+        self.flush_duration = registry.histogram(
+            "consumer_flush_duration_seconds", "Seconds to build and write one row group flush", ["topic"]
+        ).labels(topic)
+        self.files_written = registry.counter("consumer_files_written_total", "Parquet files published", ["topic"]).labels(topic)
+        self.bytes_written = registry.counter("consumer_bytes_written_total", "Bytes of published Parquet files", ["topic"]).labels(topic)
+        self.duplicates = registry.counter("consumer_duplicates_dropped_total", "Events dropped by dedup", ["topic"]).labels(topic)
+        self.client_stats = KafkaClientStats(registry)
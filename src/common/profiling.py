@@ -0,0 +1,230 @@
+import atexit
+import functools
+import json
+import os
+import signal
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import nullcontext
+from pathlib import Path
+
+from custom_logging import CustomLogger
+
+
+logger = CustomLogger(__name__)
+
+# PROFILE_STAGES=1 turns on the per stage timers; off, timed() returns the function itself
+STAGES_ENABLED = os.environ.get("PROFILE_STAGES", "0") == "1"
+# PROFILE_SAMPLING=1 starts the sampling profiler at startup and dumps it at exit
+SAMPLING_AT_START = os.environ.get("PROFILE_SAMPLING", "0") == "1"
+# where profiles are dumped
+PROFILE_DIR = Path(os.environ.get("PROFILE_DIR", "."))
+PROFILE_INTERVAL = float(os.environ.get("PROFILE_INTERVAL", "0.005"))
+
+
+class StageStats:
+    """
+    Cumulative calls, wall seconds and CPU seconds of one stage. Safe to update from several threads.
+
+    CPU time is that of the calling thread, so time a stage waits on the broker, the disk
+    or the GIL shows up as wall time without CPU time. Stages nest: a stage's time
+    includes the stages it calls.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.wall = 0.0
+        self.cpu = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, wall: float, cpu: float):
+        with self._lock:
+            self.calls += 1
+            self.wall += wall
+            self.cpu += cpu
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"calls": self.calls, "wall_seconds": round(self.wall, 6), "cpu_seconds": round(self.cpu, 6)}
+
+
+_stages = {}
+_stages_lock = threading.Lock()
+
+
+def stage_stats_for(name: str) -> StageStats:
+    stats = _stages.get(name)
+    if stats is None:
+        with _stages_lock:
+            stats = _stages.setdefault(name, StageStats())
+    return stats
+
+
+class _Stage:
+
+    def __init__(self, stats: StageStats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.thread_time()
+
+    def __exit__(self, *exc):
+        self.stats.add(time.perf_counter() - self.wall, time.thread_time() - self.cpu)
+        return False
+
+
+def stage(name: str):
+    """
+    Context manager timing the block as stage name, a no-op unless PROFILE_STAGES=1.
+    """
+    if not STAGES_ENABLED:
+        return nullcontext()
+    return _Stage(stage_stats_for(name))
+
+
+def timed(name: str):
+    """
+    Decorator timing every call of the function as stage name. Unless PROFILE_STAGES=1
+    the function is returned unchanged, so the timers cost nothing when they are off.
+    """
+
+    def decorate(func):
+        if not STAGES_ENABLED:
+            return func
+        stats = stage_stats_for(name)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            wall, cpu = time.perf_counter(), time.thread_time()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                stats.add(time.perf_counter() - wall, time.thread_time() - cpu)
+
+        return wrapper
+
+    return decorate
+
+
+def stage_stats() -> dict:
+    """
+    Returns:
+        dict: Stage name -> calls, wall_seconds and cpu_seconds since the process started.
+    """
+    return {name: stats.stats() for name, stats in sorted(_stages.items()) if stats.calls}
+
+
+class SamplingProfiler:
+    """
+    Samples the Python stack of every thread each interval seconds from a background
+    thread, via sys._current_frames(), and counts identical stacks.
+
+    Nothing is hooked into the profiled code, so it can be started and stopped in a
+    running process; a sample is only taken when the sampler thread gets the GIL, so
+    code in long C calls that hold it is attributed to the line that made the call.
+    """
+
+    def __init__(self, interval: float = PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = Counter()
+        self.started_at = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def start(self):
+        if self.running:
+            return
+        self.samples.clear()
+        self.started_at = time.time()
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        if not self.running:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                self.samples[";".join(reversed(stack))] += 1
+
+    def dump(self, path=None) -> Path:
+        """
+        Write the samples in the folded stack format of flamegraph.pl and speedscope, one
+        "thread;outer;...;inner count" line per stack, and the stage timers next to it.
+
+        Returns:
+            Path: The folded stack file.
+        """
+        if path is None:
+            path = PROFILE_DIR / f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S', time.localtime(self.started_at))}.folded"
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write(f"{stack} {count}\n")
+        with open(path.with_suffix(".stages.json"), "w") as file:
+            json.dump(stage_stats(), file, indent=2)
+        return path
+
+
+PROFILER = SamplingProfiler()
+
+
+def toggle_profiler(signum=None, frame=None):
+    """
+    Start the sampling profiler, or stop it and dump what it sampled. The handler of
+    SIGUSR1 once install_profiler() has run.
+    """
+    if PROFILER.running:
+        PROFILER.stop()
+        path = PROFILER.dump()
+        logger.info(f"Sampling profiler stopped, {sum(PROFILER.samples.values())} samples written to {path}")
+    else:
+        PROFILER.start()
+        logger.info(f"Sampling profiler started in process {os.getpid()}, every {PROFILER.interval * 1000:.0f} ms; send SIGUSR1 again to stop and dump it")
+
+
+def install_profiler(signum=signal.SIGUSR1):
+    """
+    Let `kill -USR1 <pid>` start and stop the sampling profiler of this process. Must be
+    called from the main thread; the handler runs once the main thread is back in Python,
+    e.g. after the current consume() or poll() returns.
+
+    With PROFILE_SAMPLING=1 the profiler also starts right away and is dumped at exit.
+    """
+    signal.signal(signum, toggle_profiler)
+    if SAMPLING_AT_START and not PROFILER.running:
+        toggle_profiler()
+        atexit.register(_dump_at_exit)
+
+
+def _dump_at_exit():
+    if PROFILER.running:
+        toggle_profiler()
+
+
+def log_stage_stats(log=logger):
+    if STAGES_ENABLED:
+        log.info(f"Stage timers: {stage_stats()}")
@@ -0,0 +1,315 @@
+import json
+import struct
+from array import array
+from pathlib import Path
+
+import pyarrow as pa
+
+from avro_decoder import AvroDecoder
+from profiling import timed
+
+
+AVRO_PRIMITIVES = {
+    "string": pa.string(),
+    "int": pa.int32(),
+    "long": pa.int64(),
+    "float": pa.float32(),
+    "double": pa.float64(),
+    "boolean": pa.bool_(),
+    "bytes": pa.binary(),
+}
+
+LOCAL_SCHEMA_PATH = Path(__file__).parent.parent.joinpath('producer', 'Schema')
+
+
+def avro_to_arrow_type(avro_type):
+    """
+    Map an Avro type (as parsed from JSON) to the matching Arrow type.
+
+    Records become structs, arrays become lists and ["x", "null"] unions become a
+    nullable x. Other unions are not used by the event schema and are rejected.
+    """
+    if isinstance(avro_type, str):
+        if avro_type not in AVRO_PRIMITIVES:
+            raise ValueError(f"Unsupported Avro type: {avro_type}")
+        return AVRO_PRIMITIVES[avro_type]
+
+    if isinstance(avro_type, list):
+        non_null = [t for t in avro_type if t != "null"]
+        if len(non_null) != 1:
+            raise ValueError(f"Only nullable unions are supported, got: {avro_type}")
+        return avro_to_arrow_type(non_null[0])
+
+    kind = avro_type["type"]
+    if kind == "record":
+        return pa.struct([avro_field_to_arrow(field) for field in avro_type["fields"]])
+    if kind == "array":
+        return pa.list_(avro_to_arrow_type(avro_type["items"]))
+    return avro_to_arrow_type(kind)
+
+
+def avro_field_to_arrow(field) -> pa.Field:
+    nullable = isinstance(field["type"], list) and "null" in field["type"]
+    return pa.field(field["name"], avro_to_arrow_type(field["type"]), nullable=nullable)
+
+
+def arrow_schema_from_avro(avro_schema) -> pa.Schema:
+    """
+    Build the Arrow schema of a top-level Avro record, given as a JSON string or parsed dict.
+    """
+    if isinstance(avro_schema, str):
+        avro_schema = json.loads(avro_schema)
+    return pa.schema([avro_field_to_arrow(field) for field in avro_schema["fields"]])
+
+
+def load_local_arrow_schema(schema_folder: Path = LOCAL_SCHEMA_PATH) -> pa.Schema:
+    """
+    Arrow schema of the latest .avsc file in the producer Schema folder.
+    """
+    schema_files = sorted(schema_folder.glob('*.avsc'), key=lambda x: int(x.stem[1:]), reverse=True)
+    with open(schema_files[0], 'r') as file:
+        return arrow_schema_from_avro(file.read())
+
+
+def read_long(data, pos):
+    """
+    Read a zigzag varint, Avro's encoding of int and long.
+
+    Returns:
+        tuple: The value and the position after it.
+    """
+    byte = data[pos]
+    pos += 1
+    value = byte & 0x7F
+    shift = 7
+    while byte & 0x80:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        shift += 7
+    return (value >> 1) ^ -(value & 1), pos
+
+
+class ValueBuilder:
+    """
+    Collects the values of one int, long, float, double or boolean column.
+    """
+
+    def __init__(self, arrow_type: pa.DataType, avro_type: str):
+        self.arrow_type = arrow_type
+        self.values = []
+        self.read = {
+            "int": self.read_varint,
+            "long": self.read_varint,
+            "float": self.read_float,
+            "double": self.read_double,
+            "boolean": self.read_boolean,
+        }[avro_type]
+
+    def read_varint(self, data, pos):
+        value, pos = read_long(data, pos)
+        self.values.append(value)
+        return pos
+
+    def read_float(self, data, pos):
+        self.values.append(struct.unpack_from('<f', data, pos)[0])
+        return pos + 4
+
+    def read_double(self, data, pos):
+        self.values.append(struct.unpack_from('<d', data, pos)[0])
+        return pos + 8
+
+    def read_boolean(self, data, pos):
+        self.values.append(data[pos] != 0)
+        return pos + 1
+
+    def append_null(self):
+        self.values.append(None)
+
+    def finish(self) -> pa.Array:
+        return pa.array(self.values, type=self.arrow_type)
+
+
+class BinaryBuilder:
+    """
+    Collects a string or bytes column into Arrow's offsets and data buffers, without
+    creating a Python object per value.
+    """
+
+    def __init__(self, arrow_type: pa.DataType):
+        self.arrow_type = arrow_type
+        self.offsets = array('i', [0])
+        self.data = bytearray()
+        self.valid = None
+
+    def read(self, data, pos):
+        size, pos = read_long(data, pos)
+        end = pos + size
+        self.data += data[pos:end]
+        self.offsets.append(len(self.data))
+        if self.valid is not None:
+            self.valid.append(True)
+        return end
+
+    def append_null(self):
+        if self.valid is None:
+            self.valid = [True] * (len(self.offsets) - 1)
+        self.valid.append(False)
+        self.offsets.append(len(self.data))
+
+    def finish(self) -> pa.Array:
+        validity = None if self.valid is None else pa.array(self.valid, pa.bool_()).buffers()[1]
+        return pa.Array.from_buffers(
+            self.arrow_type, len(self.offsets) - 1, [validity, pa.py_buffer(self.offsets), pa.py_buffer(self.data)]
+        )
+
+
+class NullableBuilder:
+    """
+    Reads a ["x", "null"] union into the builder of x.
+    """
+
+    def __init__(self, builder, null_index: int):
+        self.builder = builder
+        self.null_index = null_index
+
+    def read(self, data, pos):
+        index, pos = read_long(data, pos)
+        if index == self.null_index:
+            self.builder.append_null()
+            return pos
+        return self.builder.read(data, pos)
+
+    def finish(self) -> pa.Array:
+        return self.builder.finish()
+
+
+class RecordBuilder:
+    """
+    Reads an Avro record into one child builder per field.
+    """
+
+    def __init__(self, fields, children):
+        self.fields = fields
+        self.children = children
+        self.readers = [child.read for child in children]
+
+    def read(self, data, pos):
+        for read in self.readers:
+            pos = read(data, pos)
+        return pos
+
+    def finish(self) -> pa.Array:
+        return pa.StructArray.from_arrays([child.finish() for child in self.children], fields=self.fields)
+
+
+class ListBuilder:
+    """
+    Reads an Avro array's blocks into list offsets and the builder of its items.
+    """
+
+    def __init__(self, arrow_type: pa.DataType, items):
+        self.arrow_type = arrow_type
+        self.items = items
+        self.read_item = items.read
+        self.offsets = array('i', [0])
+        self.length = 0
+
+    def read(self, data, pos):
+        read_item = self.read_item
+        count, pos = read_long(data, pos)
+        while count:
+            if count < 0:
+                # a negative count is followed by the block's size in bytes
+                count = -count
+                _, pos = read_long(data, pos)
+            for _ in range(count):
+                pos = read_item(data, pos)
+            self.length += count
+            count, pos = read_long(data, pos)
+        self.offsets.append(self.length)
+        return pos
+
+    def finish(self) -> pa.Array:
+        offsets = pa.Array.from_buffers(pa.int32(), len(self.offsets), [None, pa.py_buffer(self.offsets)])
+        return pa.ListArray.from_arrays(offsets, self.items.finish(), type=self.arrow_type)
+
+
+def column_builder(avro_type, arrow_type: pa.DataType):
+    """
+    Builder that reads values of avro_type into an Arrow array of arrow_type, the type
+    avro_to_arrow_type() maps it to.
+    """
+    if isinstance(avro_type, list):
+        non_null = [t for t in avro_type if t != "null"][0]
+        return NullableBuilder(column_builder(non_null, arrow_type), avro_type.index("null"))
+    if isinstance(avro_type, dict):
+        kind = avro_type["type"]
+        if kind == "record":
+            return RecordBuilder(
+                list(arrow_type),
+                [column_builder(field["type"], arrow_field.type) for field, arrow_field in zip(avro_type["fields"], arrow_type)],
+            )
+        if kind == "array":
+            return ListBuilder(arrow_type, column_builder(avro_type["items"], arrow_type.value_type))
+        return column_builder(kind, arrow_type)
+    if avro_type in ("string", "bytes"):
+        return BinaryBuilder(arrow_type)
+    return ValueBuilder(arrow_type, avro_type)
+
+
+class ArrowBatchDecoder:
+    """
+    Decodes batches of Confluent wire-format Avro payloads into Arrow RecordBatches.
+
+    Payloads are grouped by writer schema id; each group is read with its writer
+    schema straight into per-column builders, whose buffers become a RecordBatch with
+    the struct and list columns of that schema. No dict per message and no pandas
+    objects are created.
+    """
+
+    def __init__(self, decoder: AvroDecoder):
+        """
+        Args:
+            decoder (AvroDecoder): Provides the cached writer schemas.
+        """
+        self.decoder = decoder
+        self.arrow_schemas = {}
+        self.avro_schemas = {}
+
+    def arrow_schema(self, schema_id: int) -> pa.Schema:
+        schema = self.arrow_schemas.get(schema_id)
+        if schema is None:
+            schema = self.arrow_schemas[schema_id] = arrow_schema_from_avro(self.avro_schema(schema_id))
+        return schema
+
+    def avro_schema(self, schema_id: int) -> dict:
+        schema = self.avro_schemas.get(schema_id)
+        if schema is None:
+            schema = self.avro_schemas[schema_id] = json.loads(self.decoder.registry_client.get_schema(schema_id).schema_str)
+        return schema
+
+    @timed("consumer.decode_batch")
+    def decode_batch(self, payloads) -> list:
+        """
+        Decode a list of payloads.
+
+        Returns:
+            list: One pa.RecordBatch per writer schema id, in order of first appearance.
+        """
+        groups = {}
+        for payload in payloads:
+            groups.setdefault(self.decoder.schema_id(payload), []).append(payload)
+
+        batches = []
+        header_size = AvroDecoder.HEADER.size
+        for schema_id, group in groups.items():
+            schema = self.arrow_schema(schema_id)
+            # builders hold one batch's columns, a new set per batch
+            builder = column_builder(self.avro_schema(schema_id), pa.struct(list(schema)))
+            read = builder.read
+            for payload in group:
+                read(payload, header_size)
+            batches.append(pa.RecordBatch.from_struct_array(builder.finish()))
+
+        return batches
@@ -0,0 +1,81 @@
+import io
+import json
+import struct
+import threading
+
+from cachetools import LRUCache
+from confluent_kafka.serialization import SerializationError
+from fastavro import parse_schema, schemaless_reader
+
+from profiling import timed
+
+
+class AvroDecoder:
+    """
+    Decodes Confluent wire-format Avro payloads with the schema they were written with.
+
+    Each payload starts with a magic byte and the 4-byte big-endian id of the
+    writer schema in the Schema Registry. Writer schemas are fetched and parsed
+    once per id and kept in a bounded LRU cache, which is safe to share between
+    decode threads.
+    """
+
+    MAGIC_BYTE = 0
+    HEADER = struct.Struct('>bI')
+
+    def __init__(self, registry_client, cache_size: int = 64):
+        """
+        Args:
+            registry_client (SchemaRegistryClient): Client used to fetch schemas by id.
+            cache_size (int): Maximum number of parsed writer schemas kept in memory.
+        """
+        self.registry_client = registry_client
+        self.schemas = LRUCache(maxsize=cache_size)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def schema_id(cls, payload: bytes) -> int:
+        """
+        Read the writer schema id from the wire-format header of a payload.
+        """
+        if payload is None or len(payload) < cls.HEADER.size:
+            raise SerializationError("Message is too small to contain a schema id")
+        magic, schema_id = cls.HEADER.unpack_from(payload)
+        if magic != cls.MAGIC_BYTE:
+            raise SerializationError(f"Unexpected magic byte {magic}, message was not produced with the Confluent Avro serializer")
+        return schema_id
+
+    def writer_schema(self, schema_id: int):
+        """
+        Return the parsed writer schema for schema_id, fetching it from the registry on a cache miss.
+        """
+        with self._lock:
+            schema = self.schemas.get(schema_id)
+            if schema is not None:
+                self.hits += 1
+                return schema
+
+            self.misses += 1
+            registered = self.registry_client.get_schema(schema_id)
+            schema = parse_schema(json.loads(registered.schema_str))
+            self.schemas[schema_id] = schema
+            return schema
+
+    @timed("consumer.decode")
+    def decode(self, payload: bytes) -> dict:
+        """
+        Decode one wire-format payload into a dictionary.
+        """
+        schema = self.writer_schema(self.schema_id(payload))
+        buffer = io.BytesIO(payload)
+        buffer.seek(self.HEADER.size)
+        return schemaless_reader(buffer, schema)
+
+    def stats(self) -> dict:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "cached_schemas": len(self.schemas),
+        }
@@ -0,0 +1,69 @@
+import time
+
+
+class BatchBuffer:
+    """
+    Accumulates decoded records until a row, byte or age threshold is reached.
+
+    Whichever threshold is hit first triggers a flush, which keeps output files
+    at a predictable size under high ingest rates while bounding how long a
+    record can wait in memory under low ones.
+    """
+
+    def __init__(self, max_rows: int = 100000, max_bytes: int = 64 * 1024 * 1024, max_age: float = 60.0):
+        """
+        Args:
+            max_rows (int): Flush once this many records are buffered.
+            max_bytes (int): Flush once the buffered payloads add up to this many bytes.
+            max_age (float): Flush once the oldest buffered record is this many seconds old.
+        """
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.records = []
+        self.rows = 0
+        self.size = 0
+        self.first_append = None
+
+    def __len__(self):
+        return self.rows
+
+    def append(self, record, size: int, rows: int = 1):
+        """
+        Add a decoded record, or a batch of rows such as an Arrow RecordBatch.
+
+        Args:
+            record: The decoded record or batch.
+            size (int): Encoded payload size in bytes.
+            rows (int): Number of events the record holds.
+        """
+        if self.first_append is None:
+            self.first_append = time.monotonic()
+        self.records.append(record)
+        self.rows += rows
+        self.size += size
+
+    def flush_reason(self):
+        """
+        Return which threshold was reached ('rows', 'bytes' or 'age'), or None.
+        """
+        if not self.records:
+            return None
+        if self.rows >= self.max_rows:
+            return 'rows'
+        if self.size >= self.max_bytes:
+            return 'bytes'
+        if time.monotonic() - self.first_append >= self.max_age:
+            return 'age'
+        return None
+
+    def drain(self) -> list:
+        """
+        Return the buffered records and reset the buffer.
+        """
+        records = self.records
+        self.records = []
+        self.rows = 0
+        self.size = 0
+        self.first_append = None
+        return records
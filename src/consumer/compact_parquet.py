@@ -0,0 +1,222 @@
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+# profiling.py, which the writers time their stages with, is shared with the producer
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+from custom_logging import CustomLogger
+from manifest import SIDECAR_PREFIX, SIDECAR_SUFFIX, normalize_timestamps, sidecar_path
+from savejson import RollingParquetWriter, SaveJson
+
+
+logger = CustomLogger(__name__)
+
+
+def plan_directory(directory: Path, target_file_size, small_file_size, min_files=2):
+    """
+    Group the small Parquet files of one directory into bins of about target_file_size bytes.
+
+    Files are taken oldest first so each bin covers a contiguous stretch of time.
+
+    Returns:
+        list: Bins, each a list of (path, size). Empty if there is nothing worth compacting.
+    """
+    files = []
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.endswith(".parquet") and not entry.name.startswith("."):
+            stat = entry.stat()
+            if stat.st_size < small_file_size:
+                files.append((stat.st_mtime, Path(entry.path), stat.st_size))
+    files.sort()
+
+    bins = []
+    current = []
+    current_size = 0
+    for _, path, size in files:
+        if current and current_size + size > target_file_size:
+            bins.append(current)
+            current = []
+            current_size = 0
+        current.append((path, size))
+        current_size += size
+    if current:
+        bins.append(current)
+
+    return [files_bin for files_bin in bins if len(files_bin) >= min_files]
+
+
+def read_bin(files_bin, sort_by=None):
+    """
+    Read the files of a bin into one table, unifying their schemas and optionally sorting it.
+    """
+    tables = []
+    for path, _ in files_bin:
+        # ParquetFile rather than read_table, which would add the hive directory names as columns
+        table = pq.ParquetFile(path).read().replace_schema_metadata(None)
+        # event_id is required since schema v2, files written with v1 have nulls for it once merged
+        tables.append(table.cast(pyarrow.schema([field.with_nullable(True) for field in table.schema])))
+    table = pyarrow.concat_tables(tables, promote_options="default")
+    if sort_by:
+        columns = [column for column in sort_by if column in table.column_names]
+        if columns:
+            # the producer writes unpadded timestamps such as 2024-3-7T4:5:9, which sort wrong as strings
+            keys = pyarrow.table({
+                column: normalize_timestamps(table.column(column)) if column == "timestamp" else table.column(column)
+                for column in columns
+            })
+            table = table.take(pc.sort_indices(keys, [(column, "ascending") for column in columns]))
+    return table
+
+
+def remove_file(path: Path):
+    # the Parquet file first: a sidecar without its file is ignored, a file without its sidecar is not
+    for name in (path, sidecar_path(path)):
+        try:
+            os.remove(name)
+        except FileNotFoundError:
+            pass
+
+
+def finish_interrupted(directory: Path) -> int:
+    """
+    Remove the sources of compacted files in directory that are still there, left by a
+    run that stopped between publishing a merged file and removing its sources.
+
+    Returns:
+        int: Number of source files removed.
+    """
+    removed = 0
+    for entry in os.scandir(directory):
+        if not (entry.name.startswith(SIDECAR_PREFIX) and entry.name.endswith(f".parquet{SIDECAR_SUFFIX}")):
+            continue
+        # the sidecar is written before its file is published, only trust it once the file exists
+        if not (directory / entry.name[len(SIDECAR_PREFIX):-len(SIDECAR_SUFFIX)]).exists():
+            continue
+        with open(entry.path) as file:
+            sources = json.load(file).get("sources", [])
+        for name in sources:
+            if (directory / name).exists():
+                remove_file(directory / name)
+                removed += 1
+    return removed
+
+
+def compact_directory(directory: Path, bins, sort_by=None, writer_options=None):
+    """
+    Replace the files of every bin with one compacted file.
+
+    The merged file is written like any consumer file, to a hidden temporary file that is
+    renamed into the directory with its manifest sidecar, and only then are the files it
+    replaces removed. Published files are never written to again, so this is safe while a
+    consumer writes to the same directory: its temporary files are not touched. The
+    merged file's sidecar names its sources, and every reader leaves out the sources of
+    a merged file it lists (manifest.read_manifest() and the parquet_events() dbt macro),
+    so no listing of the directory holds the merged rows twice.
+
+    Returns:
+        int: Bytes of the compacted files.
+    """
+    written = 0
+    for files_bin in bins:
+        writer = RollingParquetWriter(directory=directory, **(writer_options or {}))
+        try:
+            writer.write(read_bin(files_bin, sort_by))
+            # lets incremental loaders tell the merged rows from new ones, and finish_interrupted() find them
+            writer.stats.sources = [path.name for path, _ in files_bin]
+            path = writer.close()
+        except BaseException:
+            writer.abort()
+            raise
+        written += path.stat().st_size
+        for source, _ in files_bin:
+            remove_file(source)
+    return written
+
+
+def compact(root, target_file_size=128 * 1024 * 1024, small_file_size=None, sort_by=None, dry_run=False, writer_options=None):
+    """
+    Compact the small Parquet files in root and every directory below it, directory by
+    directory, so files of different partitions are never merged.
+
+    Returns:
+        dict: files_before, bytes_before, files_after and bytes_after over all directories.
+            In a dry run bytes_after is estimated as the input size.
+    """
+    small_file_size = small_file_size or target_file_size // 2
+    report = {"files_before": 0, "bytes_before": 0, "files_after": 0, "bytes_after": 0}
+
+    for directory, dirnames, _ in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith(".")]
+        directory = Path(directory)
+        if not dry_run:
+            removed = finish_interrupted(directory)
+            if removed:
+                logger.warning(f"{directory}: removed {removed} files an interrupted run had already merged")
+        # listed here rather than by os.walk, the consumer may have published files since
+        parquet_files = [name for name in os.listdir(directory) if name.endswith(".parquet") and not name.startswith(".")]
+        files = len(parquet_files)
+        size = sum((directory / name).stat().st_size for name in parquet_files)
+        report["files_before"] += files
+        report["bytes_before"] += size
+
+        bins = plan_directory(directory, target_file_size, small_file_size)
+        if not bins:
+            report["files_after"] += files
+            report["bytes_after"] += size
+            continue
+
+        replaced_files = sum(len(files_bin) for files_bin in bins)
+        replaced_bytes = sum(size for files_bin in bins for _, size in files_bin)
+        if dry_run:
+            logger.info(f"[dry run] {directory}: would merge {replaced_files} files ({replaced_bytes:,} bytes) into {len(bins)}")
+            report["files_after"] += files - replaced_files + len(bins)
+            report["bytes_after"] += size
+            continue
+
+        written = compact_directory(directory, bins, sort_by, writer_options)
+        logger.info(f"{directory}: merged {replaced_files} files ({replaced_bytes:,} bytes) into {len(bins)} ({written:,} bytes)")
+        report["files_after"] += files - replaced_files + len(bins)
+        report["bytes_after"] += size - replaced_bytes + written
+
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Merge small Parquet files into large ones, one directory (partition) at a time.")
+    parser.add_argument("directory", nargs="?", default=None, help="directory to compact, defaults to parquet_data/data")
+    parser.add_argument("--target-file-size", type=int, default=128 * 1024 * 1024, help="bytes of input merged into one file")
+    parser.add_argument("--small-file-size", type=int, default=None, help="only files below this size are merged, defaults to half the target")
+    parser.add_argument("--sort", action="store_true", help="sort merged files by user_id and zero padded timestamp for tighter min/max statistics")
+    parser.add_argument("--dry-run", action="store_true", help="only report what would be merged")
+    parser.add_argument("--compression", default="snappy", help="Parquet codec of the merged files")
+    parser.add_argument("--compression-level", type=int, default=None, help="codec specific compression level")
+    parser.add_argument("--row-group-size", type=int, default=None, help="max rows per row group")
+    args = parser.parse_args()
+
+    report = compact(
+        args.directory or SaveJson.get_data_dir(),
+        target_file_size=args.target_file_size,
+        small_file_size=args.small_file_size,
+        sort_by=["user_id", "timestamp"] if args.sort else None,
+        dry_run=args.dry_run,
+        writer_options={
+            "compression": args.compression,
+            "compression_level": args.compression_level,
+            "row_group_size": args.row_group_size,
+        },
+    )
+    logger.info(
+        f"{'[dry run] ' if args.dry_run else ''}files: {report['files_before']} -> {report['files_after']}, "
+        f"bytes: {report['bytes_before']:,} -> {report['bytes_after']:,}"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,20 @@
-from confluent_kafka import Consumer
-from confluent_kafka.schema_registry import SchemaRegistryClient
-from confluent_kafka.schema_registry.avro import AvroDeserializer
-from confluent_kafka.serialization import StringDeserializer, SerializationContext, MessageField
+import logging
+import time
+from pathlib import Path
 
-from savejson import SaveJson
+from confluent_kafka import Consumer, TopicPartition
+from confluent_kafka.schema_registry import SchemaRegistryClient
 
-from typing import Tuple
+from arrow_decoder import ArrowBatchDecoder
+from avro_decoder import AvroDecoder
+from batch_buffer import BatchBuffer
+from dedup import Deduplicator
+from metrics import ConsumerMetrics, start_http_server
+from pipeline import ConsumerPipeline
+from profiling import log_stage_stats, stage
+from savejson import NormalizedParquetWriter, PartitionedParquetWriter, RollingParquetWriter, SaveJson
 
-from custom_logging import CustomLogger
+from custom_logging import AggregatedLog, CustomLogger
 
 
 class KafkaConsumer: 
@@ -17,77 +24,286 @@ class KafkaConsumer:
     CONSUMER_CONFIG = {
         'bootstrap.servers': KAFKA_BROKER,
         'auto.offset.reset': 'earliest',
-        'enable.auto.commit': True,
-        'auto.commit.interval.ms': 5000,
+        # offsets are committed per partition once its Parquet file is durably written
+        'enable.auto.commit': False,
         'max.poll.interval.ms': 300000
     }
     KAFAK_TOPIC = "customer_events"
 
-    def __init__(self, config):
+    def __init__(self, config, batch_size=5000, poll_timeout=1.0, flush_rows=100000, flush_bytes=64 * 1024 * 1024, flush_age=60.0, columnar=False, decode_workers=0, queue_size=8,
+                 target_file_size=128 * 1024 * 1024, max_file_age=300.0, parquet_options=None, partitioned=False, max_open_files=64,
+                 normalized=False, dedup=False, dedup_capacity=1_000_000, dedup_error_rate=1e-6, metrics_port=None, stats_interval_ms=5000,
+                 schema_registry_url=None, output_dir=None):
+        """
+        Args:
+            config (dict): librdkafka settings merged over the defaults, e.g. group.id or bootstrap.servers.
+            batch_size (int): Maximum number of messages fetched per consume() call.
+            poll_timeout (float): Seconds consume() waits for messages.
+            flush_rows (int): Append a partition's buffer as a row group once it has this many events.
+            flush_bytes (int): Append a partition's buffer as a row group once its Avro payloads reach this size.
+            flush_age (float): Append a partition's buffer as a row group once its oldest event is this many seconds old.
+            columnar (bool): Buffer the raw Avro payloads and decode each flush straight into
+                Arrow record batches, instead of building dicts and normalizing them with pandas.
+            decode_workers (int): Run as a staged pipeline with this many decode threads and a
+                separate writer thread. 0 keeps polling, decoding and writing on one thread.
+            queue_size (int): Pipeline only. consume() batches waiting for the writer before
+                the assigned partitions are paused.
+            target_file_size (int): Close a partition's Parquet file and commit once it reaches this many bytes.
+            max_file_age (float): Close a partition's Parquet file and commit once it has been open this many
+                seconds. 0 closes a file after every flush.
+            parquet_options (dict): compression, compression_level, use_dictionary and row_group_size
+                passed to RollingParquetWriter.
+            partitioned (bool): Write a Hive layout, event_date=YYYY-MM-DD/event_type=.../, with the
+                partition of each event derived from its timestamp and event_type.
+            max_open_files (int): Partitioned or normalized only. Most files a Kafka partition keeps open; the least recently written is published before another is opened.
+            normalized (bool): Write the events and their user_action, recommendations and search_history
+                elements as four datasets linked by event_id under parquet_data/normalized. Combines with partitioned.
+            dedup (bool): Drop events whose event_id was already written, e.g. after producer retries or redelivery.
+            dedup_capacity (int): Dedup only. Event ids per Bloom filter generation; at least this many
+                recent ids are remembered.
+            dedup_error_rate (float): Dedup only. Chance that an event older than the exact LRU window is
+                mistaken for a duplicate.
+            metrics_port (int): Serve Prometheus metrics on this port: throughput, batch sizes, flush
+                durations, bytes written and, from librdkafka statistics, per-partition lag. None disables them.
+            stats_interval_ms (int): Metrics only. How often librdkafka reports its statistics.
+            schema_registry_url (str): Schema registry the writer schemas are fetched from, defaults to http://schema-registry:8081.
+            output_dir (str): Directory the Parquet files are written under, defaults to parquet_data/data,
+                or parquet_data/normalized when normalized.
+        """
         self.logger = CustomLogger(__name__)
+        self.consumed_log = AggregatedLog(self.logger, "Consumed {count} messages in the last {seconds:.1f} s", level=logging.DEBUG)
+        self.batch_size = batch_size
+        self.poll_timeout = poll_timeout
+        self.flush_thresholds = {"max_rows": flush_rows, "max_bytes": flush_bytes, "max_age": flush_age}
+        # one buffer per assigned partition, and the offset of the last message buffered for it
+        self.buffers = {}
+        self.last_offsets = {}
+        # one open Parquet file per partition, and the offset of the last message written to it
+        self.writer_options = {"target_file_size": target_file_size, "max_file_age": max_file_age} | (parquet_options or {})
+        if normalized:
+            self.writer_class = NormalizedParquetWriter
+            self.writer_options |= {"partitioned": partitioned, "max_open_files": max_open_files}
+        elif partitioned:
+            self.writer_class = PartitionedParquetWriter
+            self.writer_options["max_open_files"] = max_open_files
+        else:
+            self.writer_class = RollingParquetWriter
+        if output_dir is not None:
+            self.writer_options["directory"] = output_dir
+        self.writers = {}
+        self.written_offsets = {}
+        self.dedup = Deduplicator(capacity=dedup_capacity, error_rate=dedup_error_rate) if dedup else None
         # config = config | {
         #     "key.deserializer": StringDeserializer('utf_8'),
         #     "value.deserializer": self.get_arvo_deserializer()
         # }
-        self.config = config | KafkaConsumer.CONSUMER_CONFIG
+        self.config = KafkaConsumer.CONSUMER_CONFIG | config
+        self.metrics = None
+        if metrics_port is not None:
+            self.metrics = ConsumerMetrics(self.KAFAK_TOPIC)
+            self.config |= {"statistics.interval.ms": stats_interval_ms, "stats_cb": self.metrics.client_stats}
+            start_http_server(metrics_port)
+        self.schema_registry_url = schema_registry_url or KafkaConsumer.SCHEMA_REISTRY_URL
+        self.decoder = AvroDecoder(self.get_schema_registry_client())
+        self.columnar = columnar
+        self.arrow_decoder = ArrowBatchDecoder(self.decoder)
+        self.pipeline = ConsumerPipeline(self, decode_workers=decode_workers, queue_size=queue_size) if decode_workers > 0 else None
         self.logger.info(f"Kafka consumer config: {self.config}")
         self.consumer = Consumer(self.config)
-        self.consumer.subscribe([self.KAFAK_TOPIC], on_assign=self.on_assign)
+        self.consumer.subscribe([self.KAFAK_TOPIC], on_assign=self.on_assign, on_revoke=self.on_revoke, on_lost=self.on_lost)
         self.logger.info(f"Kafka consumer created and subscribed to topic: {self.KAFAK_TOPIC}")
 
     def on_assign(self, consumer, partitions):
         self.logger.info(f"Partitions assigned: {partitions}")
-        
 
-    def get_schema_from_registry(self) -> Tuple[SchemaRegistryClient, str]:
-        registry_client = SchemaRegistryClient({
-            'url': KafkaConsumer.SCHEMA_REISTRY_URL
+    def on_revoke(self, consumer, partitions):
+        # write and commit what we hold before another consumer takes over
+        self.logger.info(f"Partitions revoked: {partitions}")
+        if self.pipeline is not None and self.pipeline.running:
+            # the writer thread owns the buffers, it flushes them once earlier batches are written
+            self.pipeline.revoke(partitions)
+            return
+        for tp in partitions:
+            self.release_partition(tp.partition)
+
+    def on_lost(self, consumer, partitions):
+        # the partitions may already belong to another consumer, so nothing can be committed
+        self.logger.error(f"Partitions lost: {partitions}, dropping their uncommitted buffers and files")
+        if self.pipeline is not None and self.pipeline.running:
+            # the writer thread owns the buffers and files, it drops them once earlier batches are written
+            self.pipeline.lose(partitions)
+            return
+        self.drop_partitions(partitions)
+
+    def drop_partitions(self, partitions):
+        for tp in partitions:
+            self.buffers.pop(tp.partition, None)
+            self.last_offsets.pop(tp.partition, None)
+            writer = self.writers.pop(tp.partition, None)
+            if writer is not None:
+                writer.abort()
+            self.written_offsets.pop(tp.partition, None)
+        if self.dedup is not None:
+            # the aborted events were marked seen and would be dropped when they are consumed again
+            self.dedup.reset()
+
+    def get_schema_registry_client(self) -> SchemaRegistryClient:
+        return SchemaRegistryClient({
+            'url': self.schema_registry_url
         })
-        latest_schema = registry_client.get_latest_version(self.KAFAK_TOPIC + '-value')
-        return (registry_client, latest_schema.schema.schema_str)
-    
-    def get_arvo_deserializer(self):
-        registry_client, schema_str = self.get_schema_from_registry()
-        return AvroDeserializer(
-            registry_client,
-            schema_str
-        )
+
+    def buffer_for(self, partition) -> BatchBuffer:
+        buffer = self.buffers.get(partition)
+        if buffer is None:
+            buffer = self.buffers[partition] = BatchBuffer(**self.flush_thresholds)
+        return buffer
+
+    def open_partitions(self) -> list:
+        return list(self.buffers.keys() | self.writers.keys())
+
+    def flush_partition(self, partition, reason):
+        """
+        Append the partition's buffered events to its open Parquet file as a row group.
+
+        The file is closed and the offset committed once the file is due to roll, or
+        when the reason is 'revoke' or 'shutdown'. The commit only happens after the
+        file is on disk, so after a crash the consumer resumes from the first event
+        that is not in a published file.
+        """
+        buffer = self.buffers.get(partition)
+        if buffer is not None and len(buffer) > 0:
+            rows = len(buffer)
+            started = time.perf_counter()
+            records = buffer.drain()
+            self.logger.info(f"Flushing {rows} events of partition {partition} to parquet, reason: {reason}")
+            if self.columnar:
+                # the pipeline buffers record batches decoded by its workers, the single thread loop raw payloads
+                batches = records if self.pipeline is not None else self.arrow_decoder.decode_batch(records)
+                table = SaveJson.batches_to_table(batches)
+            else:
+                table = SaveJson.to_table(records)
+
+            if self.dedup is not None:
+                table = self.dedup.filter_table(table)
+                if table.num_rows < rows:
+                    self.logger.info(f"Dropped {rows - table.num_rows} duplicate events of partition {partition}")
+                    if self.metrics is not None:
+                        self.metrics.duplicates.inc(rows - table.num_rows)
+
+            writer = self.writers.get(partition)
+            if writer is None:
+                writer = self.writers[partition] = self.writer_class(**self.writer_options)
+            # a flush of only duplicates writes nothing, but its offsets still count as written
+            with stage("consumer.parquet_write"):
+                if table.num_rows > 0 and not writer.write(table):
+                    # a column appeared or changed type, the open file cannot take it
+                    self.close_file(partition, 'schema')
+                    writer.write(table)
+            self.written_offsets[partition] = self.last_offsets.pop(partition)
+            if self.metrics is not None:
+                self.metrics.flush_rows.observe(rows)
+                self.metrics.flush_duration.observe(time.perf_counter() - started)
+
+        writer = self.writers.get(partition)
+        if writer is None:
+            return
+        roll = reason if reason in ('revoke', 'shutdown') else writer.roll_reason()
+        if roll is not None:
+            self.close_file(partition, roll)
+
+    def close_file(self, partition, reason):
+        """
+        Publish the partition's open Parquet file and commit the offset after its last event.
+        """
+        writer = self.writers.get(partition)
+        if writer is None or not writer.is_open():
+            return
+        rows = writer.rows
+        with stage("consumer.parquet_close"):
+            closed = writer.close()
+        if isinstance(closed, list):
+            self.logger.info(f"Closed {len(closed)} partition files with {rows} events of partition {partition}, reason: {reason}")
+        else:
+            self.logger.info(f"Closed {closed} with {rows} events of partition {partition}, reason: {reason}")
+        if self.metrics is not None:
+            paths = closed if isinstance(closed, list) else [closed]
+            self.metrics.files_written.inc(len(paths))
+            self.metrics.bytes_written.inc(sum(Path(path).stat().st_size for path in paths))
+
+        written = self.written_offsets.pop(partition, None)
+        if written is None:
+            # interrupted between writing a flush and recording its offset, nothing new is safe to commit
+            return
+        next_offset = written + 1
+        with stage("consumer.commit"):
+            self.consumer.commit(offsets=[TopicPartition(self.KAFAK_TOPIC, partition, next_offset)], asynchronous=False)
+        self.logger.info(f"Committed partition {partition} at offset {next_offset}")
+
+    def release_partition(self, partition):
+        # write and commit everything of a partition that is handed to another consumer
+        self.flush_partition(partition, 'revoke')
+        self.buffers.pop(partition, None)
+        self.writers.pop(partition, None)
+
+    def flush_expired(self):
+        for partition in self.open_partitions():
+            buffer = self.buffers.get(partition)
+            writer = self.writers.get(partition)
+            reason = (buffer.flush_reason() if buffer is not None else None) or (writer.roll_reason() if writer is not None else None)
+            if reason is not None:
+                self.flush_partition(partition, reason)
+
+    def buffered(self):
+        return sum(len(buffer) for buffer in self.buffers.values())
 
     def start_consuming(self):
         try:
-            intermidate_data = []
-            count = 0
             self.logger.info("Starting Kafka consumer...")
+            if self.pipeline is not None:
+                # runs until interrupted, with decoding and writing on their own threads
+                return self.pipeline.run()
             while True:
-                self.logger.info("Waiting for messages...")
-                msg = self.consumer.consume(num_messages=5, timeout=1)
+                with stage("consumer.poll"):
+                    msg = self.consumer.consume(num_messages=self.batch_size, timeout=self.poll_timeout)
                 if len(msg) == 0:
-                    self.logger.info("No messages received.")
-                    continue
-                if any([x.error() is not None for x in msg]):
-                    print([x.error() for x in msg])
-                    self.logger.info('error found in message.')
-                    continue
-                context = SerializationContext(self.KAFAK_TOPIC, MessageField.VALUE)
-                message_value = [self.get_arvo_deserializer()(x.value(), context) for x in msg]
-                # print(message_value[0])
-                intermidate_data.append(message_value[0])
-
-                print(f'Message consumed. Count reach to -> {count}')
-
-                if count == 1200:
-                    SaveJson.save_as_parquet(intermidate_data)
-                    # reset values 
-                    intermidate_data.clear()
-                    count = 0
-
-                count = count + 1
+                    self.logger.debug("No messages received.")
+
+                errors = 0
+                for x in msg:
+                    if x.error() is not None:
+                        errors += 1
+                        self.logger.error(f"error found in message: {x.error()}")
+                        continue
+                    value = x.value()
+                    partition = x.partition()
+                    buffer = self.buffer_for(partition)
+                    buffer.append(value if self.columnar else self.decoder.decode(value), len(value))
+                    self.last_offsets[partition] = x.offset()
+                    reason = buffer.flush_reason()
+                    if reason is not None:
+                        self.flush_partition(partition, reason)
+
+                if msg:
+                    self.consumed_log.add(len(msg) - errors)
+                    if self.metrics is not None:
+                        self.metrics.consumed.inc(len(msg) - errors)
+                        self.metrics.batch_size.observe(len(msg))
+
+                # checked on empty polls too, so max age bounds latency when traffic stops
+                self.flush_expired()
         except KeyboardInterrupt:
-            SaveJson.save_as_parquet(intermidate_data)
+            # the pipeline has already drained its writer when run() returns
+            for partition in self.open_partitions():
+                self.flush_partition(partition, 'shutdown')
             self.logger.info("saving intermidate data to parquet file.")
             self.logger.info("Stopping Kafka consumer...")
         except Exception as e:
             self.logger.error(f"Error consuming messages: {e.__str__()}")
             raise Exception(f"Error consuming messages: {e}")
         finally:
+            self.consumed_log.flush()
+            log_stage_stats(self.logger)
+            self.logger.info(f"Schema cache stats: {self.decoder.stats()}")
+            if self.dedup is not None:
+                self.logger.info(f"Dedup stats: {self.dedup.stats()}")
             self.consumer.close()
\ No newline at end of file
@@ -0,0 +1,145 @@
+import hashlib
+import math
+from collections import OrderedDict
+
+import numpy as np
+import pyarrow
+
+
+def hash_ids(ids) -> np.ndarray:
+    """
+    Hash event ids to an (n, 2) array of 64 bit values, the two hashes a Bloom filter derives its positions from.
+    """
+    digests = b"".join(hashlib.blake2b(event_id.encode(), digest_size=16).digest() for event_id in ids)
+    return np.frombuffer(digests, dtype=np.uint64).reshape(-1, 2)
+
+
+class BloomFilter:
+    """
+    Fixed size Bloom filter. Never misses an added key, and reports a key that was not
+    added with a probability of about error_rate once capacity keys are in.
+
+    Works on whole batches of hashes at a time with numpy, so checking a flush of
+    events costs one Python call instead of one per bit.
+    """
+
+    def __init__(self, capacity: int, error_rate: float):
+        self.capacity = capacity
+        self.bits = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = np.zeros((self.bits + 7) // 8, dtype=np.uint8)
+        self.count = 0
+
+    def _positions(self, hashes: np.ndarray) -> np.ndarray:
+        # double hashing: position i of a key is h1 + i * h2, wrapping at 64 bits
+        steps = np.arange(self.hashes, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            return (hashes[:, :1] + steps * (hashes[:, 1:] | np.uint64(1))) % np.uint64(self.bits)
+
+    def contains(self, hashes: np.ndarray) -> np.ndarray:
+        """
+        Return a bool array, True where the key may have been added.
+        """
+        positions = self._positions(hashes)
+        return ((self.array[positions >> np.uint64(3)] >> (positions & np.uint64(7)).astype(np.uint8)) & 1).all(axis=1)
+
+    def add(self, hashes: np.ndarray):
+        positions = self._positions(hashes).ravel()
+        np.bitwise_or.at(self.array, positions >> np.uint64(3), np.left_shift(1, positions & np.uint64(7)).astype(np.uint8))
+        self.count += len(hashes)
+
+
+class Deduplicator:
+    """
+    Drops events whose event_id was seen recently, in bounded memory.
+
+    Recent ids are kept exactly in an LRU. Older ids are remembered by two Bloom
+    filter generations: ids go into the current one, and once it holds capacity ids
+    it becomes the previous one and a new current one is started. So every id is
+    remembered for at least capacity further ids, and memory stays at two filters
+    and the LRU however long the consumer runs.
+
+    A Bloom filter can mistake a new id for a seen one, so an id that is not in the
+    LRU is dropped with a probability of up to twice error_rate. Events without an
+    event_id, e.g. written with schema v1, are never dropped.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, error_rate: float = 1e-6, recent: int = 100_000):
+        """
+        Args:
+            capacity (int): Ids per Bloom filter generation.
+            error_rate (float): False positive rate of a full generation.
+            recent (int): Ids kept exactly in the LRU.
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_recent = recent
+        self.recent = OrderedDict()
+        self.current = BloomFilter(capacity, error_rate)
+        self.previous = None
+        self.rotations = 0
+        self.checked = 0
+        self.duplicates = 0
+
+    def check(self, ids: list) -> list:
+        """
+        Record a batch of event ids and return, for each one, whether to keep it: False
+        for an id seen before, in an earlier batch or earlier in this one.
+        """
+        hashes = hash_ids(event_id or "" for event_id in ids)
+        maybe_seen = self.current.contains(hashes)
+        if self.previous is not None:
+            maybe_seen |= self.previous.contains(hashes)
+
+        keep = []
+        new = []
+        for i, event_id in enumerate(ids):
+            if not event_id:
+                keep.append(True)
+                continue
+            if event_id in self.recent:
+                self.recent.move_to_end(event_id)
+                keep.append(False)
+                continue
+            self.recent[event_id] = None
+            if len(self.recent) > self.max_recent:
+                self.recent.popitem(last=False)
+            keep.append(not maybe_seen[i])
+            new.append(i)
+
+        self.checked += len(ids)
+        self.duplicates += keep.count(False)
+        if new:
+            self.current.add(hashes[new])
+        if self.current.count >= self.capacity:
+            self.previous = self.current
+            self.current = BloomFilter(self.capacity, self.error_rate)
+            self.rotations += 1
+        return keep
+
+    def filter_table(self, table):
+        """
+        Remove the rows of a table whose event_id was seen before, including repeats within the table.
+        """
+        if "event_id" not in table.column_names:
+            return table
+        keep = self.check(table.column("event_id").to_pylist())
+        if all(keep):
+            return table
+        return table.filter(pyarrow.array(keep, pyarrow.bool_()))
+
+    def reset(self):
+        """
+        Forget every id, e.g. after events that were marked seen could not be written.
+        """
+        self.recent.clear()
+        self.current = BloomFilter(self.capacity, self.error_rate)
+        self.previous = None
+
+    def stats(self) -> dict:
+        return {
+            "checked": self.checked,
+            "duplicates": self.duplicates,
+            "rotations": self.rotations,
+            "bloom_bytes": self.current.array.nbytes * 2,
+        }
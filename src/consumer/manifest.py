@@ -0,0 +1,245 @@
+import argparse
+import json
+import os
+from collections import Counter
+from pathlib import Path
+
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+from custom_logging import CustomLogger
+
+
+logger = CustomLogger(__name__)
+
+# "_" keeps sidecars out of pyarrow datasets, Spark and Hive, which skip such files
+SIDECAR_PREFIX = '_'
+SIDECAR_SUFFIX = '.json'
+STATS_COLUMNS = ['timestamp', 'user_id', 'event_type']
+
+
+def sidecar_path(path) -> Path:
+    """
+    Return the manifest sidecar of a Parquet file, e.g. data/_<uuid>.parquet.json.
+    """
+    path = Path(path)
+    return path.with_name(f'{SIDECAR_PREFIX}{path.name}{SIDECAR_SUFFIX}')
+
+
+def normalize_timestamps(column):
+    """
+    Zero pad producer timestamps such as 2024-3-7T4:5:9 to 2024-03-07T04:05:09, so that
+    they sort and compare as strings. Unparseable values are null.
+    """
+    parts = pc.extract_regex(
+        column,
+        r'^(?P<year>\d{1,4})-(?P<month>\d{1,2})-(?P<day>\d{1,2})(?:T(?P<hour>\d{1,2}):(?P<minute>\d{1,2}):(?P<second>\d{1,2}))?'
+    )
+
+    def padded(field, width):
+        return pc.utf8_lpad(pc.fill_null(pc.struct_field(parts, field), '0'), width=width, padding='0')
+
+    date = pc.binary_join_element_wise(padded('year', 4), padded('month', 2), padded('day', 2), '-')
+    time = pc.binary_join_element_wise(padded('hour', 2), padded('minute', 2), padded('second', 2), ':')
+    timestamps = pc.binary_join_element_wise(date, time, 'T')
+    # fill_null above would turn an unparseable value into 0000-00-00T00:00:00
+    return pc.if_else(pc.is_null(pc.struct_field(parts, 'year')), pyarrow.scalar(None, pyarrow.string()), timestamps)
+
+
+class FileStats:
+    """
+    Running statistics of the rows written to one Parquet file.
+    """
+
+    def __init__(self):
+        self.rows = 0
+        self.min_timestamp = None
+        self.max_timestamp = None
+        self.min_user_id = None
+        self.max_user_id = None
+        self.event_types = Counter()
+        # names of the files a compacted file replaced
+        self.sources = []
+
+    @staticmethod
+    def _min(current, value):
+        return value if current is None or (value is not None and value < current) else current
+
+    @staticmethod
+    def _max(current, value):
+        return value if current is None or (value is not None and value > current) else current
+
+    def add(self, table):
+        self.rows += table.num_rows
+        if 'timestamp' in table.column_names:
+            bounds = pc.min_max(normalize_timestamps(table.column('timestamp'))).as_py()
+            self.min_timestamp = self._min(self.min_timestamp, bounds['min'])
+            self.max_timestamp = self._max(self.max_timestamp, bounds['max'])
+        if 'user_id' in table.column_names:
+            bounds = pc.min_max(table.column('user_id')).as_py()
+            self.min_user_id = self._min(self.min_user_id, bounds['min'])
+            self.max_user_id = self._max(self.max_user_id, bounds['max'])
+        if 'event_type' in table.column_names:
+            for count in pc.value_counts(table.column('event_type')).to_pylist():
+                if count['values'] is not None:
+                    self.event_types[count['values']] += count['counts']
+
+    def to_dict(self, path, size) -> dict:
+        entry = {
+            "file": Path(path).name,
+            "rows": self.rows,
+            "bytes": size,
+            "min_timestamp": self.min_timestamp,
+            "max_timestamp": self.max_timestamp,
+            "min_user_id": self.min_user_id,
+            "max_user_id": self.max_user_id,
+            "event_types": dict(self.event_types),
+        }
+        if self.sources:
+            entry["sources"] = self.sources
+        return entry
+
+
+def write_sidecar(path, stats: FileStats, size):
+    """
+    Durably write the sidecar of the Parquet file that is about to be published at path.
+
+    The sidecar is written before the Parquet file is renamed into place, so a
+    published file always has one. A sidecar whose file does not exist is ignored.
+    """
+    sidecar = sidecar_path(path)
+    tmp_path = sidecar.with_name(f'.{sidecar.name}.tmp')
+    with open(tmp_path, 'w') as file:
+        json.dump(stats.to_dict(path, size), file)
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(tmp_path, sidecar)
+
+
+def read_manifest(root) -> list:
+    """
+    Read the sidecars of every published Parquet file under root.
+
+    Returns:
+        list: Sidecar dicts with "path" set to the Parquet file. Files without a sidecar
+            get an entry with only "path", which never prunes them. Files listed under
+            "sources" by a compacted file in the same listing are left out: compaction
+            publishes the merged file before it removes them.
+    """
+    entries = []
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        names = set(filenames)
+        directory_entries = []
+        for name in filenames:
+            if not name.endswith('.parquet') or name.startswith(('.', SIDECAR_PREFIX)):
+                continue
+            path = Path(directory) / name
+            sidecar = sidecar_path(path)
+            entry = {}
+            if sidecar.name in names:
+                try:
+                    with open(sidecar) as file:
+                        entry = json.load(file)
+                except FileNotFoundError:
+                    # removed with its file since the directory was listed
+                    continue
+            entry["path"] = str(path)
+            directory_entries.append(entry)
+        # the listing may hold a merged file and the sources compaction has not removed yet
+        superseded = {source for entry in directory_entries for source in entry.get("sources", [])}
+        entries.extend(entry for entry in directory_entries if Path(entry["path"]).name not in superseded)
+    return entries
+
+
+def may_contain(entry, user_id=None, start=None, end=None, event_type=None) -> bool:
+    """
+    Return False only if the entry's statistics prove the file has no matching event.
+
+    start and end are inclusive bounds compared with the zero padded timestamps,
+    so a date such as 2024-03-07 covers the whole day as an end bound when given
+    as 2024-03-07T23:59:59.
+    """
+    if "rows" not in entry:
+        return True
+    if user_id is not None and entry["min_user_id"] is not None:
+        if not entry["min_user_id"] <= user_id <= entry["max_user_id"]:
+            return False
+    if start is not None and entry["max_timestamp"] is not None and entry["max_timestamp"] < start:
+        return False
+    if end is not None and entry["min_timestamp"] is not None and entry["min_timestamp"] > end:
+        return False
+    # the child datasets of a normalized consumer have no event_type column and record none
+    if event_type is not None and entry["event_types"] and event_type not in entry["event_types"]:
+        return False
+    return True
+
+
+def prune(root, **filters) -> list:
+    """
+    Return the paths of the Parquet files under root that may hold events matching
+    the filters of may_contain(), without opening any Parquet file.
+    """
+    return [entry["path"] for entry in read_manifest(root) if may_contain(entry, **filters)]
+
+
+def rebuild(root) -> int:
+    """
+    Regenerate the sidecar of every Parquet file under root from the file itself.
+
+    The old sidecars are only read for the "sources" of compacted files, which the file
+    alone does not tell; a sidecar that cannot be parsed is overwritten without them.
+
+    Returns:
+        int: Number of sidecars written.
+    """
+    written = 0
+    for directory, dirnames, filenames in os.walk(root):
+        dirnames[:] = [name for name in dirnames if not name.startswith('.')]
+        for name in filenames:
+            if not name.endswith('.parquet') or name.startswith(('.', SIDECAR_PREFIX)):
+                continue
+            path = Path(directory) / name
+            parquet_file = pq.ParquetFile(path)
+            columns = [column for column in STATS_COLUMNS if column in parquet_file.schema_arrow.names]
+            stats = FileStats()
+            try:
+                with open(sidecar_path(path)) as file:
+                    stats.sources = json.load(file).get("sources", [])
+            except FileNotFoundError:
+                pass
+            except (json.JSONDecodeError, UnicodeDecodeError, AttributeError) as e:
+                logger.warning(f"Overwriting the unreadable sidecar of {path}, dropping any sources it listed: {e}")
+            for batch in parquet_file.iter_batches(columns=columns):
+                stats.add(pyarrow.Table.from_batches([batch]))
+            write_sidecar(path, stats, path.stat().st_size)
+            written += 1
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Rebuild or query the per-file manifest of the Parquet output.")
+    parser.add_argument("command", choices=["rebuild", "files"], help="rebuild the sidecars, or list the files that may match the filters")
+    parser.add_argument("directory", nargs="?", default=None, help="defaults to parquet_data/data")
+    parser.add_argument("--user-id", default=None)
+    parser.add_argument("--start", default=None, help="earliest timestamp, e.g. 2024-03-07 or 2024-03-07T10:00:00")
+    parser.add_argument("--end", default=None, help="latest timestamp, e.g. 2024-03-07T23:59:59")
+    parser.add_argument("--event-type", default=None)
+    args = parser.parse_args()
+
+    root = args.directory or (Path(__file__) / "./../../../").resolve().joinpath('parquet_data/data')
+    if args.command == "rebuild":
+        logger.info(f"Rebuilt {rebuild(root)} sidecars under {root}")
+        return
+
+    entries = read_manifest(root)
+    files = [entry["path"] for entry in entries
+             if may_contain(entry, user_id=args.user_id, start=args.start, end=args.end, event_type=args.event_type)]
+    for path in files:
+        print(path)
+    logger.info(f"{len(files)} of {len(entries)} files may match")
+
+
+if __name__ == "__main__":
+    main()
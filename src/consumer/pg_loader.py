@@ -0,0 +1,302 @@
+import argparse
+import os
+import sys
+from pathlib import Path
+
+import psycopg
+import pyarrow
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+from psycopg import sql
+from psycopg.types.json import Jsonb
+
+# profiling.py, which the decoders and writers time their stages with, is shared with the producer
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
+from arrow_decoder import load_local_arrow_schema
+from custom_logging import CustomLogger
+from manifest import normalize_timestamps, read_manifest
+from savejson import SaveJson
+
+
+logger = CustomLogger(__name__)
+
+# the dev_pg target of dbt/src/profiles.yml
+DEFAULT_DSN = "host=localhost port=5432 dbname=testDB user=user password=test"
+
+PG_TYPES = {
+    pyarrow.string(): "text",
+    pyarrow.int32(): "integer",
+    pyarrow.int64(): "bigint",
+    pyarrow.float32(): "real",
+    pyarrow.float64(): "double precision",
+    pyarrow.bool_(): "boolean",
+    pyarrow.binary(): "bytea",
+}
+
+# string columns of the event schema that hold producer timestamps, loaded as timestamptz
+TIMESTAMP_COLUMNS = {"timestamp"}
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def pg_type(arrow_type) -> str:
+    """
+    Map an Arrow type to a Postgres type. Lists of primitives become arrays, structs
+    and lists of structs (user_action, recommendations, search_history) become jsonb.
+    """
+    if pyarrow.types.is_list(arrow_type) and arrow_type.value_type in PG_TYPES:
+        return PG_TYPES[arrow_type.value_type] + "[]"
+    if pyarrow.types.is_list(arrow_type) or pyarrow.types.is_struct(arrow_type):
+        return "jsonb"
+    if arrow_type not in PG_TYPES:
+        raise ValueError(f"No Postgres type for Arrow type {arrow_type}")
+    return PG_TYPES[arrow_type]
+
+
+def flatten_fields(schema, prefix="") -> list:
+    """
+    Flatten the struct fields of an Arrow schema into the parent.child columns the
+    consumer writes. Lists are kept whole.
+
+    Returns:
+        list: (parquet column name, Arrow type) pairs.
+    """
+    columns = []
+    for field in schema:
+        name = f"{prefix}{field.name}"
+        if pyarrow.types.is_struct(field.type):
+            columns.extend(flatten_fields(field.type, f"{name}."))
+        else:
+            columns.append((name, field.type))
+    return columns
+
+
+def parse_timestamps(column):
+    """
+    Parse producer timestamps such as 2024-3-7T4:5:9 into UTC timestamps; the producer
+    writes them without an offset. Unparseable values and impossible dates such as
+    2024-2-31 are null, as try_strptime makes them in the DuckDB staging models.
+    """
+    normalized = normalize_timestamps(column)
+    timestamps = pc.strptime(normalized, format=TIMESTAMP_FORMAT, unit="s", error_is_null=True)
+    # strptime rolls 2024-02-31 over into March, formatting it back tells them apart
+    valid = pc.equal(pc.strftime(timestamps, format=TIMESTAMP_FORMAT), normalized)
+    timestamps = pc.if_else(valid, timestamps, pyarrow.scalar(None, timestamps.type))
+    return pc.assume_timezone(timestamps, "UTC")
+
+
+class LoadColumn:
+    """
+    One column of the target table, fed from the Parquet column of the same flattened name.
+    """
+
+    def __init__(self, parquet_name, arrow_type):
+        self.parquet_name = parquet_name
+        self.arrow_type = arrow_type
+        # device.type -> device_type
+        self.name = parquet_name.replace(".", "_")
+        self.pg_type = "timestamptz" if parquet_name in TIMESTAMP_COLUMNS else pg_type(arrow_type)
+
+    def values(self, table) -> list:
+        """
+        Python values of this column in a table, NULL where the file does not have it.
+        """
+        if self.parquet_name not in table.column_names:
+            return [None] * table.num_rows
+        column = table.column(self.parquet_name)
+        if self.pg_type == "jsonb":
+            return [None if value is None else Jsonb(value) for value in column.to_pylist()]
+        if column.type != self.arrow_type:
+            # pandas written files have int64 where the Avro schema says int, and null columns
+            column = pc.cast(column, self.arrow_type)
+        if self.pg_type == "timestamptz":
+            column = parse_timestamps(column)
+        return column.to_pylist()
+
+
+class PostgresLoader:
+    """
+    Loads the consumer's Parquet files into a typed Postgres table with binary COPY.
+
+    Files are streamed one record batch at a time, so memory is bounded by a row
+    group and a batch regardless of the size of the dataset. Every loaded file is
+    recorded in a loaded_files table in the same transaction as its rows, so each
+    run only loads the files that appeared since the last one, and a run that fails
+    halfway leaves no partial file behind.
+    """
+
+    def __init__(self, conn, schema="raw", table="events", batch_size=10000, arrow_schema=None):
+        """
+        Args:
+            conn (psycopg.Connection): Connection the tables are created and loaded through.
+            schema (str): Postgres schema of the events and loaded_files tables.
+            table (str): Name of the events table.
+            batch_size (int): Rows read from Parquet and sent to COPY at a time.
+            arrow_schema (pyarrow.Schema): Event schema the table columns are derived from,
+                defaults to the latest producer Avro schema.
+        """
+        self.conn = conn
+        self.batch_size = batch_size
+        self.columns = [LoadColumn(name, arrow_type) for name, arrow_type in flatten_fields(arrow_schema or load_local_arrow_schema())]
+        self.table_name = table
+        self.schema = sql.Identifier(schema)
+        self.table = sql.Identifier(schema, table)
+        self.files_table = sql.Identifier(schema, "loaded_files")
+        self.copy_statement = sql.SQL("COPY {} ({}) FROM STDIN (FORMAT BINARY)").format(
+            self.table, sql.SQL(", ").join(sql.Identifier(name) for name in self.column_names())
+        )
+
+    def column_names(self) -> list:
+        return [column.name for column in self.columns] + ["source_file_name"]
+
+    def create_tables(self):
+        """
+        Create the schema and tables, and add the columns of newer event schemas to an existing table.
+        """
+        with self.conn.transaction():
+            self.conn.execute(sql.SQL("CREATE SCHEMA IF NOT EXISTS {}").format(self.schema))
+            self.conn.execute(sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} (source_file_name text NOT NULL, loaded_at timestamptz NOT NULL DEFAULT now())"
+            ).format(self.table))
+            for column in self.columns:
+                self.conn.execute(sql.SQL("ALTER TABLE {} ADD COLUMN IF NOT EXISTS {} {}").format(
+                    self.table, sql.Identifier(column.name), sql.SQL(column.pg_type)
+                ))
+            self.conn.execute(sql.SQL("CREATE INDEX IF NOT EXISTS {} ON {} (source_file_name)").format(
+                sql.Identifier(f"{self.table_name}_source_file_name_idx"), self.table
+            ))
+            self.conn.execute(sql.SQL(
+                "CREATE TABLE IF NOT EXISTS {} ("
+                "file_name text PRIMARY KEY, path text NOT NULL, rows bigint, bytes bigint, "
+                "sources text[] NOT NULL DEFAULT '{{}}', loaded_at timestamptz NOT NULL DEFAULT now())"
+            ).format(self.files_table))
+
+    def loaded_files(self) -> set:
+        return {row[0] for row in self.conn.execute(sql.SQL("SELECT file_name FROM {}").format(self.files_table))}
+
+    def copy_batches(self, batches, file_name) -> int:
+        """
+        COPY record batches as the rows of one file.
+
+        Events without an event_id, e.g. written with schema v1, get the one the normalized
+        writer and the DuckDB staging models compute, from the timestamp as the producer wrote it.
+
+        Returns:
+            int: Rows copied.
+        """
+        pg_types = [column.pg_type for column in self.columns] + ["text"]
+        rows = 0
+        with self.conn.cursor() as cursor:
+            with cursor.copy(self.copy_statement) as copy:
+                copy.set_types(pg_types)
+                for batch in batches:
+                    table = SaveJson.fill_event_ids(pyarrow.Table.from_batches([batch]))
+                    values = [column.values(table) for column in self.columns]
+                    values.append([file_name] * table.num_rows)
+                    for row in zip(*values):
+                        copy.write_row(row)
+                    rows += table.num_rows
+        return rows
+
+    def copy_file(self, path, file_name) -> int:
+        """
+        COPY the rows of one Parquet file, one record batch at a time.
+
+        Returns:
+            int: Rows copied.
+        """
+        return self.copy_batches(pq.ParquetFile(path).iter_batches(batch_size=self.batch_size), file_name)
+
+    def load_file(self, entry) -> int:
+        """
+        Load one Parquet file and record it in loaded_files, in one transaction.
+
+        A compacted file lists the files it replaced in its sidecar as "sources". If all
+        of them are loaded, the file is only recorded; otherwise the rows of its sources
+        are deleted and the whole file is loaded in their place.
+
+        Returns:
+            int: Rows copied, None if another loader recorded the file first.
+        """
+        path = Path(entry["path"])
+        sources = entry.get("sources", [])
+        with self.conn.transaction():
+            # claims the file; a concurrent run blocks here and skips it once this one commits
+            claimed = self.conn.execute(sql.SQL(
+                "INSERT INTO {} (file_name, path, bytes, sources) VALUES (%s, %s, %s, %s) ON CONFLICT DO NOTHING RETURNING file_name"
+            ).format(self.files_table), (path.name, str(path), path.stat().st_size, sources)).fetchone()
+            if claimed is None:
+                return None
+
+            if sources:
+                loaded = self.conn.execute(sql.SQL("SELECT count(*) FROM {} WHERE file_name = ANY(%s)").format(self.files_table), (sources,)).fetchone()[0]
+                if loaded == len(sources):
+                    logger.info(f"{path.name} replaces {len(sources)} files that are already loaded, recorded without loading")
+                    return 0
+                # sources may themselves be compacted files that were only recorded, so follow them down
+                deleted = self.conn.execute(sql.SQL(
+                    "WITH RECURSIVE replaced(file_name) AS ("
+                    " SELECT unnest(%s::text[])"
+                    " UNION SELECT unnest(f.sources) FROM {files} f JOIN replaced r USING (file_name)"
+                    ") DELETE FROM {table} WHERE source_file_name IN (SELECT file_name FROM replaced)"
+                ).format(files=self.files_table, table=self.table), (sources,)).rowcount
+                logger.info(f"{path.name} replaces {len(sources)} files, {loaded} of them loaded; deleted their {deleted} rows")
+
+            rows = self.copy_file(path, path.name)
+            self.conn.execute(sql.SQL("UPDATE {} SET rows = %s WHERE file_name = %s").format(self.files_table), (rows, path.name))
+        return rows
+
+    def load(self, root) -> dict:
+        """
+        Load every Parquet file under root that is not in loaded_files yet.
+
+        Files that fail to load are rolled back, logged and retried on the next run.
+
+        Returns:
+            dict: files and rows loaded, files skipped as already loaded, and files failed.
+        """
+        self.create_tables()
+        loaded = self.loaded_files()
+        report = {"files": 0, "rows": 0, "skipped": 0, "failed": 0}
+        for entry in sorted(read_manifest(root), key=lambda entry: entry["path"]):
+            if Path(entry["path"]).name in loaded:
+                report["skipped"] += 1
+                continue
+            try:
+                rows = self.load_file(entry)
+            except (psycopg.Error, pyarrow.ArrowException, OSError) as e:
+                logger.error(f"Failed to load {entry['path']}: {e}")
+                report["failed"] += 1
+                continue
+            if rows is None:
+                report["skipped"] += 1
+                continue
+            logger.info(f"Loaded {rows} rows from {entry['path']}")
+            report["files"] += 1
+            report["rows"] += rows
+        return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Incrementally load the consumer's Parquet files into a typed Postgres table.")
+    parser.add_argument("directory", nargs="?", default=None, help="defaults to parquet_data/data")
+    parser.add_argument("--dsn", default=os.environ.get("PG_DSN", DEFAULT_DSN), help="libpq connection string, defaults to $PG_DSN or the dev_pg dbt target")
+    parser.add_argument("--schema", default="raw")
+    parser.add_argument("--table", default="events")
+    parser.add_argument("--batch-size", type=int, default=10000, help="rows read and copied at a time")
+    args = parser.parse_args()
+
+    root = args.directory or SaveJson.get_data_dir()
+    with psycopg.connect(args.dsn, autocommit=True) as conn:
+        loader = PostgresLoader(conn, schema=args.schema, table=args.table, batch_size=args.batch_size)
+        report = loader.load(root)
+    logger.info(
+        f"Loaded {report['rows']} rows from {report['files']} files into {args.schema}.{args.table}, "
+        f"{report['skipped']} already loaded, {report['failed']} failed"
+    )
+    if report["failed"]:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+from custom_logging import CustomLogger
+from profiling import stage
+
+
+class StageTimer:
+    """
+    Counts items and busy seconds of one pipeline stage. Safe to update from several threads.
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.items = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, items: int, seconds: float):
+        with self._lock:
+            self.calls += 1
+            self.items += items
+            self.seconds += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "items": self.items,
+                "seconds": round(self.seconds, 3),
+            }
+
+
+class PartitionRevoke:
+    """
+    Marker sent down the write queue when partitions are revoked.
+
+    The writer flushes and commits the partitions once every batch polled before
+    the revoke has been written, then sets done.
+    """
+
+    def __init__(self, partitions):
+        self.partitions = partitions
+        self.done = threading.Event()
+
+
+class PartitionLost(PartitionRevoke):
+    """
+    Marker sent down the write queue when partitions are lost. The writer drops their
+    buffers and open files without committing, then sets done.
+    """
+
+
+class ConsumerPipeline:
+    """
+    Runs a KafkaConsumer as three stages connected by a bounded queue:
+
+        poll (calling thread) -> decode (thread pool) -> write (writer thread)
+
+    The poll stage submits every consume() batch to the decode pool and puts the
+    resulting future on the write queue, so the writer sees batches in poll order
+    even though they are decoded concurrently. The writer owns the per-partition
+    buffers and does the Parquet encoding, the durable write and the offset commit.
+
+    When the write queue reaches queue_size, the assigned partitions are paused
+    instead of letting decoded batches pile up in memory. consume() keeps being
+    called while paused, so rebalances are served and max.poll.interval.ms is not
+    exceeded, and the partitions are resumed once the queue drains to resume_size.
+    """
+
+    def __init__(self, kafka_consumer, decode_workers: int = 4, queue_size: int = 8, resume_size: int = None, stats_interval: float = 30.0):
+        """
+        Args:
+            kafka_consumer (KafkaConsumer): Provides the Kafka consumer, decoders, buffers and flush_partition().
+            decode_workers (int): Threads decoding Avro payloads.
+            queue_size (int): consume() batches allowed between the poll and write stages before partitions are paused.
+            resume_size (int): Queue depth at which paused partitions are resumed, defaults to half of queue_size.
+            stats_interval (float): Seconds between stage statistics log lines.
+        """
+        self.logger = CustomLogger(__name__)
+        self.kafka_consumer = kafka_consumer
+        self.decode_workers = decode_workers
+        self.queue_size = queue_size
+        self.resume_size = queue_size // 2 if resume_size is None else resume_size
+        self.stats_interval = stats_interval
+
+        # one slot more than the pause threshold, so a revoke marker never waits behind a full queue
+        self.write_queue = queue.Queue(maxsize=queue_size + 1)
+        self.executor = None
+        self.writer = None
+        self.writer_error = None
+        self.running = False
+        self.paused = False
+        self.pauses = 0
+
+        self.poll_timer = StageTimer()
+        self.decode_timer = StageTimer()
+        self.write_timer = StageTimer()
+        self.flush_timer = StageTimer()
+
+    def start(self):
+        self.executor = ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="consumer-decode")
+        self.writer = threading.Thread(target=self._write_loop, name="consumer-writer", daemon=True)
+        self.running = True
+        self.writer.start()
+
+    def stop(self):
+        """
+        Let the writer finish every queued batch, flush all partitions and commit them.
+        """
+        if not self.running:
+            return
+        if self.writer.is_alive():
+            self.write_queue.put(None)
+        self.writer.join()
+        self.executor.shutdown()
+        self.running = False
+
+    def decode(self, messages) -> list:
+        """
+        Decode stage: turn one consume() batch into per-partition chunks.
+
+        Returns:
+            list: (partition, last_offset, records, size, rows) per partition, in poll order.
+                records are decoded dicts, or Arrow record batches in columnar mode.
+        """
+        started = time.perf_counter()
+        groups = {}
+        for message in messages:
+            group = groups.setdefault(message.partition(), [[], 0, None])
+            group[0].append(message.value())
+            group[1] += len(message.value())
+            group[2] = message.offset()
+
+        chunks = []
+        for partition, (payloads, size, last_offset) in groups.items():
+            if self.kafka_consumer.columnar:
+                records = self.kafka_consumer.arrow_decoder.decode_batch(payloads)
+            else:
+                records = [self.kafka_consumer.decoder.decode(payload) for payload in payloads]
+            chunks.append((partition, last_offset, records, size, len(payloads)))
+
+        self.decode_timer.add(len(messages), time.perf_counter() - started)
+        return chunks
+
+    def _write_loop(self):
+        consumer = self.kafka_consumer
+        try:
+            while True:
+                try:
+                    item = self.write_queue.get(timeout=consumer.poll_timeout)
+                except queue.Empty:
+                    # keeps max age flushes going while nothing is being polled
+                    self._flush()
+                    continue
+
+                if item is None:
+                    self._flush('shutdown')
+                    return
+
+                if isinstance(item, PartitionLost):
+                    consumer.drop_partitions(item.partitions)
+                    item.done.set()
+                    continue
+
+                if isinstance(item, PartitionRevoke):
+                    for tp in item.partitions:
+                        consumer.release_partition(tp.partition)
+                    item.done.set()
+                    continue
+
+                chunks = item.result()
+                started = time.perf_counter()
+                rows = 0
+                for partition, last_offset, records, size, count in chunks:
+                    buffer = consumer.buffer_for(partition)
+                    if consumer.columnar:
+                        for batch in records:
+                            buffer.append(batch, size * batch.num_rows // count, batch.num_rows)
+                    else:
+                        for record in records:
+                            buffer.append(record, size // count)
+                    consumer.last_offsets[partition] = last_offset
+                    rows += count
+                self.write_timer.add(rows, time.perf_counter() - started)
+                self._flush()
+        except Exception as e:
+            self.logger.error(f"Writer stage failed: {e}")
+            self.writer_error = e
+
+    def _flush(self, reason=None):
+        # flushes every partition for the given reason, or only those past a threshold
+        consumer = self.kafka_consumer
+        started = time.perf_counter()
+        flushed = len(consumer.last_offsets)
+        if reason is None:
+            consumer.flush_expired()
+        else:
+            for partition in consumer.open_partitions():
+                consumer.flush_partition(partition, reason)
+        flushed -= len(consumer.last_offsets)
+        if flushed:
+            self.flush_timer.add(flushed, time.perf_counter() - started)
+
+    def revoke(self, partitions):
+        """
+        Called from the rebalance callback on the poll thread. Blocks until the writer
+        has written and committed everything polled from the revoked partitions.
+        """
+        if not self.running or not self.writer.is_alive():
+            return
+        self._send_marker(PartitionRevoke(partitions))
+
+    def lose(self, partitions):
+        """
+        Called from the rebalance callback on the poll thread. Blocks until the writer
+        has dropped what it holds of the lost partitions.
+        """
+        if not self.running or not self.writer.is_alive():
+            return
+        self._send_marker(PartitionLost(partitions))
+
+    def _send_marker(self, marker):
+        self.write_queue.put(marker)
+        while not marker.done.wait(timeout=1.0):
+            if not self.writer.is_alive():
+                return
+
+    def apply_backpressure(self):
+        consumer = self.kafka_consumer.consumer
+        depth = self.write_queue.qsize()
+        if depth >= self.queue_size:
+            # repeated while above the threshold, so partitions assigned meanwhile are paused too
+            assignment = consumer.assignment()
+            if assignment:
+                consumer.pause(assignment)
+            if not self.paused:
+                self.paused = True
+                self.pauses += 1
+                self.logger.warning(f"Write queue full ({depth} batches), pausing {len(assignment)} partitions")
+        elif self.paused and depth <= self.resume_size:
+            consumer.resume(consumer.assignment())
+            self.paused = False
+            self.logger.info(f"Write queue drained to {depth} batches, resuming partitions")
+
+    def stats(self) -> dict:
+        return {
+            "write_queue": self.write_queue.qsize(),
+            "paused": self.paused,
+            "pauses": self.pauses,
+            "poll": self.poll_timer.stats(),
+            "decode": self.decode_timer.stats(),
+            "write": self.write_timer.stats(),
+            "flush": self.flush_timer.stats(),
+        }
+
+    def run(self):
+        """
+        Poll stage: runs on the calling thread until interrupted or the writer fails.
+        """
+        consumer = self.kafka_consumer
+        self.start()
+        last_stats = time.monotonic()
+        try:
+            while True:
+                if self.writer_error is not None:
+                    raise self.writer_error
+
+                self.apply_backpressure()
+                started = time.perf_counter()
+                # a short timeout while paused, so partitions resume soon after the writer catches up
+                timeout = min(consumer.poll_timeout, 0.1) if self.paused else consumer.poll_timeout
+                with stage("consumer.poll"):
+                    messages = consumer.consumer.consume(num_messages=consumer.batch_size, timeout=timeout)
+                valid = []
+                for message in messages:
+                    if message.error() is not None:
+                        self.logger.error(f"error found in message: {message.error()}")
+                        continue
+                    valid.append(message)
+                self.poll_timer.add(len(valid), time.perf_counter() - started)
+                if consumer.metrics is not None and messages:
+                    consumer.metrics.consumed.inc(len(valid))
+                    consumer.metrics.batch_size.observe(len(messages))
+
+                if valid:
+                    future: Future = self.executor.submit(self.decode, valid)
+                    self.write_queue.put(future)
+
+                now = time.monotonic()
+                if now - last_stats >= self.stats_interval:
+                    self.logger.info(f"Pipeline stats: {self.stats()}")
+                    last_stats = now
+        finally:
+            self.stop()
+            self.logger.info(f"Pipeline stats: {self.stats()}")
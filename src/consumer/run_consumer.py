@@ -1,12 +1,23 @@
+import argparse
+import sys
+from pathlib import Path
+
+# metrics.py and profiling.py are shared with the producer
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
 from consumer import KafkaConsumer
 from custom_logging import CustomLogger
+from profiling import install_profiler
 
 
-def main(id):
+def main(id, bootstrap_servers=None, **consumer_options):
     logger = CustomLogger(__name__)
     logger.info("Starting Kafka consumer...")
     try: 
-        consumer = KafkaConsumer(config={"group.id": id})
+        config = {"group.id": id}
+        if bootstrap_servers:
+            config["bootstrap.servers"] = bootstrap_servers
+        consumer = KafkaConsumer(config=config, **consumer_options)
         consumer.start_consuming()
     except Exception as e:
         logger.error(f"Error starting Kafka consumer: {e}")
@@ -14,5 +25,62 @@ def main(id):
 
 
 if __name__ == "__main__":
-    main(4)
+    parser = argparse.ArgumentParser(description="Consume customer events from Kafka into Parquet files.")
+    parser.add_argument("--group-id", default=4)
+    parser.add_argument("--batch-size", type=int, default=5000, help="max messages per consume() call")
+    parser.add_argument("--flush-rows", type=int, default=100000, help="events per row group")
+    parser.add_argument("--flush-bytes", type=int, default=64 * 1024 * 1024, help="buffered Avro bytes per row group")
+    parser.add_argument("--flush-age", type=float, default=60.0, help="max seconds an event waits before being written")
+    parser.add_argument("--target-file-size", type=int, default=128 * 1024 * 1024, help="bytes per Parquet file before rolling to a new one")
+    parser.add_argument("--max-file-age", type=float, default=300.0, help="seconds a Parquet file stays open before it is published and committed")
+    parser.add_argument("--compression", default="snappy", help="Parquet codec: snappy, zstd, gzip, lz4, brotli or none")
+    parser.add_argument("--compression-level", type=int, default=None, help="codec specific compression level")
+    parser.add_argument("--no-dictionary", action="store_true", help="disable dictionary encoding")
+    parser.add_argument("--partitioned", action="store_true", help="write event_date=YYYY-MM-DD/event_type=.../ directories")
+    parser.add_argument("--max-open-files", type=int, default=64, help="partition files a Kafka partition keeps open; the least recently written is published first")
+    parser.add_argument("--normalized", action="store_true", help="write events, user_actions, recommendations and search_history datasets")
+    parser.add_argument("--row-group-size", type=int, default=None, help="max rows per row group, defaults to one row group per flush")
+    parser.add_argument("--columnar", action="store_true", help="decode Avro straight to Arrow, skipping pandas")
+    parser.add_argument("--decode-workers", type=int, default=0, help="decode threads of the staged pipeline, 0 for a single thread loop")
+    parser.add_argument("--queue-size", type=int, default=8, help="batches waiting for the writer before partitions are paused")
+    parser.add_argument("--dedup", action="store_true", help="drop events whose event_id was already written")
+    parser.add_argument("--dedup-capacity", type=int, default=1_000_000, help="event ids per Bloom filter generation")
+    parser.add_argument("--dedup-error-rate", type=float, default=1e-6, help="false positive rate of a full Bloom filter generation")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics on this port, e.g. 9101")
+    parser.add_argument("--bootstrap-servers", default=None, help="overrides the default kafka:9092 broker")
+    parser.add_argument("--schema-registry-url", default=None, help="overrides the default http://schema-registry:8081 registry")
+    parser.add_argument("--output-dir", default=None, help="write the Parquet files here instead of parquet_data/")
+    args = parser.parse_args()
+
+    # kill -USR1 <pid> starts the sampling profiler, a second one dumps it
+    install_profiler()
+
+    main(
+        args.group_id,
+        bootstrap_servers=args.bootstrap_servers,
+        batch_size=args.batch_size,
+        flush_rows=args.flush_rows,
+        flush_bytes=args.flush_bytes,
+        flush_age=args.flush_age,
+        columnar=args.columnar,
+        decode_workers=args.decode_workers,
+        queue_size=args.queue_size,
+        target_file_size=args.target_file_size,
+        max_file_age=args.max_file_age,
+        partitioned=args.partitioned,
+        max_open_files=args.max_open_files,
+        normalized=args.normalized,
+        dedup=args.dedup,
+        dedup_capacity=args.dedup_capacity,
+        dedup_error_rate=args.dedup_error_rate,
+        metrics_port=args.metrics_port,
+        schema_registry_url=args.schema_registry_url,
+        output_dir=args.output_dir,
+        parquet_options={
+            "compression": args.compression,
+            "compression_level": args.compression_level,
+            "use_dictionary": not args.no_dictionary,
+            "row_group_size": args.row_group_size,
+        },
+    )
 
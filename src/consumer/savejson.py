@@ -1,37 +1,519 @@
 import pyarrow
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 
 import json
 import pandas as pd
 import os
 
+import hashlib
+import time
 import uuid
 
+import numpy as np
+
 from pathlib import Path
+from urllib.parse import quote
+
+from custom_logging import CustomLogger
+from manifest import FileStats, normalize_timestamps, write_sidecar
+from profiling import timed
+
+
+logger = CustomLogger(__name__)
 
 
 class SaveJson:
 
-    def save_as_parquet(data, path=None):
+    # value used by Hive, Spark and DuckDB for a partition column that is null
+    DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+    # child dataset of NormalizedParquetWriter -> the list column of the event it is split from
+    CHILD_DATASETS = {
+        'user_actions': 'user_action',
+        'recommendations': 'recommendations',
+        'search_history': 'search_history',
+    }
+
+    @timed("savejson.save_as_parquet")
+    def save_as_parquet(data, path=None, partitioned=False):
         """
         Save the data as a Parquet file.
+
+        With partitioned=True, path is the base directory and one file is written
+        per event_date/event_type partition found in the data.
         """
         # pd.set_option('display.width', None)
 
+        table = SaveJson.to_table(data)
+        if partitioned:
+            return SaveJson.write_partitioned(table, path)
+        data_folder_path = SaveJson.get_output_path(path)
+
+        logger.debug(f'Writing {table.num_rows} rows to {data_folder_path}')
+        SaveJson.write_durably(table, data_folder_path)
+
+    @timed("savejson.to_table")
+    def to_table(data):
+        """
+        Convert decoded events, or a DataFrame, into a flat Arrow table.
+        """
         if isinstance(data, list) and isinstance(data[0], dict):
             data = pd.json_normalize(data)
-        
+        return pyarrow.Table.from_pandas(data, preserve_index=False)
+
+    @timed("savejson.save_record_batches")
+    def save_record_batches(batches, path=None, flatten=True, partitioned=False):
+        """
+        Save Arrow record batches as a Parquet file without going through pandas.
+
+        Args:
+            batches (list): pyarrow.RecordBatch objects, e.g. from ArrowBatchDecoder.
+            path: Output file, defaults to a new uuid file under parquet_data/data.
+            flatten (bool): Expand struct columns into "parent.child" columns, the same
+                layout save_as_parquet produces with pd.json_normalize. List columns
+                keep their list<struct> type either way.
+            partitioned (bool): Treat path as the base directory and write one file per
+                event_date/event_type partition.
+        """
+        table = SaveJson.batches_to_table(batches, flatten)
+        if partitioned:
+            return SaveJson.write_partitioned(table, path)
+        data_folder_path = SaveJson.get_output_path(path)
+        logger.debug(f'Writing {table.num_rows} rows to {data_folder_path}')
+        SaveJson.write_durably(table, data_folder_path)
+
+    @timed("savejson.batches_to_table")
+    def batches_to_table(batches, flatten=True):
+        # batches decoded with different writer schemas are unified, missing columns become null
+        table = pyarrow.concat_tables(
+            [pyarrow.Table.from_batches([batch]) for batch in batches],
+            promote_options="default"
+        )
+        if flatten:
+            table = table.flatten()
+        return table
+
+    @timed("savejson.write_durably")
+    def write_durably(table, path):
+        """
+        Write a table so that, once this returns, the complete file is on disk under path.
+
+        The data goes to a hidden temporary file in the same directory, is fsynced,
+        and is renamed into place; the directory is fsynced so the rename itself
+        survives a crash. Readers never see a partially written file. The file's
+        manifest sidecar is written just before the rename.
+        """
+        path = Path(path)
+        tmp_path = path.with_name(f'.{path.name}.tmp')
+        with open(tmp_path, 'wb') as file:
+            pq.write_table(table, file)
+            file.flush()
+            os.fsync(file.fileno())
+            size = file.tell()
+        stats = FileStats()
+        stats.add(table)
+        write_sidecar(path, stats, size)
+        SaveJson.publish(tmp_path, path)
+
+    def publish(tmp_path, path):
+        """
+        Rename a fsynced temporary file into place and fsync the directory.
+        """
+        os.replace(tmp_path, path)
+
+        dir_fd = os.open(Path(path).parent, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
+
+    def write_partitioned(table, directory=None):
+        """
+        Write one file per partition under directory/event_date=.../event_type=.../.
+
+        Returns:
+            list: Paths of the written files.
+        """
+        paths = []
+        for partition_dir, part in SaveJson.split_partitions(table).items():
+            path = SaveJson.get_output_path(Path(directory or SaveJson.get_data_dir()) / partition_dir / f'{uuid.uuid4()}.parquet')
+            SaveJson.write_durably(part, path)
+            paths.append(path)
+        return paths
+
+    def event_dates(table):
+        """
+        Derive the zero padded YYYY-MM-DD date of every event from its timestamp column.
+
+        The producer writes timestamps such as 2024-3-7T4:05:09, so the date is read
+        with a pattern instead of a timestamp parser. Unparseable values are null.
+        """
+        return pc.utf8_slice_codeunits(normalize_timestamps(table.column('timestamp')), 0, 10)
+
+    def partition_dir(event_date, event_type):
+        # event types are free text in the schema, keep them safe as a directory name
+        return f'event_date={event_date}/event_type={quote(event_type, safe="")}'
+
+    def split_partitions(table):
+        """
+        Split a table by the event_date/event_type partition of each row, keeping the
+        row order inside each partition. Rows without a date or type go to DEFAULT_PARTITION.
+
+        Returns:
+            dict: Partition directory, e.g. "event_date=2024-03-07/event_type=search" -> table.
+        """
+        keys = pyarrow.table({
+            "event_date": pc.fill_null(SaveJson.event_dates(table), SaveJson.DEFAULT_PARTITION),
+            "event_type": pc.fill_null(table.column('event_type').cast(pyarrow.string()), SaveJson.DEFAULT_PARTITION),
+            "row": pyarrow.array(range(table.num_rows), pyarrow.int64()),
+        })
+        groups = keys.group_by(["event_date", "event_type"], use_threads=False).aggregate([("row", "list")])
+
+        partitions = {}
+        for event_date, event_type, rows in zip(groups.column("event_date").to_pylist(),
+                                                 groups.column("event_type").to_pylist(),
+                                                 groups.column("row_list")):
+            partitions[SaveJson.partition_dir(event_date, event_type)] = table.take(rows.values)
+        return partitions
+
+    def fill_event_ids(table):
+        """
+        Give events without an event_id, e.g. written with schema v1, the md5 of their
+        user_id, content.id and timestamp: the event_id the dbt staging models compute for them.
+        """
+        names = table.column_names
+        ids = table.column('event_id').to_pylist() if 'event_id' in names else [None] * table.num_rows
+        missing = [i for i, event_id in enumerate(ids) if not event_id]
+        if not missing:
+            return table
+        keys = [table.column(name).to_pylist() if name in names else [None] * table.num_rows
+                for name in ('user_id', 'content.id', 'timestamp')]
+        for i in missing:
+            key = '|'.join('' if values[i] is None else str(values[i]) for values in keys)
+            ids[i] = hashlib.md5(key.encode()).hexdigest()
+        column = pyarrow.array(ids, pyarrow.string())
+        if 'event_id' in names:
+            return table.set_column(names.index('event_id'), 'event_id', column)
+        return table.add_column(0, 'event_id', column)
+
+    @timed("savejson.normalize")
+    def normalize(table):
+        """
+        Split a flat events table into an events table without the nested lists, and one
+        table per list with a row per element: the event's event_id and user_id, the
+        1-based element_position of the element in its list, and the element's fields.
+
+        Returns:
+            dict: Dataset name -> table. Child datasets without rows are left out.
+        """
+        table = SaveJson.fill_event_ids(table)
+        lists = [column for column in SaveJson.CHILD_DATASETS.values() if column in table.column_names]
+        datasets = {'events': table.drop_columns(lists)}
+        for dataset, column in SaveJson.CHILD_DATASETS.items():
+            if column not in lists:
+                continue
+            values = table.column(column).combine_chunks()
+            elements = pc.list_flatten(values)
+            # a batch where every list is empty has no element type to build columns from
+            if len(elements) == 0 or not pyarrow.types.is_struct(elements.type):
+                continue
+            parents = pc.list_parent_indices(values)
+            lengths = pc.fill_null(pc.list_value_length(values), 0).to_numpy()
+            starts = np.cumsum(lengths) - lengths
+            positions = np.arange(len(elements)) - starts[parents.to_numpy()] + 1
+            child = pyarrow.table({
+                'event_id': table.column('event_id').take(parents),
+                'user_id': table.column('user_id').take(parents),
+                'element_position': pyarrow.array(positions, pyarrow.int32()),
+            })
+            for field, array in zip(elements.type, elements.flatten()):
+                child = child.append_column(field.name, array)
+            datasets[dataset] = child
+        return datasets
+
+    def get_data_dir():
+        return (Path(__file__) / "./../../../").resolve().joinpath('parquet_data/data')
+
+    def get_normalized_dir():
+        return (Path(__file__) / "./../../../").resolve().joinpath('parquet_data/normalized')
+
+    def get_output_path(path=None):
         if path is None:
-            path = (Path(__file__) / "./../../../").resolve()
-            data_folder_path = path.joinpath(f'parquet_data/data/{uuid.uuid4()}.parquet')
+            data_folder_path = SaveJson.get_data_dir().joinpath(f'{uuid.uuid4()}.parquet')
         else: 
             data_folder_path = path
         
         os.makedirs(os.path.dirname(data_folder_path), exist_ok=True)
+        return data_folder_path
+
+
+class RollingParquetWriter:
+    """
+    Keeps one Parquet file open and appends a row group per write() until the file
+    reaches target_file_size bytes or max_file_age seconds, then it should be rolled.
+
+    The open file is a hidden temporary file; close() writes the footer, fsyncs it,
+    writes its manifest sidecar and renames it into place, so only complete files are
+    ever visible. Data written to the open file is not durable until close() returns.
+    """
+
+    def __init__(self, directory=None, target_file_size=128 * 1024 * 1024, max_file_age=300.0, compression='snappy',
+                 compression_level=None, use_dictionary=True, row_group_size=None):
+        """
+        Args:
+            directory: Where files are created, defaults to parquet_data/data.
+            target_file_size (int): Roll once the open file has grown to this many bytes.
+            max_file_age (float): Roll once the open file is this many seconds old.
+            compression (str): Parquet codec, e.g. snappy, zstd, gzip, lz4 or none.
+            compression_level (int): Codec specific level, None for the codec default.
+            use_dictionary (bool): Dictionary encode columns.
+            row_group_size (int): Maximum rows per row group, None writes each write() as one row group.
+        """
+        self.directory = directory
+        self.target_file_size = target_file_size
+        self.max_file_age = max_file_age
+        self.writer_options = {
+            "compression": compression,
+            "compression_level": compression_level,
+            "use_dictionary": use_dictionary,
+        }
+        self.row_group_size = row_group_size
+
+        self.path = None
+        self.tmp_path = None
+        self.file = None
+        self.writer = None
+        self.opened_at = None
+        self.rows = 0
+        self.stats = None
+
+    def is_open(self) -> bool:
+        return self.writer is not None
+
+    def size(self) -> int:
+        return self.file.tell() if self.file is not None else 0
+
+    def _open(self, schema):
+        if self.directory is None:
+            self.path = Path(SaveJson.get_output_path())
+        else:
+            self.path = Path(SaveJson.get_output_path(Path(self.directory) / f'{uuid.uuid4()}.parquet'))
+        self.tmp_path = self.path.with_name(f'.{self.path.name}.tmp')
+        self.file = open(self.tmp_path, 'wb')
+        self.writer = pq.ParquetWriter(self.file, schema, **self.writer_options)
+        self.opened_at = time.monotonic()
+        self.rows = 0
+        self.stats = FileStats()
+
+    def conform(self, table):
+        """
+        Return table with the open file's schema, or None if it cannot be cast to it.
+        """
+        if self.writer is None:
+            return table
+        schema = self.writer.schema
+        if table.schema.equals(schema, check_metadata=False):
+            return table
+        if sorted(table.schema.names) != sorted(schema.names):
+            return None
+        try:
+            return table.select(schema.names).cast(schema)
+        except (pyarrow.ArrowInvalid, pyarrow.ArrowNotImplementedError):
+            return None
+
+    def write(self, table) -> bool:
+        """
+        Append table to the open file, opening one if needed.
+
+        Returns:
+            bool: False, without writing anything, if the table's schema does not fit the
+                open file. Close the file and write again to start a new one.
+        """
+        conformed = self.conform(table)
+        if conformed is None:
+            return False
+        if self.writer is None:
+            self._open(conformed.schema)
+        self.writer.write_table(conformed, row_group_size=self.row_group_size)
+        self.rows += conformed.num_rows
+        self.stats.add(conformed)
+        return True
+
+    def roll_reason(self):
+        """
+        Return 'size' or 'age' if the open file should be closed, otherwise None.
+        """
+        if self.writer is None:
+            return None
+        if self.size() >= self.target_file_size:
+            return 'size'
+        if time.monotonic() - self.opened_at >= self.max_file_age:
+            return 'age'
+        return None
+
+    def close(self):
+        """
+        Finish the open file and durably publish it.
+
+        Returns:
+            Path: The published file, or None if no file was open.
+        """
+        if self.writer is None:
+            return None
+        self.writer.close()
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        size = self.file.tell()
+        self.file.close()
+        write_sidecar(self.path, self.stats, size)
+        SaveJson.publish(self.tmp_path, self.path)
+        path = self.path
+        self.writer = self.file = self.path = self.tmp_path = None
+        return path
+
+    def abort(self):
+        """
+        Drop the open file without publishing it.
+        """
+        if self.writer is None:
+            return
+        self.writer.close()
+        self.file.close()
+        os.remove(self.tmp_path)
+        self.writer = self.file = self.path = self.tmp_path = None
+
+
+class PartitionedParquetWriter:
+    """
+    Splits every write() by event_date/event_type and appends each part to a
+    RollingParquetWriter under directory/event_date=.../event_type=.../.
+
+    All files are rolled together, so once close() returns everything written so
+    far is published and an offset covering it can be committed.
+    """
+
+    def __init__(self, directory=None, max_open_files=64, **writer_options):
+        """
+        Args:
+            directory: Base directory of the partitions, defaults to parquet_data/data.
+            max_open_files (int): Most partition files open at once; the least recently written is published before another is opened.
+            writer_options: target_file_size, max_file_age and the Parquet options of RollingParquetWriter.
+        """
+        self.directory = Path(directory or SaveJson.get_data_dir())
+        self.max_open_files = max_open_files
+        self.writer_options = writer_options
+        self.writers = {}
+
+    @property
+    def rows(self) -> int:
+        return sum(writer.rows for writer in self.writers.values())
+
+    def is_open(self) -> bool:
+        return any(writer.is_open() for writer in self.writers.values())
+
+    def split(self, table) -> dict:
+        """
+        Returns:
+            dict: Directory relative to self.directory -> the rows of table written there.
+        """
+        return SaveJson.split_partitions(table)
+
+    def write(self, table) -> bool:
+        """
+        At most max_open_files files are open at once: before a new partition file is
+        opened, the least recently written one is published. If writing fails, every
+        open file is aborted, so none is left behind half written.
+
+        Returns:
+            bool: False, without writing anything, if a part does not fit the schema of its open file.
+        """
+        parts = []
+        for partition_dir, part in self.split(table).items():
+            writer = self.writers.get(partition_dir)
+            conformed = part if writer is None else writer.conform(part)
+            if conformed is None:
+                return False
+            parts.append((partition_dir, conformed))
+
+        try:
+            for partition_dir, conformed in parts:
+                writer = self.writers.get(partition_dir)
+                if writer is None:
+                    while len(self.writers) >= self.max_open_files:
+                        # the dict is in write order, its first writer is the least recently used
+                        least_recent = next(iter(self.writers))
+                        self.writers[least_recent].close()
+                        del self.writers[least_recent]
+                    # a part conformed to a file evicted since then starts a new file with that schema
+                    writer = RollingParquetWriter(directory=self.directory / partition_dir, **self.writer_options)
+                else:
+                    del self.writers[partition_dir]
+                self.writers[partition_dir] = writer
+                writer.write(conformed)
+        except BaseException:
+            self.abort()
+            raise
+        return True
+
+    def roll_reason(self):
+        """
+        Return the first size or age reason of any open file. The number of open files
+        is not a reason: write() publishes the least recently written ones to stay below
+        max_open_files, so the busy partitions keep their files.
+        """
+        for writer in self.writers.values():
+            reason = writer.roll_reason()
+            if reason is not None:
+                return reason
+        return None
+
+    def close(self):
+        """
+        Publish every open partition file.
+
+        Returns:
+            list: Paths of the published files.
+        """
+        paths = [writer.close() for writer in self.writers.values()]
+        self.writers = {}
+        return [path for path in paths if path is not None]
+
+    def abort(self):
+        for writer in self.writers.values():
+            writer.abort()
+        self.writers = {}
+
+
+class NormalizedParquetWriter(PartitionedParquetWriter):
+    """
+    Writes every event to four linked datasets under directory: events, with the
+    nested lists left out, and user_actions, recommendations and search_history with
+    a row per list element, linked to its event by event_id. A scan of one entity
+    only reads that entity's files.
+
+    With partitioned=True each dataset has the event_date/event_type layout, child
+    rows going to the partition of their event. The files of all datasets are rolled
+    together, so a committed offset covers every dataset.
+    """
+
+    def __init__(self, directory=None, partitioned=False, max_open_files=64, **writer_options):
+        """
+        Args:
+            directory: Base directory of the datasets, defaults to parquet_data/normalized.
+            partitioned (bool): Split each dataset by event_date/event_type.
+            max_open_files (int): Most files open at once across the datasets.
+            writer_options: target_file_size, max_file_age and the Parquet options of RollingParquetWriter.
+        """
+        super().__init__(directory or SaveJson.get_normalized_dir(), max_open_files=max_open_files, **writer_options)
+        self.partitioned = partitioned
 
-        print(f'writing data to following path {data_folder_path} -? ')
-        table = pyarrow.Table.from_pandas(data)
-        pq.write_table(table, data_folder_path)
+    def split(self, table) -> dict:
+        parts = SaveJson.split_partitions(table) if self.partitioned else {None: table}
+        split = {}
+        for partition_dir, part in parts.items():
+            for dataset, rows in SaveJson.normalize(part).items():
+                split[dataset if partition_dir is None else f'{dataset}/{partition_dir}'] = rows
+        return split
 
 
 if __name__ == "__main__":
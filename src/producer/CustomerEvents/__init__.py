@@ -1,6 +1,7 @@
 __version__ = "0.1.0"
 
-from .generate_consumer import generate_consumer_event_data
+from .generate_consumer import generate_consumer_event_data, generate_consumer_event_data_batch
+from .event_id import new_event_id, new_event_ids
 
 
 from .content import Content
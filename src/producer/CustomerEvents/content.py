@@ -1,3 +1,5 @@
+import uuid
+
 from faker import Faker
 from .mediaprovider import MediaContentProvider
 
@@ -61,4 +63,79 @@ class Content:
             data = f.content()
             yield cls(id=f.uuid4(), **data)
 
-     
+    @classmethod
+    def generate_content_data_batch(cls, rng, n):
+        """
+        Generate content data for n events without going through Faker.
+
+        Draws from the same word lists and ranges as MediaContentProvider.content(),
+        so the values have the same distribution as the single-event path.
+
+        Returns:
+            list: Dictionaries shaped like Content.as_dict().
+        """
+        provider = MediaContentProvider
+        content_type = rng.integers(0, len(provider.content_types), n).tolist()
+        season_pick = rng.random(n).tolist()
+        episode_pick = rng.random(n).tolist()
+        duration_pick = rng.random(n).tolist()
+        language = rng.integers(0, len(provider.language), n).tolist()
+        content_provider = rng.integers(0, len(provider.content_providers), n).tolist()
+        genre = rng.integers(0, len(provider.genres), n).tolist()
+        release_year = rng.integers(2000, 2025, n).tolist()
+        titles = cls.generate_title_batch(rng, n)
+        ids = rng.bytes(16 * n)
+
+        contents = []
+        for i in range(n):
+            kind = provider.content_types[content_type[i]]
+            if kind in ['Movie', 'Documentary', 'Animation', 'Short Film']:
+                season, episode = -1, -1
+            else:
+                low, high = provider.seasons[kind]
+                season = low + int(season_pick[i] * (high - low + 1))
+                episode = low + int(episode_pick[i] * (high - low + 1))
+            low, high = provider.duration[kind]
+
+            contents.append({
+                "id": str(uuid.UUID(bytes=ids[16 * i:16 * (i + 1)], version=4)),
+                "title": titles[i],
+                "type": kind,
+                "episode": episode,
+                "season": season,
+                "provider": provider.content_providers[content_provider[i]],
+                "genre": provider.genres[genre[i]],
+                "release_year": release_year[i],
+                "duration": low + int(duration_pick[i] * (high - low + 1)),
+                "language": provider.language[language[i]]
+            })
+
+        return contents
+
+    @staticmethod
+    def generate_title_batch(rng, n):
+        """
+        Generate n titles using the MediaContentProvider formats and word lists.
+        """
+        provider = MediaContentProvider
+        template = rng.integers(0, len(provider.title_formats), n).tolist()
+        first_noun = rng.integers(0, len(provider.nouns), n).tolist()
+        second_noun = rng.integers(0, len(provider.nouns), n).tolist()
+        adjective = rng.integers(0, len(provider.adjectives), n).tolist()
+        verb = rng.integers(0, len(provider.verbs), n).tolist()
+        proper_noun = rng.integers(0, len(provider.proper_nouns), n).tolist()
+        preposition = rng.integers(0, len(provider.prepositions), n).tolist()
+
+        titles = []
+        for i in range(n):
+            title = provider.title_formats[template[i]]
+            title = title.replace('{noun}', provider.nouns[first_noun[i]], 1)
+            title = title.replace('{noun}', provider.nouns[second_noun[i]], 1)
+            title = title.replace('{adjective}', provider.adjectives[adjective[i]], 1)
+            title = title.replace('{verb}', provider.verbs[verb[i]], 1)
+            title = title.replace('{proper_noun}', provider.proper_nouns[proper_noun[i]], 1)
+            title = title.replace('{preposition}', provider.prepositions[preposition[i]], 1)
+            titles.append(title)
+
+        return titles
+
@@ -57,3 +57,36 @@ class Device:
             device_type.model = random.choice(Device.model_name[device_type.os])
 
             yield device_type
+
+
+    @classmethod
+    def generate_device_data_batch(cls, rng, types):
+        """
+        Generate device data for a batch of device types in one pass.
+
+        args:
+            rng: numpy Generator used for all random draws.
+            types: List of device types, one per event.
+        """
+        n = len(types)
+        os_pick = rng.random(n).tolist()
+        model_pick = rng.random(n).tolist()
+        os_versions = rng.uniform(10, 20, n).tolist()
+        major = rng.integers(1, 10, n).tolist()
+        minor = rng.integers(0, 6, n).tolist()
+        patch = rng.integers(0, 4, n).tolist()
+
+        devices = []
+        for i, type in enumerate(types):
+            os_options = Device.os_type[type]
+            os = os_options[int(os_pick[i] * len(os_options))]
+            models = Device.model_name[os]
+            devices.append({
+                "type": type,
+                "os": os,
+                "os_version": str(os_versions[i]),
+                "app_version": f"{major[i]}.{minor[i]}.{patch[i]}",
+                "model": models[int(model_pick[i] * len(models))]
+            })
+
+        return devices
@@ -0,0 +1,61 @@
+import os
+import threading
+import time
+import uuid
+
+
+_lock = threading.Lock()
+_last_ms = 0
+_sequence = 0
+
+
+def _next_stamp(count: int):
+    """
+    Reserve count consecutive (millisecond, sequence) stamps.
+
+    The 12 bit sequence orders ids created in the same millisecond; when it runs out
+    the timestamp moves on to the next millisecond, so ids never go backwards within
+    a process even if the clock does.
+    """
+    global _last_ms, _sequence
+    with _lock:
+        now_ms = time.time_ns() // 1_000_000
+        if now_ms > _last_ms:
+            _last_ms = now_ms
+            _sequence = 0
+        first_ms, first_sequence = _last_ms, _sequence
+        _sequence += count
+        _last_ms += _sequence >> 12
+        _sequence &= 0xFFF
+        return first_ms, first_sequence
+
+
+def _uuid7(ms: int, sequence: int, random_bits: bytes) -> str:
+    # 48 bit unix milliseconds | version 7 | 12 bit sequence | variant 10 | 62 random bits
+    value = (ms & 0xFFFFFFFFFFFF) << 80 | 0x7 << 76 | sequence << 64 | 0b10 << 62 | int.from_bytes(random_bits, "big") >> 2
+    return str(uuid.UUID(int=value))
+
+
+def new_event_id() -> str:
+    """
+    Return a UUIDv7 (RFC 9562) style event id: unique, and ordered by creation time.
+    """
+    ms, sequence = _next_stamp(1)
+    return _uuid7(ms, sequence, os.urandom(8))
+
+
+def new_event_ids(n: int) -> list:
+    """
+    Return n event ids in creation order, like n calls to new_event_id() but with a single
+    clock read and one call for the random bits.
+    """
+    ms, sequence = _next_stamp(n)
+    random_bytes = os.urandom(8 * n)
+    ids = []
+    for i in range(n):
+        ids.append(_uuid7(ms, sequence, random_bytes[8 * i:8 * (i + 1)]))
+        sequence += 1
+        if sequence > 0xFFF:
+            ms += 1
+            sequence = 0
+    return ids
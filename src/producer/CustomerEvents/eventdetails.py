@@ -57,4 +57,35 @@ class EventDetails:
                 completed = random.choice(EventDetails.boolean_values),
                 network_type = random.choice(EventDetails.network_types),
                 bandwidth = str(random.randint(10, 100)) + random.choice(EventDetails.internet_speed),
-            )
\ No newline at end of file
+            )
+
+    @classmethod
+    def generate_event_data_batch(cls, rng, n):
+        """
+        Generate random event data for n events, drawing each field as one array.
+        """
+        play_duration = rng.integers(1, 1001, n).tolist()
+        play_percentage = rng.uniform(0, 100, n).tolist()
+        playback_quality = rng.integers(0, len(EventDetails.quality), n).tolist()
+        buffering_incidents = rng.integers(0, 6, n).tolist()
+        playback_speed = rng.uniform(0.5, 2.0, n).tolist()
+        paused = rng.integers(0, 2, n).astype(bool).tolist()
+        completed = rng.integers(0, 2, n).astype(bool).tolist()
+        network_type = rng.integers(0, len(EventDetails.network_types), n).tolist()
+        bandwidth = rng.integers(10, 101, n).tolist()
+        speed_unit = rng.integers(0, len(EventDetails.internet_speed), n).tolist()
+
+        return [
+            {
+                "play_duration": play_duration[i],
+                "play_percentage": play_percentage[i],
+                "playback_quality": EventDetails.quality[playback_quality[i]],
+                "buffering_incidents": buffering_incidents[i],
+                "playback_speed": playback_speed[i],
+                "paused": paused[i],
+                "completed": completed[i],
+                "network_type": EventDetails.network_types[network_type[i]],
+                "bandwidth": str(bandwidth[i]) + EventDetails.internet_speed[speed_unit[i]]
+            }
+            for i in range(n)
+        ]
@@ -1,7 +1,17 @@
 from faker import Faker
 import random
 
+import numpy as np
+
+try:
+    from profiling import timed
+except ImportError:
+    # imported as a package without the producer directory on sys.path: no stage timers
+    def timed(name):
+        return lambda func: func
+
 from .device import Device
+from .event_id import new_event_id, new_event_ids
 from .location import Location
 from .content import Content
 from .user_subscriptions import UserSubscriptions
@@ -14,6 +24,7 @@ from .searchhistory import SearchHistory
 device_type = ['desktop', 'tablet', 'smartTV', 'mobile']
 event_type = ['content_play', 'search', 'browse']
 
+@timed("producer.generate")
 def generate_consumer_event_data() -> dict:
     device = Device.generate_device_data(random.choice(device_type)).__next__().as_dict()
     location = Location.generate_location_data().__next__().as_dict()
@@ -23,6 +34,7 @@ def generate_consumer_event_data() -> dict:
 
 
     consumer_events = {
+        "event_id": new_event_id(),
         "user_id": "36f0b1e2-5f4c-4d3a-9a1e-2b8f4e6c7d8e-" + str(random.randint(0, 500)),
         "device": device,
         "location": location,
@@ -37,7 +49,69 @@ def generate_consumer_event_data() -> dict:
     }
 
     return consumer_events
-   
+
+
+_batch_rng = np.random.default_rng()
+
+
+@timed("producer.generate_batch")
+def generate_consumer_event_data_batch(n: int, rng: np.random.Generator = None) -> list:
+    """
+    Generate n consumer events in one call.
+
+    Every component draws its fields for the whole batch from a single numpy
+    Generator; Faker is only used once per process, to build the location
+    catalog. The events have the same shape as the ones returned by
+    generate_consumer_event_data().
+
+    Args:
+        n (int): Number of events to generate.
+        rng (np.random.Generator): Optional generator, e.g. seeded for reproducible runs.
+            Defaults to a module level generator shared between calls.
+
+    Returns:
+        list: n event dictionaries.
+    """
+    rng = rng or _batch_rng
+
+    devices = Device.generate_device_data_batch(
+        rng, [device_type[i] for i in rng.integers(0, len(device_type), n).tolist()]
+    )
+    locations = Location.generate_location_data_batch(rng, n)
+    contents = Content.generate_content_data_batch(rng, n)
+    event_types = rng.integers(0, len(event_type), n).tolist()
+    user_subscriptions = UserSubscriptions.generate_user_subscription_batch(rng, n)
+    user_ids = rng.integers(0, 501, n).tolist()
+    year = rng.integers(2000, 2026, n).tolist()
+    month = rng.integers(1, 13, n).tolist()
+    day = rng.integers(1, 32, n).tolist()
+    hour = rng.integers(0, 24, n).tolist()
+    minute = rng.integers(0, 60, n).tolist()
+    second = rng.integers(0, 60, n).tolist()
+    event_details = EventDetails.generate_event_data_batch(rng, n)
+    user_actions = UserAction.generate_user_action_data_batch(rng, n)
+    recommendations = Recommendations.generate_recommendations_batch(rng, n)
+    search_history = SearchHistory.generate_serach_history_data_batch(rng, n)
+    event_ids = new_event_ids(n)
+
+    return [
+        {
+            "event_id": event_ids[i],
+            "user_id": "36f0b1e2-5f4c-4d3a-9a1e-2b8f4e6c7d8e-" + str(user_ids[i]),
+            "device": devices[i],
+            "location": locations[i],
+            "content": contents[i],
+            "event_type": event_type[event_types[i]],
+            "user_subscription": user_subscriptions[i],
+            "timestamp": f"{year[i]}-{month[i]}-{day[i]}T{hour[i]}:{minute[i]}:{second[i]}",
+            "event_details": event_details[i],
+            "user_action": user_actions[i],
+            "recommendations": recommendations[i],
+            "search_history": search_history[i],
+        }
+        for i in range(n)
+    ]
+
 
 if __name__ == "__main__":
     generate_consumer_event_data()
\ No newline at end of file
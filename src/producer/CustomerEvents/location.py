@@ -1,6 +1,11 @@
+import json
 import random
+from pathlib import Path
+
+import numpy as np
 from faker import Faker
 from faker.providers import address
+from faker.providers.geo import Provider as GeoProvider
 
 
 class Location:
@@ -16,6 +21,8 @@ class Location:
         "Spain": "es_ES",
     }
 
+    _catalog = None
+
     def __init__(self, country, city=None, region=None, timezone=None):
         self.country = country
         self.city = city
@@ -29,28 +36,114 @@ class Location:
             "region": self.region,
             "timezone": self.timezone
         }
-    
+
+    @classmethod
+    def build_catalog(cls):
+        """
+        Build the per-country catalog of places from Faker's land coordinates.
+
+        This is the only place a locale specific Faker is constructed, once per
+        country, to resolve the country name and code.
+
+        Returns:
+            dict: Country key -> {"country": name, "places": [[city, region, timezone], ...]}.
+        """
+        catalog = {}
+        for country, locale in cls.Country.items():
+            fake = Faker(locale)
+            country_code = fake.current_country_code()
+            catalog[country] = {
+                "country": fake.current_country(),
+                "places": [
+                    [city, region, timezone]
+                    for _, _, city, region, timezone in GeoProvider.land_coords
+                    if region == country_code
+                ],
+            }
+        return catalog
+
+    @classmethod
+    def load_catalog(cls, path=None):
+        """
+        Load the location catalog and keep it on the class for all later sampling.
+
+        args:
+            path: Optional JSON snapshot. It is read if it exists, otherwise the catalog
+                is built from Faker and written there for the next start.
+        """
+        if path is not None and Path(path).exists():
+            with open(path, 'r') as file:
+                catalog = json.load(file)
+        else:
+            catalog = cls.build_catalog()
+            if path is not None:
+                with open(path, 'w') as file:
+                    json.dump(catalog, file)
+
+        countries = list(catalog.keys())
+        cls._catalog = {
+            "countries": countries,
+            "names": [catalog[country]["country"] for country in countries],
+            # older snapshots carry a fourth, unused population figure per place
+            "places": [[tuple(place[:3]) for place in catalog[country]["places"]] for country in countries],
+        }
+        return cls._catalog
+
+    @classmethod
+    def get_catalog(cls):
+        return cls._catalog or cls.load_catalog()
+
     @classmethod
     def generate_location_data(cls):
         """
         Generate random location data.
-        
-        args:
-            faker: Faker instance for generating random data.
-        
+
+        Picks a country and one of its places from the precomputed catalog.
         """
-        country = random.choice(list(Location.Country.keys()))
-        fake = Faker(cls.Country[country])
+        catalog = cls.get_catalog()
+        index = random.randrange(len(catalog["countries"]))
+        city, region, timezone = random.choice(catalog["places"][index])
 
-        # Generate random city, region, and timezone
-        city, region, timezone = fake.local_latlng(fake.current_country_code())[2:]
-        
         while True:
             location = cls(
-                country=fake.current_country(),
+                country=catalog["names"][index],
                 city=city,
                 region=region,
                 timezone=timezone
             )
 
-            yield location
\ No newline at end of file
+            yield location
+
+    @classmethod
+    def generate_location_data_batch(cls, rng, n):
+        """
+        Generate location data for n events from the precomputed catalog.
+
+        args:
+            rng: numpy Generator used for the country and place draws. Countries
+                and the places within a country are picked uniformly.
+        """
+        catalog = cls.get_catalog()
+        country_index = rng.integers(0, len(catalog["countries"]), n)
+        place_pick = rng.random(n)
+
+        locations = [None] * n
+        for index in range(len(catalog["countries"])):
+            rows = np.flatnonzero(country_index == index)
+            if len(rows) == 0:
+                continue
+
+            places = catalog["places"][index]
+            place_index = (place_pick[rows] * len(places)).astype(np.int64)
+
+            name = catalog["names"][index]
+            for row, place in zip(rows.tolist(), place_index.tolist()):
+                city, region, timezone = places[place]
+                locations[row] = {
+                    "country": name,
+                    "city": city,
+                    "region": region,
+                    "timezone": timezone
+                }
+
+        return locations
@@ -18,4 +18,32 @@ class Recommendations:
                 "clicked" : random.choice([True, False]),
             })
 
-        return recom
\ No newline at end of file
+        return recom
+
+    @classmethod
+    def generate_recommendations_batch(cls, rng, n):
+        """
+        Generate 1-3 recommendations for each of n events.
+        """
+        counts = rng.integers(1, 4, n)
+        total = int(counts.sum())
+
+        content_id = rng.integers(100000, 1000000, total).tolist()
+        algorithm = rng.integers(0, len(Recommendations.recom_algorithms), total).tolist()
+        clicked = rng.integers(0, 2, total).astype(bool).tolist()
+
+        recom = []
+        start = 0
+        for count in counts.tolist():
+            recom.append([
+                {
+                    "content_id": "m" + str(content_id[j]),
+                    "position": j - start + 1,
+                    "algorithm": Recommendations.recom_algorithms[algorithm[j]],
+                    "clicked": clicked[j],
+                }
+                for j in range(start, start + count)
+            ])
+            start += count
+
+        return recom
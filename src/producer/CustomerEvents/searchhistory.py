@@ -3,6 +3,8 @@ from faker import Faker
 
 class SearchHistory:
 
+    queries = ['quantum', 'nebula', 'photon', 'galaxy', 'cosmos']
+
     @classmethod
     def generate_serach_history_data(cls):
         """
@@ -15,8 +17,42 @@ class SearchHistory:
             search_history.append({
                 "search_id": "s" + str(random.randint(100000, 999999)),
                 "timestamp": str(random.randint(2000, 2025)) + "-" + str(random.randint(1, 12)) + "-" + str(random.randint(1, 28)) + "T" + str(random.randint(0, 23)) + ":" + str(random.randint(0, 59)) + ":" + str(random.randint(0, 59)),
-                "query": random.choice(['quantum', 'nebula', 'photon', 'galaxy', 'cosmos']),
+                "query": random.choice(SearchHistory.queries),
                 "results_count": random.randint(10, 100),
             })
 
-        return search_history
\ No newline at end of file
+        return search_history
+
+    @classmethod
+    def generate_serach_history_data_batch(cls, rng, n):
+        """
+        Generate 1-5 search history entries for each of n events.
+        """
+        counts = rng.integers(1, 6, n)
+        total = int(counts.sum())
+
+        search_id = rng.integers(100000, 1000000, total).tolist()
+        year = rng.integers(2000, 2026, total).tolist()
+        month = rng.integers(1, 13, total).tolist()
+        day = rng.integers(1, 29, total).tolist()
+        hour = rng.integers(0, 24, total).tolist()
+        minute = rng.integers(0, 60, total).tolist()
+        second = rng.integers(0, 60, total).tolist()
+        query = rng.integers(0, len(SearchHistory.queries), total).tolist()
+        results_count = rng.integers(10, 101, total).tolist()
+
+        search_history = []
+        start = 0
+        for count in counts.tolist():
+            search_history.append([
+                {
+                    "search_id": "s" + str(search_id[j]),
+                    "timestamp": f"{year[j]}-{month[j]}-{day[j]}T{hour[j]}:{minute[j]}:{second[j]}",
+                    "query": SearchHistory.queries[query[j]],
+                    "results_count": results_count[j],
+                }
+                for j in range(start, start + count)
+            ])
+            start += count
+
+        return search_history
@@ -74,4 +74,52 @@ class UserAction:
             ua.generate_user_action_details()
             user_actions.append(ua.as_dict())
 
-        return user_actions
\ No newline at end of file
+        return user_actions
+
+    @classmethod
+    def generate_user_action_data_batch(cls, rng, n):
+        """
+        Generate random user action data for n events.
+
+        Every field for every action in the batch is drawn up front, then the
+        per-event lists are sliced out of those arrays.
+        """
+        counts = rng.integers(1, 6, n)
+        total = int(counts.sum())
+
+        action_type = rng.integers(0, len(UserAction.action_type), total).tolist()
+        year = rng.integers(2000, 2025, total).tolist()
+        month = rng.integers(1, 13, total).tolist()
+        day = rng.integers(1, 28, total).tolist()
+        hour = rng.integers(0, 24, total).tolist()
+        minute = rng.integers(0, 60, total).tolist()
+        second = rng.integers(0, 60, total).tolist()
+        duration = rng.integers(100, 1001, total).tolist()
+        old_quality = rng.integers(0, len(UserAction.quality), total).tolist()
+        new_quality_offset = rng.integers(1, len(UserAction.quality), total).tolist()
+        old_speed = rng.uniform(0.5, 2.0, total).tolist()
+        new_speed = rng.uniform(0.5, 2.0, total).tolist()
+
+        actions = []
+        for i in range(total):
+            kind = UserAction.action_type[action_type[i]]
+            action = {
+                "action_type": kind,
+                "timestamp": f"{year[i]:04d}-{month[i]:02d}-{day[i]:02d}T{hour[i]:02d}:{minute[i]:02d}:{second[i]:02d}",
+            }
+            if kind == 'pause':
+                action["duration"] = duration[i]
+            elif kind == 'completed':
+                action["duration"] = duration[i]
+                action["completed"] = True
+            elif kind == 'change quality':
+                # offset in 1..len-1 guarantees the new quality differs from the old one
+                action["old_quality"] = UserAction.quality[old_quality[i]]
+                action["new_quality"] = UserAction.quality[(old_quality[i] + new_quality_offset[i]) % len(UserAction.quality)]
+            elif kind == 'playback_speed':
+                action["old_speed"] = old_speed[i]
+                action["new_speed"] = new_speed[i]
+            actions.append(action)
+
+        bounds = counts.cumsum().tolist()
+        return [actions[end - count:end] for count, end in zip(counts.tolist(), bounds)]
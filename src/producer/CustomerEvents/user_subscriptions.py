@@ -1,6 +1,14 @@
 import random
+
+import numpy as np
+
+
 class UserSubscriptions: 
 
+    plans = ["Basic", "Standard", "Premium"]
+    billing_cycles = ["monthly", "yearly"]
+    connected_services = ["Netflix", "Hulu", "Amazon Prime", "Disney+", "HBO Max"]
+
     def __init__(self, plan, start_date, billing_cycle, connected_services):
         """
         Initialize a UserSubscriptions object with the given attributes.  
@@ -41,13 +49,36 @@ class UserSubscriptions:
             UserSubscriptions: A UserSubscriptions object with random data.
         """
         while True:
-            plans = ["Basic", "Standard", "Premium"]
-            billing_cycles = ["monthly", "yearly"]
-            connected_services = ["Netflix", "Hulu", "Amazon Prime", "Disney+", "HBO Max"]
-
-            plan = random.choice(plans)
+            plan = random.choice(cls.plans)
             start_date = str(random.randint(2000, 2023)) + "-" + str(random.randint(1, 12)) + "-" + str(random.randint(1, 31))
-            billing_cycle = random.choice(billing_cycles)
-            connected_services = random.sample(connected_services, random.randint(1, len(connected_services)))
+            billing_cycle = random.choice(cls.billing_cycles)
+            connected_services = random.sample(cls.connected_services, random.randint(1, len(cls.connected_services)))
+
+            yield cls(plan, start_date, billing_cycle, connected_services)
+
+    @classmethod
+    def generate_user_subscription_batch(cls, rng, n):
+        """
+        Generate user subscription data for n events.
+
+        Returns:
+            list: Dictionaries shaped like UserSubscriptions.as_dict().
+        """
+        services = np.array(cls.connected_services, dtype=object)
+        plan = rng.integers(0, len(cls.plans), n).tolist()
+        year = rng.integers(2000, 2024, n).tolist()
+        month = rng.integers(1, 13, n).tolist()
+        day = rng.integers(1, 32, n).tolist()
+        billing_cycle = rng.integers(0, len(cls.billing_cycles), n).tolist()
+        service_count = rng.integers(1, len(services) + 1, n).tolist()
+        service_order = rng.permuted(np.tile(np.arange(len(services)), (n, 1)), axis=1)
 
-            yield cls(plan, start_date, billing_cycle, connected_services)
\ No newline at end of file
+        return [
+            {
+                "plan": cls.plans[plan[i]],
+                "start_date": f"{year[i]}-{month[i]}-{day[i]}",
+                "billing_cycle": cls.billing_cycles[billing_cycle[i]],
+                "connected_services": services[service_order[i, :service_count[i]]].tolist()
+            }
+            for i in range(n)
+        ]
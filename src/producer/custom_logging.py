@@ -1,5 +1,20 @@
+import atexit
+import json
 import logging
+import os
+import queue
 import sys
+import threading
+import time
+from logging.handlers import QueueHandler, QueueListener
+
+# LOG_FORMAT=json writes one JSON object per line instead of colored text
+LOG_FORMAT = os.environ.get("LOG_FORMAT", "text")
+# LOG_ASYNC=0 writes every record on the thread that logs it
+LOG_ASYNC = os.environ.get("LOG_ASYNC", "1") != "0"
+# LOG_LEVEL=INFO skips the per batch DEBUG lines entirely
+LOG_LEVEL = os.environ.get("LOG_LEVEL")
+
 
 class CustomFormatter(logging.Formatter):
      # ANSI color codes
@@ -10,7 +25,7 @@ class CustomFormatter(logging.Formatter):
     blue = "\x1b[34;20m"
     green = "\x1b[32;20m"
     reset = "\x1b[0m"
-    
+
     format_template = "%(asctime)s - %(name)s - %(levelname)s - %(message)s (%(filename)s:%(lineno)d)"
 
     FORMATS = {
@@ -21,15 +36,139 @@ class CustomFormatter(logging.Formatter):
         logging.CRITICAL: bold_red + format_template + reset
     }
 
+    def __init__(self):
+        super().__init__(self.format_template)
+        # one formatter per level, built once instead of on every record
+        self.formatters = {level: logging.Formatter(log_fmt) for level, log_fmt in self.FORMATS.items()}
+
     def format(self, record):
-        log_fmt = self.FORMATS.get(record.levelno)
-        formatter = logging.Formatter(log_fmt)
+        formatter = self.formatters.get(record.levelno)
+        if formatter is None:
+            return super().format(record)
         return formatter.format(record)
 
+
+class JsonFormatter(logging.Formatter):
+    """
+    Formats a record as one line of JSON, for log shippers that parse fields instead of text.
+    """
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record),
+            "logger": record.name,
+            "level": record.levelname,
+            "message": record.getMessage(),
+            "file": record.filename,
+            "line": record.lineno,
+            "thread": record.threadName,
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry)
+
+
+class _InProcessQueueHandler(QueueHandler):
+
+    def prepare(self, record):
+        # the listener runs in this process, so the record is handed over as is
+        # instead of being formatted here, on the thread that logged it
+        return record
+
+
+_handler = None
+_handler_pid = None
+_listener = None
+_handler_lock = threading.Lock()
+
+
+def _stream_handler() -> logging.Handler:
+    handler = logging.StreamHandler(sys.stdout)
+    handler.setFormatter(JsonFormatter() if LOG_FORMAT == "json" else CustomFormatter())
+    return handler
+
+
+def log_handler() -> logging.Handler:
+    """
+    The handler every CustomLogger of this process writes to.
+
+    Unless LOG_ASYNC=0 it only puts records on a queue; a listener thread formats
+    them and writes them to stdout, so neither formatting nor a slow stdout holds up
+    the thread that logs. The listener is stopped, and the queue drained, at exit.
+    """
+    global _handler, _handler_pid, _listener
+    with _handler_lock:
+        # a forked child inherits the handler but not the listener thread
+        if _handler is None or _handler_pid != os.getpid():
+            if LOG_ASYNC:
+                log_queue = queue.SimpleQueue()
+                _listener = QueueListener(log_queue, _stream_handler(), respect_handler_level=True)
+                _listener.start()
+                atexit.register(stop_logging)
+                _handler = _InProcessQueueHandler(log_queue)
+            else:
+                _handler = _stream_handler()
+            _handler_pid = os.getpid()
+        return _handler
+
+
+def stop_logging():
+    """
+    Write out every queued record and stop the listener thread.
+    """
+    global _listener
+    if _listener is not None and _handler_pid == os.getpid():
+        _listener.stop()
+        _listener = None
+
+
+class AggregatedLog:
+    """
+    Counts a per message event and logs one line per interval instead of one per
+    message, e.g. "5000 messages delivered in the last 5.0 s".
+    """
+
+    def __init__(self, logger, message, interval=5.0, level=logging.INFO):
+        """
+        Args:
+            logger (logging.Logger): Logger the summary lines go to.
+            message (str): Template with {count} and {seconds} fields.
+            interval (float): Seconds between summary lines.
+            level (int): Level of the summary lines.
+        """
+        self.logger = logger
+        self.message = message
+        self.interval = interval
+        self.level = level
+        self.count = 0
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def add(self, count=1):
+        with self._lock:
+            self.count += count
+            now = time.monotonic()
+            if now - self.started < self.interval:
+                return
+            count, seconds = self.count, now - self.started
+            self.count = 0
+            self.started = now
+        self.logger.log(self.level, self.message.format(count=count, seconds=seconds), stacklevel=2)
+
+    def flush(self):
+        """
+        Log the count since the last summary line, if there is one.
+        """
+        with self._lock:
+            count, seconds = self.count, time.monotonic() - self.started
+            self.count = 0
+            self.started = time.monotonic()
+        if count:
+            self.logger.log(self.level, self.message.format(count=count, seconds=seconds), stacklevel=2)
+
+
 class CustomLogger(logging.Logger):
     def __init__(self, name: str, level: int = logging.DEBUG) -> None:
         super().__init__(name, level)
-        self.setLevel(level)
-        handler = logging.StreamHandler(sys.stdout)
-        handler.setFormatter(CustomFormatter())
-        self.addHandler(handler)
\ No newline at end of file
+        self.setLevel(LOG_LEVEL or level)
+        self.addHandler(log_handler())
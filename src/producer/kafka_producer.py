@@ -1,17 +1,58 @@
+import threading
+
 from confluent_kafka.serializing_producer import SerializingProducer
 from confluent_kafka.serialization import StringSerializer
 
-from custom_logging import CustomLogger
+from custom_logging import AggregatedLog, CustomLogger
 from kafka_schema_registry import KafkaSchemaRegistry
+from metrics import ProducerMetrics, start_http_server
+from profiling import log_stage_stats, stage, timed
 
 
 
 class KafkaProducer:
-    def __init__(self, config=None, topic=None):
+    def __init__(self, config=None, topic=None, pipelined=False, max_in_flight=50000, poll_interval=0.1, metrics_port=None, stats_interval_ms=5000,
+                 schema_registry_url=None):
+        """
+        Args:
+            config (dict): librdkafka settings merged over the defaults.
+            topic (str): Topic to produce to, defaults to customer_events.
+            pipelined (bool): Keep messages in flight instead of flushing after every
+                produce(). A background thread polls for delivery callbacks and the
+                producer is only flushed by checkpoint() or close().
+            max_in_flight (int): Pipelined mode only. Number of messages that may be
+                waiting for a delivery report before produce() blocks.
+            poll_interval (float): Pipelined mode only. Poll timeout of the background thread in seconds.
+            metrics_port (int): Serve Prometheus metrics on this port: messages produced, delivered and
+                failed, delivery latency, batch sizes and librdkafka statistics. None disables them.
+            stats_interval_ms (int): Metrics only. How often librdkafka reports its statistics.
+            schema_registry_url (str): Schema registry the value schema is registered with, defaults to http://schema-registry:8081.
+        """
         self.logger = CustomLogger(__name__)
+        self.schema_registry_url = schema_registry_url
         self.config = self.provide_additional_config(config or {})
         self.topic = topic or "customer_events" 
+        self.metrics = None
+        if metrics_port is not None:
+            self.metrics = ProducerMetrics(self.topic)
+            self.config |= {"statistics.interval.ms": stats_interval_ms, "stats_cb": self.metrics.client_stats}
+            start_http_server(metrics_port)
         self.producer = self.get_producer(config=self.config)
+        # one line per interval instead of one per message
+        self.delivered_log = AggregatedLog(self.logger, f"{{count}} messages delivered to {self.topic} in the last {{seconds:.1f}} s")
+
+        self.pipelined = pipelined
+        self.delivered = 0
+        self.failed = 0
+        self._counter_lock = threading.Lock()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._poll_interval = poll_interval
+        self._stop_polling = threading.Event()
+        self._poll_thread = None
+
+        if self.pipelined:
+            self._poll_thread = threading.Thread(target=self._poll_loop, name="kafka-producer-poll", daemon=True)
+            self._poll_thread.start()
 
     def provide_additional_config(self, config):
         additional_config = {
@@ -29,11 +70,11 @@ class KafkaProducer:
     def get_producer(self, config):
         try: 
             self.logger.debug(f"Creating producer with config: {config}")
-            self.kafka_schema_registry = KafkaSchemaRegistry()
+            self.kafka_schema_registry = KafkaSchemaRegistry(url=self.schema_registry_url)
 
             serializing_producer_new_config = {
                 'key.serializer': StringSerializer('utf_8'),
-                'value.serializer': self.kafka_schema_registry.register_schema(),
+                'value.serializer': timed("producer.serialize")(self.kafka_schema_registry.register_schema()),
             } | config
 
             producer = SerializingProducer(
@@ -47,33 +88,129 @@ class KafkaProducer:
             
     
     def delivery_report(self, err, msg):
+        if self.metrics is not None:
+            if err is not None:
+                self.metrics.failed.inc()
+            else:
+                self.metrics.delivered.inc()
+                latency = msg.latency()
+                if latency is not None:
+                    self.metrics.delivery_latency.observe(latency)
+
         if err is not None:
+            with self._counter_lock:
+                self.failed += 1
             self.logger.error(f"Message delivery failed: {err}")
         else:
-            self.logger.info(f"Message delivered to {msg.topic()} [{msg.partition()}] at offset {msg.offset()}")
+            with self._counter_lock:
+                self.delivered += 1
+            if not self.pipelined:
+                self.delivered_log.add()
+
+        if self.pipelined:
+            self._in_flight.release()
 
+    def _poll_loop(self):
+        while not self._stop_polling.is_set():
+            self.producer.poll(self._poll_interval)
     
     def produce(self, id, events):
-        try:
-            self.logger.info(f"Producing events to topic {self.topic}")
-            self.producer.produce(self.topic
-                    , key=str(id)
-                    , value=events
-                    , on_delivery=self.delivery_report
-            )
-
-            Number_of_events = len(self.producer)
-            self.logger.info(f"Number of events waiting to be produced: {Number_of_events}")
-
-            event_processed = self.producer.poll(timeout=10) 
-            self.logger.info(f"Polll execute: Event processed: {event_processed}")
+        if self.pipelined:
+            self._produce_pipelined(id, events)
+            return
 
+        try:
+            with stage("producer.produce"):
+                self.producer.produce(self.topic
+                        , key=str(id)
+                        , value=events
+                        , on_delivery=self.delivery_report
+                )
+            if self.metrics is not None:
+                self.metrics.produced.inc()
+            with stage("producer.poll"):
+                self.producer.poll(timeout=10)
 
         except Exception as e:
             self.logger.error(f"Failed to produce event: {e}")
-            raise Exception("Failed to produce event")
+            raise Exception("Failed to produce event") from e
         
 
         finally:
-            self.producer.flush()
-            self.logger.info(f"Flushed producer for topic {self.topic}")
\ No newline at end of file
+            with stage("producer.flush"):
+                self.producer.flush()
+
+    def _produce_pipelined(self, id, events):
+        # blocks while max_in_flight messages are waiting for a delivery report
+        with stage("producer.wait_in_flight"):
+            self._in_flight.acquire()
+        try:
+            with stage("producer.produce"):
+                self.producer.produce(self.topic
+                        , key=str(id)
+                        , value=events
+                        , on_delivery=self.delivery_report
+                )
+            if self.metrics is not None:
+                self.metrics.produced.inc()
+        except Exception as e:
+            self._in_flight.release()
+            self.logger.error(f"Failed to produce event: {e}")
+            raise Exception("Failed to produce event") from e
+
+    def produce_many(self, events, first_id=0):
+        """
+        Produce an iterable of events, keyed by a running id starting at first_id.
+
+        In pipelined mode this returns as soon as the last event is queued; call
+        checkpoint() to wait for the delivery reports.
+
+        Returns:
+            int: The next unused id.
+        """
+        id = first_id
+        for event in events:
+            self.produce(id, event)
+            id += 1
+        if self.metrics is not None:
+            self.metrics.batch_size.observe(id - first_id)
+        return id
+
+    def checkpoint(self, timeout=30):
+        """
+        Block until every queued message has a delivery report or the timeout expires.
+
+        Returns:
+            int: Number of messages still waiting for a delivery report.
+        """
+        with stage("producer.flush"):
+            remaining = self.producer.flush(timeout)
+        stats = self.stats()
+        self.logger.info(f"Checkpoint for topic {self.topic}: delivered={stats['delivered']} failed={stats['failed']} pending={remaining}")
+        return remaining
+
+    def stats(self):
+        with self._counter_lock:
+            return {
+                "delivered": self.delivered,
+                "failed": self.failed,
+                "in_flight": len(self.producer),
+            }
+
+    def close(self, timeout=30):
+        """
+        Flush outstanding messages and stop the background poll thread.
+
+        Returns:
+            dict: Final delivered/failed counts.
+        """
+        remaining = self.checkpoint(timeout)
+        self.delivered_log.flush()
+        log_stage_stats(self.logger)
+        if remaining:
+            self.logger.error(f"{remaining} messages were not delivered before close")
+        if self._poll_thread is not None:
+            self._stop_polling.set()
+            self._poll_thread.join()
+            self._poll_thread = None
+        return self.stats()
@@ -1,13 +1,155 @@
 from confluent_kafka.schema_registry import SchemaRegistryClient, Schema
 from confluent_kafka.schema_registry.error import SchemaRegistryError
 from confluent_kafka.schema_registry.avro import AvroSerializer
+from confluent_kafka.serialization import SerializationError
+from fastavro import parse_schema, schemaless_writer
+from fastavro.schema import fingerprint, to_parsing_canonical_form
 
 from pathlib import Path
-from typing import Tuple
+import io
 import json
-import deepdiff
+import os
+import struct
+import threading
+import time
 
 from custom_logging import CustomLogger
+from profiling import timed
+
+# SCHEMA_CACHE=0 asks the registry on every start
+SCHEMA_CACHE = os.environ.get("SCHEMA_CACHE", "1") != "0"
+SCHEMA_CACHE_PATH = Path(os.environ.get("SCHEMA_CACHE_PATH", Path(__file__).parent.joinpath('.schema_registry_cache.json')))
+# seconds the first record waits for the check of a cached id before asking the registry itself
+SCHEMA_VALIDATION_TIMEOUT = float(os.environ.get("SCHEMA_VALIDATION_TIMEOUT", "10"))
+
+
+def schema_fingerprint(schema_str: str) -> str:
+    """
+    SHA-256 of the schema's Avro Parsing Canonical Form. Formatting, field attribute
+    order, docs and defaults do not change it; anything that changes the encoding does.
+    """
+    return fingerprint(to_parsing_canonical_form(json.loads(schema_str)), 'SHA-256')
+
+
+class SchemaIdCache:
+    """
+    Schema ids the registry assigned, on disk as {"<registry url> <subject>": {fingerprint: {"id", "schema"}}},
+    so a producer whose local schema was registered before can start without asking the registry.
+
+    Ids are only meaningful to the registry that assigned them: delete the file, or
+    start with SCHEMA_CACHE=0, after recreating the registry under the same url.
+    """
+
+    def __init__(self, path=SCHEMA_CACHE_PATH):
+        self.path = Path(path)
+        self.logger = CustomLogger(__name__)
+
+    def load(self) -> dict:
+        try:
+            with open(self.path, 'r') as file:
+                return json.load(file)
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Ignoring unreadable schema cache {self.path}: {e}")
+            return {}
+
+    def get(self, url: str, subject: str, schema_str: str):
+        """
+        Returns:
+            int: The id schema_str was registered under, None if it is not cached.
+        """
+        entry = self.load().get(f"{url} {subject}", {}).get(schema_fingerprint(schema_str))
+        # the fingerprint ignores docs and defaults, a registry version does not
+        if entry is None or json.loads(entry["schema"]) != json.loads(schema_str):
+            return None
+        return entry["id"]
+
+    def put(self, url: str, subject: str, schema_str: str, schema_id: int):
+        cache = self.load()
+        cache.setdefault(f"{url} {subject}", {})[schema_fingerprint(schema_str)] = {"id": schema_id, "schema": schema_str}
+        self._write(cache)
+
+    def evict(self, url: str, subject: str, schema_str: str):
+        cache = self.load()
+        if cache.get(f"{url} {subject}", {}).pop(schema_fingerprint(schema_str), None) is not None:
+            self._write(cache)
+
+    def _write(self, cache: dict):
+        # written aside and renamed, so producers starting together never read half a file
+        tmp_path = self.path.with_name(f'.{self.path.name}.{os.getpid()}.tmp')
+        try:
+            with open(tmp_path, 'w') as file:
+                json.dump(cache, file, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            self.logger.warning(f"Could not write schema cache {self.path}: {e}")
+
+
+class AvroWireSerializer:
+    """
+    Serializes a record to the Confluent wire format, a magic byte, the 4-byte big-endian
+    schema id and the schemaless Avro body, the same bytes AvroSerializer writes. The id
+    is known up front, so unlike AvroSerializer it never calls the registry.
+    """
+
+    MAGIC_BYTE = 0
+    HEADER = struct.Struct('>bI')
+
+    def __init__(self, schema_id: int, schema_str: str):
+        self.set_schema(schema_id, schema_str)
+
+    def set_schema(self, schema_id: int, schema_str: str):
+        self.schema_id = schema_id
+        self.schema_str = schema_str
+        self.parsed_schema = parse_schema(json.loads(schema_str))
+        self.header = self.HEADER.pack(self.MAGIC_BYTE, schema_id)
+
+    def __call__(self, obj, ctx=None):
+        if obj is None:
+            return None
+        buffer = io.BytesIO()
+        buffer.write(self.header)
+        try:
+            schemaless_writer(buffer, self.parsed_schema, obj)
+        except (ValueError, TypeError) as e:
+            raise SerializationError(str(e))
+        return buffer.getvalue()
+
+
+class CachedIdSerializer(AvroWireSerializer):
+    """
+    An AvroWireSerializer for a schema id read from the cache, which the registry may no
+    longer hold for this schema. The id is checked in the background while the producer
+    starts; the first record waits for that check, so none is written with a wrong id.
+    If the check takes longer than timeout, the records are serialized by the serializer
+    lookup() returns, which asks the registry itself.
+    """
+
+    def __init__(self, schema_id: int, schema_str: str, lookup, timeout: float = SCHEMA_VALIDATION_TIMEOUT):
+        """
+        Args:
+            schema_id (int): Cached id of schema_str.
+            schema_str (str): The local schema.
+            lookup (Callable): Returns a serializer that gets the id from the registry.
+            timeout (float): Seconds the first record waits for the background check.
+        """
+        super().__init__(schema_id, schema_str)
+        self.validated = threading.Event()
+        self.lookup = lookup
+        self.timeout = timeout
+        # serializes instead of this one if the registry could not give a valid id
+        self.fallback = None
+
+    def __call__(self, obj, ctx=None):
+        if not self.validated.wait(self.timeout):
+            # the check is stuck on the registry; asking it synchronously fails or succeeds like a start without the cache
+            self.fallback = self.lookup()
+            self.validated.set()
+        if self.fallback is not None:
+            return self.fallback(obj, ctx)
+        return super().__call__(obj, ctx)
+
 
 class KafkaSchemaRegistry:
     
@@ -16,21 +158,37 @@ class KafkaSchemaRegistry:
     KAFKA_TOPIC = 'customer_events'
     LOCAL_SCHEMA_PATH = Path(__file__).parent.joinpath('Schema')
 
-    def __init__(self, url=None, subject_name=None):
+    def __init__(self, url=None, subject_name=None, cache_path=None, use_cache=SCHEMA_CACHE):
+        """
+        Args:
+            url (str): Schema registry url, defaults to http://schema-registry:8081.
+            subject_name (str): Subject of the value schema, defaults to customer_events-value.
+            cache_path: Schema id cache file, defaults to SCHEMA_CACHE_PATH.
+            use_cache (bool): Look the local schema up in the cache before asking the registry.
+        """
         self.logger = CustomLogger(__name__)
         self.url = url or self.SCHEMA_REISTRY_URL
-        self.schema_registry_client = self.get_schema_client()
+        self._schema_registry_client = None
         self.subject_name = subject_name or KafkaSchemaRegistry.KAFKA_TOPIC + '-value'
+        self.cache = SchemaIdCache(cache_path or SCHEMA_CACHE_PATH) if use_cache else None
+
 
+    @property
+    def schema_registry_client(self) -> SchemaRegistryClient:
+        # created on first use: building its HTTP client is most of a warm start's time
+        if self._schema_registry_client is None:
+            self._schema_registry_client = self.get_schema_client()
+        return self._schema_registry_client
 
     def get_schema_client(self):
         return SchemaRegistryClient({'url': self.url})
 
     def get_latest_version_from_folder(self):
         schema_folder_location = KafkaSchemaRegistry.LOCAL_SCHEMA_PATH
-        schema_files = list(schema_folder_location.glob('*'))
+        schema_files = list(schema_folder_location.glob('*.avsc'))
         
-        schema_files.sort(key=lambda x: x.stem[1], reverse=True)
+        # v10 sorts after v9, comparing only the first digit would not
+        schema_files.sort(key=lambda x: int(x.stem[1:]), reverse=True)
         latest_schema_file = schema_files[0]
         return latest_schema_file
     
@@ -40,86 +198,139 @@ class KafkaSchemaRegistry:
             schema = file.read()
         return schema
     
-    def get_check_subject_exists(self) -> Tuple[bool, str]:
+    def get_latest_registered(self):
+        """
+        Returns:
+            RegisteredSchema: The latest version of the subject, None if it has none.
+        """
         try:
             latest_schema = self.schema_registry_client.get_latest_version(self.subject_name)
             self.logger.debug(f"Schema already registered with version: {latest_schema.version}")
-            return (True, latest_schema.schema.schema_str)
+            return latest_schema
         except SchemaRegistryError as e:
             self.logger.debug(f'error code: {e.http_status_code}')
             if e.http_status_code == 404:
                 self.logger.info(f"Schema registered with subject name: {self.subject_name} not found.")
-                return (False, None)
-            else: 
+            else:
                 self.logger.error(e.error_message)
-                return (False, None)
+            return None
 
-    def register_schema(self):
+    def register_new_version(self, schema_str: str) -> int:
+        schema_id = self.schema_registry_client.register_schema(
+            subject_name=self.subject_name,
+            schema=Schema(schema_str, schema_type='AVRO')
+        )
+        self.logger.info(f"Schema registered with subject: {self.subject_name}, schema id: {schema_id}")
+        self.logger.info(f"changing schema compatibility to FUll")
+        self.schema_registry_client.set_compatibility(
+            subject_name=self.subject_name,
+            level='FULL'
+        )
+        return schema_id
+
+    def sync_with_registry(self, local_schema: str):
+        """
+        Register the local schema unless it is the subject's latest version, or a
+        new version incompatible with it. One round trip when nothing changed.
 
-        schema_exists, schema_str = self.get_check_subject_exists()
-        if not schema_exists:
-            schema_str = self.get_local_schema()
+        Returns:
+            tuple: The schema to serialize with and its id, None if registering failed.
+        """
+        latest = self.get_latest_registered()
+        if latest is None:
             try:
-                schema_id =  self.schema_registry_client.register_schema(
-                    subject_name=self.subject_name,
-                    schema=Schema(schema_str, schema_type='AVRO')
-                )
-                self.logger.info(f"Schema registered with subject: {self.subject_name}, schema id: {schema_id}")
-                self.logger.info(f"changing schema compatibility to FUll")
-                self.schema_registry_client.set_compatibility(
-                    subject_name=self.subject_name,
-                    level='FULL'
-                )
+                return local_schema, self.register_new_version(local_schema)
             except SchemaRegistryError as e:
                 self.logger.error(f"Failed to register schema: {e.error_message}")
+                return local_schema, None
 
-        current_latest_schema = dict(json.loads(self.get_local_schema()))
-        current_latest_schema_registry_schema = dict(json.loads(
-            self.schema_registry_client
-            .get_latest_version(self.subject_name)
-            .schema.schema_str
-        ))
-
-        compare_result = deepdiff.DeepDiff(
-            current_latest_schema,
-            current_latest_schema_registry_schema,
-            ignore_order=True
-        )
-        
-        if compare_result:
-            self.logger.info(f"Schema has changed, updating schema.")
+        if json.loads(latest.schema.schema_str) == json.loads(local_schema):
+            self.logger.info(f"Current local schema is up to date with the schema registry.")
+            return local_schema, latest.schema_id
+
+        self.logger.info(f"Schema has changed, updating schema.")
+        try:
+            compability_test = self.schema_registry_client.test_compatibility(
+                subject_name=self.subject_name,
+                schema=Schema(schema_str=local_schema, schema_type='AVRO')
+            )
+            if compability_test:
+                self.logger.info(f"Schema is compatible with the existing schema.")
+                # serialize with the new local schema from now on, not the one registered before
+                return local_schema, self.register_new_version(local_schema)
+            self.logger.error(f"Schema is not compatible with the existing schema.")
+        except SchemaRegistryError as e:
+            self.logger.error(f"Failed to register schema: {e.error_message}")
+        return latest.schema.schema_str, latest.schema_id
+
+    def validate_cached_id(self, serializer: CachedIdSerializer, local_schema: str):
+        """
+        Check that the registry still holds the cached id for the local schema. If it
+        does not, e.g. after the registry was recreated under the same url, evict the
+        entry and switch the serializer to the id the registry gives now.
+
+        Runs in the background; the serializer waits for it before its first record.
+        """
+        try:
             try:
-                new_schema = Schema(schema_str=self.get_local_schema(), schema_type='AVRO')
-                compability_test = self.schema_registry_client.test_compatibility(
-                    subject_name=self.subject_name,
-                    schema=new_schema
-                )   
-
-                if compability_test:    
-                    self.logger.info(f"Schema is compatible with the existing schema.")
-                    schema_id =  self.schema_registry_client.register_schema(
-                        subject_name=self.subject_name,
-                        schema=Schema(schema_str, schema_type='AVRO')
-                    )
-                    self.logger.info(f"Schema registered with subject: {self.subject_name}, schema id: {schema_id}")
-                    self.logger.info(f"changing schema compatibility to FUll")
-                    self.schema_registry_client.set_compatibility(
-                        subject_name=self.subject_name,
-                        level='FULL'
-                    )
-                else: 
-                    self.logger.error(f"Schema is not compatible with the existing schema.")
+                registered = self.schema_registry_client.get_schema(serializer.schema_id).schema_str
             except SchemaRegistryError as e:
-                self.logger.error(f"Failed to register schema: {e.error_message}")
-        else:
-            self.logger.info(f"Current local schema is up to date with the schema registry.")
+                if e.http_status_code != 404:
+                    raise
+                registered = None
+            if registered is not None and json.loads(registered) == json.loads(local_schema):
+                self.logger.debug(f"Cached schema id {serializer.schema_id} confirmed by the registry")
+                return
 
-        return AvroSerializer(
-            self.schema_registry_client,
-            schema_str,
-        )
-        
+            self.logger.warning(f"The registry does not hold cached schema id {serializer.schema_id} for subject "
+                                f"{self.subject_name}, evicting it from {self.cache.path} and asking the registry")
+            self.cache.evict(self.url, self.subject_name, local_schema)
+            schema_str, schema_id = self.sync_with_registry(local_schema)
+            if schema_id is None:
+                serializer.fallback = AvroSerializer(self.schema_registry_client, schema_str)
+                return
+            if schema_str == local_schema:
+                self.cache.put(self.url, self.subject_name, local_schema, schema_id)
+            serializer.set_schema(schema_id, schema_str)
+        except Exception as e:
+            # an unreachable registry keeps the cached id, as a start without a registry call would
+            self.logger.error(f"Could not validate cached schema id {serializer.schema_id}: {e}")
+        finally:
+            serializer.validated.set()
+
+    @timed("producer.register_schema")
+    def register_schema(self):
+        """
+        Make sure the local schema is registered and return the value serializer.
+
+        A schema id cached by an earlier start is used without waiting for the registry;
+        it is validated in the background before the first record is serialized.
+        Otherwise the registry is asked and the id cached for the next start.
 
+        Returns:
+            Callable: Serializer writing the Confluent wire format with the registered schema id.
+        """
+        started = time.perf_counter()
+        local_schema = self.get_local_schema()
 
+        if self.cache is not None:
+            schema_id = self.cache.get(self.url, self.subject_name, local_schema)
+            if schema_id is not None:
+                self.logger.info(f"Schema id {schema_id} of subject {self.subject_name} read from {self.cache.path} "
+                                 f"in {(time.perf_counter() - started) * 1000:.1f} ms, without the registry")
+                serializer = CachedIdSerializer(
+                    schema_id, local_schema, lookup=lambda: AvroSerializer(self.schema_registry_client, local_schema)
+                )
+                threading.Thread(target=self.validate_cached_id, args=(serializer, local_schema),
+                                 name="schema-id-validation", daemon=True).start()
+                return serializer
 
-            
\ No newline at end of file
+        schema_str, schema_id = self.sync_with_registry(local_schema)
+        if schema_id is None:
+            # let the serializer register the schema once the registry accepts it
+            return AvroSerializer(self.schema_registry_client, schema_str)
+        if self.cache is not None and schema_str == local_schema:
+            self.cache.put(self.url, self.subject_name, local_schema, schema_id)
+        self.logger.info(f"Schema id {schema_id} of subject {self.subject_name} from the registry "
+                         f"in {(time.perf_counter() - started) * 1000:.1f} ms")
+        return AvroWireSerializer(schema_id, schema_str)
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """
+    Token bucket rate limiter.
+
+    Tokens are added continuously at `rate` per second up to `capacity`;
+    acquire(n) blocks until n tokens are available and takes them.
+    """
+
+    def __init__(self, rate: float, capacity: float = None):
+        """
+        Args:
+            rate (float): Tokens added per second. 0 or less disables limiting.
+            capacity (float): Maximum burst size, defaults to one second worth of tokens.
+        """
+        self.rate = rate
+        self.capacity = capacity or max(rate, 1)
+        self.tokens = self.capacity
+        self.last_refill = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.last_refill) * self.rate)
+        self.last_refill = now
+
+    def acquire(self, n: int = 1, stop_event=None) -> bool:
+        """
+        Wait until n tokens are available and take them.
+
+        Args:
+            n (int): Number of tokens, must not exceed the capacity.
+            stop_event: Optional threading/multiprocessing Event that aborts the wait.
+
+        Returns:
+            bool: True if the tokens were taken, False if stop_event was set first.
+        """
+        if self.rate <= 0:
+            return True
+        if n > self.capacity:
+            raise ValueError(f"Cannot acquire {n} tokens from a bucket with capacity {self.capacity}")
+
+        while True:
+            with self._lock:
+                self._refill()
+                if self.tokens >= n:
+                    self.tokens -= n
+                    return True
+                wait = (n - self.tokens) / self.rate
+
+            if stop_event is None:
+                time.sleep(wait)
+            elif stop_event.wait(wait):
+                return False
@@ -1,41 +1,197 @@
+import argparse
+import multiprocessing
+import queue
+import signal
+import sys
+import time
+from pathlib import Path
+
+from confluent_kafka import KafkaError, KafkaException
+
+# metrics.py and profiling.py are shared with the consumer
+sys.path.insert(0, str(Path(__file__).parent.parent.joinpath('common')))
+
 import CustomerEvents as c
 from custom_logging import CustomLogger
 from kafka_configuration import KafkaConfiguration
 from kafka_producer import KafkaProducer
+from profiling import install_profiler
+from rate_limiter import TokenBucket
 
 
 
 logger = CustomLogger(__name__)
-logger.info("Starting Kafka configuration Test")
-kafka_config = KafkaConfiguration()
-logger.info("Creating topic")
-kafka_config.create_topic()
-logger.info("Kafka configuration Test completed")
 
 
+def create_topic(broker=None):
+    logger.info("Starting Kafka configuration Test")
+    kafka_config = KafkaConfiguration(broker=broker)
+    logger.info("Creating topic")
+    kafka_config.create_topic()
+    logger.info("Kafka configuration Test completed")
+
+
+def is_fatal(error) -> bool:
+    """
+    Return True if error leaves the producer unusable, e.g. a fenced idempotent producer;
+    KafkaProducer chains the librdkafka error as the cause of the one it raises.
+    """
+    cause = error.__cause__ or error
+    return isinstance(cause, KafkaException) and isinstance(cause.args[0], KafkaError) and cause.args[0].fatal()
+
+
+def run_worker(worker_id, rate, batch_size, report_interval, producer_config, stop_event, report_queue, metrics_port=None, schema_registry_url=None):
+    """
+    Generate and produce events until stop_event is set.
+
+    Args:
+        worker_id (int): Index of the worker, used to keep message keys unique across workers.
+        rate (float): Events/sec budget of this worker, 0 for unlimited.
+        batch_size (int): Events generated per call to the batch generator.
+        report_interval (float): Seconds between throughput reports to the parent.
+        producer_config (dict): Extra librdkafka settings for the KafkaProducer.
+        stop_event: multiprocessing Event set by the parent on shutdown.
+        report_queue: multiprocessing Queue receiving throughput reports.
+        metrics_port (int): First metrics port; the worker serves its metrics on metrics_port + worker_id.
+        schema_registry_url (str): Overrides the default schema registry.
+    """
+    # Ctrl-C is handled by the parent, which sets stop_event so workers can drain
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    install_profiler()
+    worker_logger = CustomLogger(f"{__name__}.worker{worker_id}")
+
+    bucket = TokenBucket(rate)
+    if rate > 0:
+        batch_size = max(1, min(batch_size, int(bucket.capacity)))
+
+    producer = KafkaProducer(config=producer_config, pipelined=True,
+                             metrics_port=None if metrics_port is None else metrics_port + worker_id,
+                             schema_registry_url=schema_registry_url)
+    worker_logger.info(f"Worker {worker_id} producing {'unlimited' if rate <= 0 else f'{rate:.0f}'} events/sec")
+
+    # keys stay unique across workers: worker_id in the high bits, a running counter in the low bits
+    i = worker_id << 40
+    produced = 0
+    last_report = time.monotonic()
+    try:
+        while not stop_event.is_set():
+            if not bucket.acquire(batch_size, stop_event):
+                break
+            try:
+                customer_events = c.generate_consumer_event_data_batch(batch_size)
+                i = producer.produce_many(customer_events, first_id=i)
+                produced += batch_size
+            except Exception as e:
+                if is_fatal(e):
+                    raise
+                # one bad batch should not stop the worker; skip its keys, some were used
+                worker_logger.error(f"Error producing batch: {e}")
+                i += batch_size
+
+            now = time.monotonic()
+            if now - last_report >= report_interval:
+                report_queue.put({"worker": worker_id, "produced": produced, "elapsed": now - last_report} | producer.stats())
+                produced = 0
+                last_report = now
+    except Exception as e:
+        worker_logger.error(f"Fatal error, stopping worker {worker_id}: {e}")
+    finally:
+        stats = producer.close()
+        report_queue.put({"worker": worker_id, "produced": produced, "elapsed": time.monotonic() - last_report, "final": True} | stats)
+        worker_logger.info(f"Worker {worker_id} stopped, delivered={stats['delivered']} failed={stats['failed']}")
+
+
+def log_report(produced, reports, elapsed):
+    delivered = sum(report["delivered"] for report in reports.values())
+    failed = sum(report["failed"] for report in reports.values())
+    logger.info(f"{len(reports)} workers: {produced / elapsed:,.0f} events/sec, delivered={delivered} failed={failed}")
+
+
+def positive_int(value: str) -> int:
+    number = int(value)
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
 
-logger.info("Starting Customer Events Test")
+def main():
+    parser = argparse.ArgumentParser(description="Produce customer events to Kafka from a fleet of worker processes.")
+    parser.add_argument("--workers", type=positive_int, default=1, help="number of producer processes")
+    parser.add_argument("--rate", type=float, default=0, help="target events/sec across all workers, 0 for unlimited")
+    parser.add_argument("--batch-size", type=int, default=500, help="events generated per batch")
+    parser.add_argument("--report-interval", type=float, default=5.0, help="seconds between throughput reports")
+    parser.add_argument("--bootstrap-servers", default=None, help="overrides the default kafka:9092 broker")
+    parser.add_argument("--schema-registry-url", default=None, help="overrides the default http://schema-registry:8081 registry")
+    parser.add_argument("--metrics-port", type=int, default=None, help="serve Prometheus metrics, worker N on this port + N")
+    args = parser.parse_args()
 
+    # kill -USR1 <pid> starts the sampling profiler of that process, a second one dumps it
+    install_profiler()
 
-logger.info('producing the event to customer events topic')
-producer = KafkaProducer()
-i = 0
-while True:
-    try: 
-        customer_events = c.generate_consumer_event_data()
-        logger.debug("Creating customer events")
+    create_topic(args.bootstrap_servers)
 
-        logger.debug("Produced customer events")
-        producer.produce(i, customer_events)
-        i = i+1
+    logger.info("Starting Customer Events Test")
+    logger.info('producing the event to customer events topic')
 
+    producer_config = {"bootstrap.servers": args.bootstrap_servers} if args.bootstrap_servers else {}
+    ctx = multiprocessing.get_context("spawn")
+    stop_event = ctx.Event()
+    report_queue = ctx.Queue()
+    workers = [
+        ctx.Process(
+            target=run_worker,
+            name=f"producer-worker-{worker_id}",
+            args=(worker_id, args.rate / args.workers, args.batch_size, args.report_interval,
+                  producer_config, stop_event, report_queue, args.metrics_port, args.schema_registry_url),
+        )
+        for worker_id in range(args.workers)
+    ]
+    for worker in workers:
+        worker.start()
+
+    # latest report per worker holds its cumulative delivered/failed counts
+    reports = {}
+    finals = {}
+    total_produced = 0
+    window_produced = 0
+    last_log = time.monotonic()
+    try:
+        while any(worker.is_alive() for worker in workers):
+            try:
+                report = report_queue.get(timeout=1)
+                reports[report["worker"]] = report
+                total_produced += report["produced"]
+                window_produced += report["produced"]
+                if report.get("final"):
+                    finals[report["worker"]] = report
+            except queue.Empty:
+                pass
+
+            now = time.monotonic()
+            if reports and now - last_log >= args.report_interval:
+                log_report(window_produced, reports, now - last_log)
+                window_produced = 0
+                last_log = now
     except KeyboardInterrupt:
         logger.info("Keyboard interrupt received, stopping the producer")
-        break
-    except Exception as e:
-        logger.error(f"Error producing event: {e}")
-        continue
-    
+        stop_event.set()
+
+    # drain: every worker flushes its producer and sends a final report before exiting
+    while len(finals) < len(workers) and any(worker.is_alive() for worker in workers) or not report_queue.empty():
+        try:
+            report = report_queue.get(timeout=1)
+        except queue.Empty:
+            continue
+        total_produced += report["produced"]
+        if report.get("final"):
+            finals[report["worker"]] = report
+    for worker in workers:
+        worker.join()
 
-logger.debug(f"{i=} produced to kafka topic")
+    delivered = sum(report["delivered"] for report in finals.values())
+    failed = sum(report["failed"] for report in finals.values())
+    logger.debug(f"{total_produced} produced to kafka topic, delivered={delivered} failed={failed}")
+    
 
+if __name__ == "__main__":
+    main()